@@ -0,0 +1,124 @@
+import asyncio
+import os
+import time
+
+from fastapi import HTTPException
+
+from api.metrics import Histogram
+
+# --- Configuración (variables de entorno) ---
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "1") == "1"
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+# Peticiones esperando lote; si se llena, se responde 503. 0 = automático (ver main.py)
+MICROBATCH_MAX_PENDING = int(os.getenv("MICROBATCH_MAX_PENDING", "0"))
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+QUEUE_WAIT_BUCKETS_MS = [0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250]
+
+
+class MicroBatcher:
+    """
+    Junta las peticiones individuales que llegan casi al mismo tiempo
+    (dentro de 'max_wait_ms', hasta 'max_batch') y las evalúa con UNA sola
+    llamada vectorizada al modelo. Cada petición recibe su propio resultado.
+
+    'run_batch(students)' es una corrutina que devuelve (probabilidades, diag_rows,
+    models), en el mismo orden de entrada; 'models' es la versión del modelo con
+    la que se evaluó el lote (sus umbrales deciden los niveles).
+
+    La cola está acotada a 'max_pending' peticiones: si se llena, submit
+    responde 503 en lugar de acumular latencia (como InferencePool).
+    """
+
+    def __init__(self, run_batch, max_batch: int = MICROBATCH_MAX_SIZE, max_wait_ms: float = MICROBATCH_MAX_WAIT_MS,
+                 max_pending: int = MICROBATCH_MAX_PENDING):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max(0, max_pending)  # 0 = sin límite
+        self.rejected = 0
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        self._queue = None
+        self._collector = None
+        self._running = set()
+
+    def start(self):
+        if self._collector is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def submit(self, student):
+        """Encola a UN estudiante y espera su (probabilidad, diag_row, models)."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((student, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Servidor saturado: intente nuevamente en unos segundos.")
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                # Primero lo que ya está en la cola, sin esperar
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            now = time.perf_counter()
+            self.batch_sizes.observe(len(batch))
+            for _, _, enqueued_at in batch:
+                self.queue_wait_ms.observe((now - enqueued_at) * 1000)
+
+            # El lote corre en paralelo mientras seguimos juntando el siguiente
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        futures = [future for _, future, _ in batch]
+        try:
+            risk_probs, diag_rows, models = await self.run_batch([student for student, _, _ in batch])
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, future in enumerate(futures):
+            if not future.done():
+                future.set_result((risk_probs[i], diag_rows[i], models))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
@@ -0,0 +1,347 @@
+"""
+Scoring masivo de un archivo CSV o Parquet (ej. la corrida nocturna de toda
+la matrícula), sin pasar por la API HTTP.
+
+Lee el archivo por bloques de tamaño fijo, los evalúa en un pool de procesos
+y va escribiendo los resultados (nombre, probabilidad, nivel y diagnóstico)
+a medida que terminan, así que la memoria no depende del tamaño del archivo.
+
+Uso:
+    python -m api.bulk_score matricula.csv resultados.parquet [--chunk-size 50000 | --memory-budget-mb 2048]
+                             [--workers 4] [--notify] [--incremental]
+
+Los campos del modelo se guardan con tipos compactos (int8/int16/float32
+donde no se pierde precisión). Con --memory-budget-mb el tamaño de bloque se
+elige solo, a partir del presupuesto, la cantidad de workers y lo que ocupa
+una fila leída del archivo.
+
+Con --incremental solo se evalúa a los estudiantes nuevos o cuyos datos
+cambiaron desde la corrida anterior (almacén en SCORE_STORE_PATH), y --notify
+solo avisa a quienes cambiaron de nivel.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from api.features import ENGINEERED_FEATURES, RAW_FIELDS, compact_frame
+from api.loader import MODEL_PATH, THRESHOLD_PATH, load_models, set_lgbm_threads
+from api.rules import HIGH_RISK, LOW_RISK, MEDIUM_RISK, classify
+from api.schemas import valid_email
+from api.score_store import SCORE_STORE_PATH, STUDENT_ID_FIELD, ScoreStore, diff_against_store, student_id
+
+# --- Configuración (variables de entorno) ---
+# Memoria total (proceso principal + workers) para el scoring masivo, en MB. 0 = bloques de tamaño fijo
+BULK_MEMORY_BUDGET_MB = int(os.getenv("BULK_MEMORY_BUDGET_MB", "0"))
+# Memoria fija estimada de cada worker (intérprete + librerías + modelo), en MB
+BULK_WORKER_BASE_MB = int(os.getenv("BULK_WORKER_BASE_MB", "200"))
+DEFAULT_CHUNK_SIZE = 50000
+# Margen sobre la estimación por fila (fragmentación, temporales de pandas/LightGBM)
+ROW_BYTES_SAFETY = 2.0
+
+ID_COLUMNS = ["Student_Name", "Student_Email", "Teacher_Email"]
+OUTPUT_COLUMNS = ["Student_Name", "risk_probability", "prediction_label", "diagnostic"]
+
+# --- Estado de cada proceso worker ---
+_WORKER_MODELS = {}
+_WORKER_STORE = {}
+
+
+def _init_worker(model_path: str, threshold_path: str, lgbm_threads: int, score_store_path: str = None):
+    models = load_models(model_path, threshold_path)
+    set_lgbm_threads(models["pipeline"], lgbm_threads)
+    _WORKER_MODELS.update(models)
+    if score_store_path:
+        _WORKER_STORE["store"] = ScoreStore(score_store_path)
+
+
+def score_frame(models: dict, chunk: pd.DataFrame, keep_contacts: bool = False, store: ScoreStore = None) -> pd.DataFrame:
+    """
+    Evalúa un bloque del archivo (columnas con los nombres de la API) y
+    devuelve nombre, probabilidad, nivel de riesgo y diagnóstico.
+
+    Con 'store', solo pasan por el modelo las filas nuevas o que cambiaron; las
+    columnas 'rescored' y 'tier_changed' indican qué filas se evaluaron y
+    cuáles cambiaron de nivel respecto de la corrida anterior.
+    """
+    compiler = models["compiler"]
+    raw = compiler.raw_from_frame(chunk)
+    n = len(chunk)
+
+    if store is None:
+        features = compiler.compile(raw)
+        del raw  # la matriz cruda ya no hace falta: se libera antes de predecir
+        risk_probs = models["pipeline"].predict_proba(compiler.to_model_input(features))[:, 1]
+        diag_columns = compiler.diagnostic_columns(features)
+        changed, previous = slice(None), [None] * n
+    else:
+        if STUDENT_ID_FIELD not in chunk:
+            raise ValueError(f"El modo incremental necesita la columna '{STUDENT_ID_FIELD}'.")
+        ids = [student_id(value) for value in chunk[STUDENT_ID_FIELD]]
+        fingerprints, previous, changed = diff_against_store(store, ids, raw, models["version"])
+        changed = np.asarray(changed, dtype=np.intp)
+
+        # Las filas sin cambios reutilizan su probabilidad y sus features de diagnóstico
+        risk_probs = np.array([p["risk_probability"] if p else np.nan for p in previous], dtype=np.float64)
+        features = compiler.compile(raw[changed])
+        if len(changed):
+            risk_probs[changed] = models["pipeline"].predict_proba(compiler.to_model_input(features))[:, 1]
+        diag_columns = {}
+        for name, values in compiler.diagnostic_columns(features).items():
+            column = np.array([p["diag"].get(name, np.nan) if p else np.nan for p in previous], dtype=np.float64)
+            column[changed] = values
+            diag_columns[name] = column
+
+    labels, _, diagnostics, resources = classify(risk_probs, diag_columns, models["thresholds"])
+    rescored = np.zeros(n, dtype=bool)
+    rescored[changed] = True
+    tier_changed = np.array([p is None or p["tier"] != label for p, label in zip(previous, labels)], dtype=bool)
+    if store is not None:
+        diag_rows = [{name: float(column[i]) for name, column in diag_columns.items()} for i in range(n)]
+        store.upsert(
+            (ids[i], fingerprints[i], models["version"], risk_probs[i], labels[i], diag_rows[i])
+            for i in range(n)
+        )
+
+    result = pd.DataFrame({
+        "Student_Name": chunk["Student_Name"].to_numpy() if "Student_Name" in chunk else "N/A",
+        "risk_probability": np.round(risk_probs, 4),
+        "prediction_label": labels,
+        "diagnostic": diagnostics,
+        "rescored": rescored,
+        "tier_changed": tier_changed,
+    })
+    if keep_contacts:
+        for column in ("Student_Email", "Teacher_Email"):
+            result[column] = chunk[column].to_numpy() if column in chunk else None
+        result["support_resource"] = resources
+    return result
+
+
+def _score_in_worker(chunk: pd.DataFrame, keep_contacts: bool) -> pd.DataFrame:
+    return score_frame(_WORKER_MODELS, chunk, keep_contacts, _WORKER_STORE.get("store"))
+
+
+def read_chunks(path: str, chunk_size: int):
+    """
+    Lee el archivo por bloques, solo con las columnas que usa el scoring y con
+    los campos del modelo en tipos compactos (ver features.compact_frame).
+    """
+    wanted = set(ID_COLUMNS + RAW_FIELDS + [STUDENT_ID_FIELD])
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        columns = [c for c in parquet.schema_arrow.names if c in wanted]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield compact_frame(batch.to_pandas())
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=lambda c: c in wanted):
+            yield compact_frame(chunk)
+
+
+def rss_mb() -> float:
+    """Memoria residente actual de este proceso, en MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource  # sin /proc: se usa el pico (en KB en Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def auto_chunk_size(input_path: str, memory_budget_mb: float, workers: int, max_in_flight: int,
+                    sample_rows: int = 2000) -> int:
+    """
+    Tamaño de bloque que mantiene el pico de memoria dentro del presupuesto.
+
+    Se mide lo que ocupa una fila leída (con tipos compactos) en una muestra
+    del archivo. En el proceso principal hay hasta 'max_in_flight' bloques en
+    vuelo (el DataFrame + su copia serializada para el worker); cada worker
+    tiene su copia del bloque, la matriz cruda, la del modelo y el resultado.
+    """
+    sample = next(read_chunks(input_path, sample_rows), None)
+    if sample is None or sample.empty:
+        return DEFAULT_CHUNK_SIZE
+    input_row = sample.memory_usage(deep=True).sum() / len(sample)
+    model_row = 8 * (len(RAW_FIELDS) + 2 * (len(RAW_FIELDS) + len(ENGINEERED_FEATURES)))
+    per_row = ROW_BYTES_SAFETY * (max_in_flight * 2 * input_row + workers * (2 * input_row + model_row))
+
+    available = (memory_budget_mb - rss_mb() - workers * BULK_WORKER_BASE_MB) * 2**20
+    chunk_size = int(available // per_row)
+    if chunk_size < 1000:
+        raise ValueError(
+            f"El presupuesto de {memory_budget_mb} MB no alcanza para {workers} workers "
+            f"(~{BULK_WORKER_BASE_MB} MB fijos cada uno); usa menos workers o más memoria."
+        )
+    return chunk_size
+
+
+class ResultWriter:
+    """Escribe los resultados de forma incremental en CSV o Parquet."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parquet_writer = None
+        self._wrote_header = False
+
+    def write(self, frame: pd.DataFrame):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="a" if self._wrote_header else "w", header=not self._wrote_header, index=False)
+            self._wrote_header = True
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def send_notifications(results: pd.DataFrame) -> int:
+    """
+    Encola los emails de los estudiantes en riesgo Alto/Medio (opción --notify)
+    que cambiaron de nivel (en una corrida normal, todos). Las filas sin email
+    válido del estudiante o del docente se omiten y se informan; devuelve
+    cuántas se omitieron.
+    """
+    from api.notifications import (
+        send_student_medium_support, send_student_support,
+        send_teacher_alert, send_teacher_medium_alert,
+    )
+
+    skipped = 0
+    at_risk = results[(results["prediction_label"] != LOW_RISK) & results["tier_changed"]]
+    for row in at_risk.itertuples(index=False):
+        invalid = [field for field in ("Student_Email", "Teacher_Email") if not valid_email(getattr(row, field))]
+        if invalid:
+            skipped += 1
+            print(f"Notificación omitida para {row.Student_Name} ({row.prediction_label}): "
+                  f"{', '.join(invalid)} vacío o inválido.")
+            continue
+        if row.prediction_label == HIGH_RISK:
+            send_teacher_alert(row.Student_Name, row.Teacher_Email, row.diagnostic, row.Student_Email)
+            send_student_support(row.Student_Name, row.Student_Email, row.support_resource)
+        else:
+            send_teacher_medium_alert(row.Student_Name, row.Teacher_Email, row.risk_probability, row.Student_Email)
+            send_student_medium_support(row.Student_Name, row.Student_Email)
+    return skipped
+
+
+def run(input_path: str, output_path: str, chunk_size: int = None, workers: int = None,
+        notify: bool = False, model_path: str = MODEL_PATH, threshold_path: str = THRESHOLD_PATH,
+        score_store_path: str = None, memory_budget_mb: float = BULK_MEMORY_BUDGET_MB) -> dict:
+    """
+    Ejecuta el scoring masivo y devuelve un resumen (filas, evaluadas,
+    reutilizadas, segundos, filas/s, tamaño de bloque, conteo por nivel y, con
+    'notify', emails enviados/fallidos/descartados).
+    Con 'score_store_path' el scoring es incremental. Sin 'chunk_size', el
+    bloque se calcula a partir de 'memory_budget_mb' (o es de 50000 filas).
+    """
+    from api.inference import lgbm_threads_per_worker
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers  # bloques en memoria a la vez: acota el uso de RAM
+    if chunk_size is None:
+        chunk_size = (auto_chunk_size(input_path, memory_budget_mb, workers, max_in_flight)
+                      if memory_budget_mb > 0 else DEFAULT_CHUNK_SIZE)
+    writer = ResultWriter(output_path)
+    tier_counts = {HIGH_RISK: 0, MEDIUM_RISK: 0, LOW_RISK: 0}
+    total_rows = 0
+    rescored_rows = 0
+    skipped_notifications = 0
+    if notify:
+        from api.notifications import dispatcher
+        # Un lote puede generar más emails de los que caben en la cola: se espera lugar en vez de descartarlos
+        dispatcher.block_when_full = True
+        emails_before = (dispatcher.sent, dispatcher.failed, dispatcher.dropped)
+    start = time.perf_counter()
+
+    def consume(future):
+        nonlocal total_rows, rescored_rows, skipped_notifications
+        results = future.result()
+        if notify:
+            skipped_notifications += send_notifications(results)
+        writer.write(results[OUTPUT_COLUMNS])
+        total_rows += len(results)
+        rescored_rows += int(results["rescored"].sum())
+        for label, count in results["prediction_label"].value_counts().items():
+            tier_counts[label] += int(count)
+
+    with ProcessPoolExecutor(
+        workers,
+        initializer=_init_worker,
+        initargs=(model_path, threshold_path, lgbm_threads_per_worker(workers), score_store_path)
+    ) as executor:
+        pending = []  # en orden de lectura, para escribir en el mismo orden
+        for chunk in read_chunks(input_path, chunk_size):
+            pending.append(executor.submit(_score_in_worker, chunk, notify))
+            if len(pending) >= max_in_flight:
+                consume(pending.pop(0))
+        for future in pending:
+            consume(future)
+    writer.close()
+
+    emails = None
+    if notify:
+        from api.notifications import flush_notifications
+        flush_notifications(wait=True)
+        emails = {
+            result: after - before
+            for result, after, before in zip(("sent", "failed", "dropped"),
+                                             (dispatcher.sent, dispatcher.failed, dispatcher.dropped), emails_before)
+        }
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": total_rows,
+        "scored": rescored_rows,
+        "reused": total_rows - rescored_rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(total_rows / elapsed, 1) if elapsed else 0.0,
+        "chunk_size": chunk_size,
+        "tiers": tier_counts,
+        "notifications_skipped": skipped_notifications,
+        "emails": emails,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Archivo CSV o .parquet con las columnas de demo_data.csv")
+    parser.add_argument("output", help="Archivo de salida (.csv o .parquet)")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help=f"Filas por bloque (por defecto {DEFAULT_CHUNK_SIZE}, o según --memory-budget-mb)")
+    parser.add_argument("--memory-budget-mb", type=float, default=BULK_MEMORY_BUDGET_MB,
+                        help="Memoria total para el scoring; elige el tamaño de bloque automáticamente")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--notify", action="store_true", help="Enviar los emails a docentes y estudiantes en riesgo")
+    parser.add_argument("--model", default=MODEL_PATH, help="Modelo .joblib o directorio del artefacto compacto")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Solo evaluar filas nuevas o modificadas (almacén: {SCORE_STORE_PATH})")
+    args = parser.parse_args()
+
+    summary = run(args.input, args.output, args.chunk_size, args.workers, args.notify, args.model,
+                  score_store_path=SCORE_STORE_PATH if args.incremental else None,
+                  memory_budget_mb=args.memory_budget_mb)
+    print(f"{summary['rows']} estudiantes procesados en {summary['seconds']} s "
+          f"({summary['rows_per_second']} filas/s; bloques de {summary['chunk_size']}; "
+          f"{summary['scored']} evaluados, {summary['reused']} reutilizados). "
+          f"Niveles: {summary['tiers']}")
+    if summary["emails"] is not None:
+        emails = summary["emails"]
+        print(f"Emails: {emails['sent']} enviados, {emails['failed']} fallidos, {emails['dropped']} descartados.")
+    if summary["notifications_skipped"]:
+        print(f"{summary['notifications_skipped']} estudiantes sin notificar por emails vacíos o inválidos.")
+
+
+if __name__ == "__main__":
+    main()
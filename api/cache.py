@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Configuración (variables de entorno) ---
+# memory: LRU en memoria del proceso | sqlite: archivo local compartido entre workers de gunicorn | off
+PREDICTION_CACHE_BACKEND = os.getenv("PREDICTION_CACHE_BACKEND", "memory")
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))  # segundos
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "/tmp/agente_prediction_cache.sqlite")
+# Cada cuántos segundos se revisa si cambiaron los archivos del modelo/umbral
+PREDICTION_CACHE_CHECK_INTERVAL = 5.0
+# SQLite: un acierto solo actualiza last_access (el orden LRU) si pasó al menos este tiempo
+PREDICTION_CACHE_ACCESS_RESOLUTION = 60.0
+
+
+def file_fingerprint(*paths: str) -> str:
+    """
+    Versión corta de un conjunto de archivos (tamaño + fecha de modificación +
+    contenido de los archivos pequeños como el umbral). Cambia si cambia cualquiera.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            digest.update(f"{path}:missing".encode())
+            continue
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        if stat.st_size < 4096:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class MemoryBackend:
+    """LRU en memoria con expiración por entrada."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expira, valor)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        with self._lock:
+            expires_at = time.time() + self.ttl
+            for key, value in items:
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    LRU en un archivo SQLite local. Varios workers de gunicorn en la misma
+    máquina pueden apuntar al mismo archivo y compartir las predicciones.
+    """
+
+    def __init__(self, path: str, max_size: int, ttl: float):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()  # varios hilos de inferencia escriben a la vez
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS prediction_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_access ON prediction_cache(last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (sqlite3 no permite compartirlas entre hilos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at, last_access FROM prediction_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM prediction_cache WHERE key = ?", (key,))
+            return None
+        # Escribir en cada acierto serializa a los lectores: el orden LRU se actualiza con poca resolución
+        if now - row[2] >= PREDICTION_CACHE_ACCESS_RESOLUTION:
+            conn.execute("UPDATE prediction_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Guarda varias entradas en UNA transacción (ej. los faltantes de un lote)."""
+        now = time.time()
+        rows = [(key, json.dumps(value), now + self.ttl, now) for key, value in items]
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO prediction_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # La limpieza (vencidos + LRU) se hace cada cierto número de escrituras, no en cada una
+        with self._writes_lock:
+            before, self._writes = self._writes, self._writes + len(rows)
+            purge = before // 1000 != self._writes // 1000
+        if purge:
+            conn.execute("DELETE FROM prediction_cache WHERE expires_at < ?", (now,))
+            conn.execute(
+                "DELETE FROM prediction_cache WHERE key IN ("
+                "SELECT key FROM prediction_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+
+    def clear(self):
+        self._conn().execute("DELETE FROM prediction_cache")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM prediction_cache").fetchone()[0]
+
+
+class PredictionCache:
+    """
+    Caché de predicciones delante del modelo.
+
+    La llave es un hash del vector de datos del estudiante que usa el modelo
+    (sin nombre ni emails) + la versión del modelo/umbral. Si cambian los
+    archivos vigilados (el .joblib o el umbral), la caché se vacía sola.
+    """
+
+    def __init__(self, backend, watched_paths=()):
+        self.backend = backend
+        self.watched_paths = tuple(watched_paths)
+        self._files_version = file_fingerprint(*self.watched_paths) if self.watched_paths else ""
+        self._last_check = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # get corre en varios hilos de inferencia a la vez
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(raw_row: np.ndarray, version: str) -> str:
+        """Hash estable de la fila cruda (float64, None -> NaN) + versión del modelo."""
+        digest = hashlib.sha256(np.ascontiguousarray(raw_row, dtype=np.float64).tobytes())
+        digest.update(version.encode())
+        return digest.hexdigest()
+
+    def watch(self, *paths: str):
+        """Cambia los archivos vigilados (ej. al cargar un modelo)."""
+        with self._lock:
+            self.watched_paths = paths
+            self._files_version = file_fingerprint(*paths)
+
+    def _check_files(self):
+        now = time.monotonic()
+        if not self.watched_paths or now - self._last_check < PREDICTION_CACHE_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._last_check = now
+            version = file_fingerprint(*self.watched_paths)
+            if version != self._files_version:
+                print("Cambió el modelo o el umbral en disco: se vacía la caché de predicciones.")
+                self._files_version = version
+                self.backend.clear()
+                self.invalidations += 1
+
+    def get(self, key: str, usable=None):
+        """
+        Entrada guardada o None. 'usable(entry)' (opcional) decide si sirve para
+        esta petición (ej. si trae explicación); si no, se cuenta como faltante.
+        Un error del backend (ej. SQLite bloqueado) también cuenta como faltante.
+        """
+        self._check_files()
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._backend_error("leer", e)
+            value = None
+        if value is not None and usable is not None and not usable(value):
+            value = None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Guarda las entradas [(llave, valor), ...]; si el backend falla, se omiten (la caché es opcional)."""
+        try:
+            self.backend.set_many(items)
+        except Exception as e:
+            self._backend_error("guardar", e)
+
+    def _backend_error(self, action: str, error: Exception):
+        with self._stats_lock:
+            self.errors += 1
+        print(f"Caché de predicciones: no se pudo {action} ({type(error).__name__}: {error})")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            hits, misses, errors = self.hits, self.misses, self.errors
+        total = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "errors": errors,
+            "invalidations": self.invalidations,
+        }
+
+
+def create_prediction_cache(watched_paths=()):
+    """Crea la caché según PREDICTION_CACHE_BACKEND (o None si está desactivada)."""
+    if PREDICTION_CACHE_BACKEND == "off":
+        return None
+    if PREDICTION_CACHE_BACKEND == "sqlite":
+        backend = SQLiteBackend(PREDICTION_CACHE_PATH, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+    elif PREDICTION_CACHE_BACKEND == "memory":
+        backend = MemoryBackend(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+    else:
+        raise ValueError(f"PREDICTION_CACHE_BACKEND desconocido: {PREDICTION_CACHE_BACKEND}")
+    return PredictionCache(backend, watched_paths)
@@ -0,0 +1,83 @@
+"""
+Ingesta columnar para el endpoint por lotes: Arrow IPC (stream) o Parquet con
+las columnas de demo_data.csv.
+
+Las columnas numéricas pasan de la tabla de Arrow a la matriz cruda del modelo
+sin convertir a filas ni a objetos de Python (FeatureCompiler.raw_from_arrow);
+solo los nombres y emails se leen como listas. Los resultados pueden volver
+como un stream de Arrow IPC con una columna por campo de la respuesta.
+pyarrow es opcional: sin él, el endpoint responde 415.
+"""
+from typing import List
+
+from api.fastpath import CONTACT_FIELDS, FastPathError, StudentContact
+from api.schemas import valid_email
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo lo necesita la ingesta columnar
+    pa = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET_TYPES = ("application/vnd.apache.parquet", "application/x-parquet")
+RESULT_FIELDS = ("student_name", "risk_probability", "prediction_label", "action_taken", "diagnostic")
+
+
+class ColumnarUnsupported(Exception):
+    """pyarrow no está instalado o el Content-Type no es Arrow/Parquet (se responde 415)."""
+
+
+def media_type(header: str) -> str:
+    return (header or "").split(";")[0].strip().lower()
+
+
+def read_table(body: bytes, content_type: str):
+    """Cuerpo Arrow IPC (stream) o Parquet -> pyarrow.Table (sin copiar los buffers de Arrow)."""
+    if pa is None:
+        raise ColumnarUnsupported("pyarrow no está instalado en el servidor.")
+    kind = media_type(content_type)
+    try:
+        if kind == ARROW_STREAM:
+            return pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        if kind in PARQUET_TYPES:
+            return pq.read_table(pa.BufferReader(body))
+    except (pa.ArrowInvalid, OSError) as e:
+        raise FastPathError(f"Cuerpo columnar inválido: {e}")
+    raise ColumnarUnsupported(f"Content-Type no soportado: se esperaba {ARROW_STREAM} o {PARQUET_TYPES[0]}.")
+
+
+def contacts_from_table(table) -> List[StudentContact]:
+    """
+    Nombre y emails de cada fila. El endpoint es público: los emails se validan
+    igual que EmailStr en StudentData, y si alguna fila es inválida se rechaza
+    el lote indicando cuáles (como el 422 de /analyze_students).
+    """
+    missing = [field for field in CONTACT_FIELDS if field not in table.column_names]
+    if missing:
+        raise FastPathError(f"Faltan las columnas: {', '.join(missing)}.")
+    columns = [table.column(field).to_pylist() for field in CONTACT_FIELDS]
+    contacts, invalid = [], []
+    for i, (name, student_email, teacher_email) in enumerate(zip(*columns)):
+        if not (isinstance(name, str) and name) or not valid_email(student_email) or not valid_email(teacher_email):
+            invalid.append(i)
+            continue
+        contacts.append(StudentContact(name, student_email, teacher_email))
+    if invalid:
+        shown = ", ".join(map(str, invalid[:20])) + (" ..." if len(invalid) > 20 else "")
+        raise FastPathError(f"Filas sin Student_Name, Student_Email o Teacher_Email válidos: {shown}.")
+    return contacts
+
+
+def wants_arrow(accept: str) -> bool:
+    return ARROW_STREAM in (accept or "").lower()
+
+
+def encode_results(columns: dict) -> bytes:
+    """Columnas de la respuesta (RESULT_FIELDS -> listas/arrays) -> stream de Arrow IPC."""
+    table = pa.table({field: columns[field] for field in RESULT_FIELDS})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
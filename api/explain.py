@@ -0,0 +1,73 @@
+"""
+Explicaciones por estudiante: contribuciones TreeSHAP de cada feature a la
+predicción, calculadas para todo el lote con una llamada por modelo LightGBM
+(predict(..., pred_contrib=True), el mismo algoritmo de shap.TreeExplainer
+sin importar shap ni scikit-learn en el camino de servicio).
+
+Las contribuciones están en la escala de log-odds de cada LightGBM antes de la
+calibración (que es monótona), promediadas entre los clasificadores calibrados
+y expresadas por columna de entrada del modelo.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+from api.features import COLUMN_MAPPING
+from api.loader import iter_estimators
+
+# --- Configuración (variables de entorno) ---
+# Cuántas features se devuelven por estudiante si la petición no lo indica
+EXPLAIN_TOP_K = int(os.getenv("EXPLAIN_TOP_K", "5"))
+# Máximo de features por estudiante (es lo que se guarda en la caché)
+EXPLAIN_MAX_K = int(os.getenv("EXPLAIN_MAX_K", "10"))
+# Máximo de estudiantes con explicación por petición (TreeSHAP cuesta varias veces una predicción)
+EXPLAIN_MAX_ROWS = int(os.getenv("EXPLAIN_MAX_ROWS", "2000"))
+
+_API_NAMES = {model_name: api_name for api_name, model_name in COLUMN_MAPPING.items()}
+
+
+def explainer_for(models: dict):
+    """
+    Modelo con contributions(X). El artefacto compacto lo tiene; el pipeline
+    .joblib se exporta una vez (en memoria de este proceso) al mismo formato.
+    """
+    model = models["pipeline"]
+    if hasattr(model, "contributions"):
+        return model
+    explainer = models.get("explainer")
+    if explainer is None:
+        from api.compact_model import CompactModel
+        from api.export_model import export_pipeline
+
+        with tempfile.TemporaryDirectory() as tmp:
+            export_pipeline(model, tmp)
+            explainer = CompactModel.load(tmp)
+        # Los mismos hilos que el LightGBM del pipeline (set_lgbm_threads)
+        n_jobs = next((est.get_params().get("n_jobs") for est in iter_estimators(model)
+                       if type(est).__name__ == "LGBMClassifier"), None)
+        explainer.set_num_threads(n_jobs if n_jobs and n_jobs > 0 else 0)
+        models["explainer"] = explainer
+    return explainer
+
+
+def top_contributions(models: dict, features: np.ndarray, k: int = EXPLAIN_MAX_K) -> list:
+    """
+    Matriz del modelo (n, columnas) -> por estudiante, las 'k' features con
+    mayor contribución absoluta: [{"feature", "value", "contribution"}, ...].
+    """
+    compiler = models["compiler"]
+    contributions = explainer_for(models).contributions(features)
+    k = min(k, contributions.shape[1])
+    order = np.argsort(-np.abs(contributions), axis=1, kind="stable")[:, :k]
+    rows = np.arange(len(features))[:, None]
+    top_values = features[rows, order].tolist()
+    top_contribs = np.round(contributions[rows, order], 4).tolist()
+    names = [_API_NAMES.get(name, name) for name in compiler.feature_names]
+    return [
+        [
+            {"feature": names[j], "value": value, "contribution": contribution}
+            for j, value, contribution in zip(columns, values, contribs)
+        ]
+        for columns, values, contribs in zip(order.tolist(), top_values, top_contribs)
+    ]
@@ -0,0 +1,175 @@
+"""
+Exporta el pipeline calibrado (.joblib) a un artefacto compacto de servicio:
+
+    models/serving/
+        manifest.json      # columnas, preprocesamiento y calibración
+        member_0.txt       # modelo LightGBM (formato texto nativo)
+        member_1.txt ...   # uno por clasificador calibrado (folds de CalibratedClassifierCV)
+
+api.compact_model.CompactModel lo sirve sin importar scikit-learn,
+imbalanced-learn ni shap y sin deserializar el pipeline completo.
+
+Uso:
+    python -m api.export_model [--model models/dropout_lgbm_calibrated.joblib] [--out models/serving]
+"""
+import argparse
+import json
+import os
+
+import joblib
+import numpy as np
+
+from api.cache import file_fingerprint
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _is_passthrough(step) -> bool:
+    if step is None or step == "passthrough":
+        return True
+    # Samplers de imbalanced-learn (SMOTE, etc.): solo actúan en fit, no al predecir
+    if hasattr(step, "fit_resample"):
+        return True
+    # FunctionTransformer sin función = identidad
+    return type(step).__name__ == "FunctionTransformer" and getattr(step, "func", None) is None
+
+
+def _resolve_columns(columns, feature_names) -> list:
+    """Columnas de un ColumnTransformer (nombres, índices, máscara o slice) -> índices."""
+    names = list(feature_names)
+    if isinstance(columns, slice):
+        return list(range(len(names)))[columns]
+    if callable(columns):
+        raise ValueError("ColumnTransformer con selector de columnas callable: no soportado para exportar.")
+    columns = list(columns) if not isinstance(columns, (str, int)) else [columns]
+    if columns and isinstance(columns[0], (bool, np.bool_)):
+        return [i for i, keep in enumerate(columns) if keep]
+    return [names.index(c) if isinstance(c, str) else int(c) for c in columns]
+
+
+def export_steps(steps, feature_names) -> list:
+    """Pasos de preprocesamiento de sklearn -> operaciones NumPy serializables."""
+    ops = []
+    for step in steps:
+        if _is_passthrough(step):
+            continue
+        kind = type(step).__name__
+        if kind == "Pipeline" or hasattr(step, "steps"):
+            ops.extend(export_steps([s for _, s in step.steps], feature_names))
+        elif kind == "SimpleImputer":
+            statistics = np.asarray(step.statistics_, dtype=np.float64)
+            if np.isnan(statistics).any():
+                raise ValueError("SimpleImputer con columnas vacías (estadístico NaN): no soportado para exportar.")
+            ops.append({"op": "impute", "statistics": statistics.tolist()})
+        elif kind == "StandardScaler":
+            # Con with_mean=False sklearn igual calcula mean_, pero transform no lo resta
+            # (lo mismo con with_std y scale_): se exporta solo lo que transform aplica
+            ops.append({
+                "op": "scale",
+                "mean": np.asarray(step.mean_).tolist() if step.with_mean and step.mean_ is not None else None,
+                "scale": np.asarray(step.scale_).tolist() if step.with_std and step.scale_ is not None else None,
+            })
+        elif kind == "ColumnTransformer":
+            ct_names = getattr(step, "feature_names_in_", feature_names)
+            parts = []
+            for _, transformer, columns in step.transformers_:
+                if transformer == "drop":
+                    continue
+                indices = _resolve_columns(columns, ct_names)
+                if not indices:
+                    continue
+                sub_steps = [] if _is_passthrough(transformer) else [transformer]
+                parts.append({"columns": indices, "steps": export_steps(sub_steps, [ct_names[i] for i in indices])})
+            ops.append({"op": "columns", "parts": parts})
+        else:
+            raise ValueError(f"Paso de preprocesamiento no soportado para exportar: {kind}")
+    return ops
+
+
+def _split_estimator(estimator, feature_names):
+    """(Pipeline de preprocesamiento + LightGBM) -> (operaciones, LGBMClassifier)."""
+    if hasattr(estimator, "steps"):
+        steps = [s for _, s in estimator.steps]
+        return export_steps(steps[:-1], feature_names), steps[-1]
+    return [], estimator
+
+
+def _export_calibrator(calibrator) -> dict:
+    kind = type(calibrator).__name__
+    if kind == "_SigmoidCalibration":
+        return {"method": "sigmoid", "a": float(calibrator.a_), "b": float(calibrator.b_)}
+    if kind == "IsotonicRegression":
+        return {
+            "method": "isotonic",
+            "x": np.asarray(calibrator.X_thresholds_, dtype=np.float64).tolist(),
+            "y": np.asarray(calibrator.y_thresholds_, dtype=np.float64).tolist(),
+        }
+    raise ValueError(f"Calibrador no soportado para exportar: {kind}")
+
+
+def _export_member(estimator, calibrator, feature_names, out_dir: str, index: int) -> dict:
+    preprocess, lgbm = _split_estimator(estimator, feature_names)
+    if not hasattr(lgbm, "booster_"):
+        raise ValueError(f"El estimador final no es LightGBM: {type(lgbm).__name__}")
+    if len(getattr(lgbm, "classes_", [0, 1])) != 2:
+        raise ValueError("Solo se soportan modelos binarios.")
+    booster_file = f"member_{index}.txt"
+    lgbm.booster_.save_model(os.path.join(out_dir, booster_file))
+    return {
+        "booster": booster_file,
+        "preprocess": preprocess,
+        "calibration": _export_calibrator(calibrator) if calibrator is not None else {"method": "none"},
+    }
+
+
+def export_pipeline(pipeline, out_dir: str, source_path: str = "") -> dict:
+    """
+    Exporta el pipeline a 'out_dir' y devuelve el manifest.
+    Soporta Pipeline(pre..., CalibratedClassifierCV(LGBM)),
+    CalibratedClassifierCV(Pipeline(pre..., LGBM)) y Pipeline(pre..., LGBM).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    feature_names = [str(c) for c in pipeline.feature_names_in_]
+
+    preprocess, final = [], pipeline
+    if hasattr(pipeline, "steps"):
+        steps = [s for _, s in pipeline.steps]
+        preprocess, final = export_steps(steps[:-1], feature_names), steps[-1]
+
+    members = []
+    if hasattr(final, "calibrated_classifiers_"):
+        for i, calibrated in enumerate(final.calibrated_classifiers_):
+            if len(calibrated.calibrators) != 1:
+                raise ValueError("Solo se soportan modelos binarios.")
+            members.append(_export_member(calibrated.estimator, calibrated.calibrators[0], feature_names, out_dir, i))
+    else:
+        members.append(_export_member(final, None, feature_names, out_dir, 0))
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "feature_names": feature_names,
+        "preprocess": preprocess,
+        "members": members,
+        "source": {"path": source_path, "fingerprint": file_fingerprint(source_path) if source_path else ""},
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def main():
+    from api.loader import COMPACT_MODEL_DIR, JOBLIB_MODEL_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=JOBLIB_MODEL_PATH)
+    parser.add_argument("--out", default=COMPACT_MODEL_DIR)
+    args = parser.parse_args()
+
+    manifest = export_pipeline(joblib.load(args.model), args.out, args.model)
+    print(f"Artefacto exportado en '{args.out}': {len(manifest['members'])} modelo(s) LightGBM, "
+          f"{len(manifest['feature_names'])} columnas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Camino de ingesta rápido para clientes internos de confianza.
+
+En lugar de validar cada estudiante con Pydantic (40 campos + EmailStr),
+hacer model_dump() y armar la matriz desde los objetos, el cuerpo JSON se
+decodifica una sola vez y va directo a la matriz cruda (columnas en el orden
+de RAW_FIELDS). Solo se verifica lo mínimo: que cada fila sea un objeto, que
+tenga nombre y emails, y que los campos del modelo sean numéricos o null.
+Las respuestas se serializan con orjson (si está instalado).
+"""
+import json
+from typing import List, NamedTuple
+
+import numpy as np
+
+from api.features import RAW_FIELDS
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el módulo json estándar
+    orjson = None
+
+CONTACT_FIELDS = ("Student_Name", "Student_Email", "Teacher_Email")
+
+
+class FastPathError(ValueError):
+    """El cuerpo no tiene el formato mínimo esperado (se responde 422)."""
+
+
+class StudentContact(NamedTuple):
+    """Lo que las notificaciones necesitan de un estudiante (mismos nombres que StudentData)."""
+    Student_Name: str
+    Student_Email: str
+    Teacher_Email: str
+
+
+def loads(body: bytes):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False).encode()
+
+
+def decode_students(body: bytes, many: bool):
+    """
+    Cuerpo JSON (un objeto, o una lista si 'many') -> (contactos, matriz cruda
+    float64 de (n, len(RAW_FIELDS)), con null/ausente -> NaN).
+    """
+    try:
+        payload = loads(body)
+    except ValueError as e:
+        raise FastPathError(f"JSON inválido: {e}")
+    records = payload if many else [payload]
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise FastPathError("Se esperaba una lista de objetos." if many else "Se esperaba un objeto.")
+
+    contacts: List[StudentContact] = []
+    for i, record in enumerate(records):
+        values = [record.get(field) for field in CONTACT_FIELDS]
+        if not all(isinstance(v, str) and v for v in values) or "@" not in values[1] or "@" not in values[2]:
+            raise FastPathError(f"Fila {i}: faltan Student_Name, Student_Email o Teacher_Email válidos.")
+        contacts.append(StudentContact(*values))
+
+    raw = np.empty((len(records), len(RAW_FIELDS)), dtype=np.float64)
+    try:
+        for i, record in enumerate(records):
+            raw[i] = [record.get(field) for field in RAW_FIELDS]
+    except (TypeError, ValueError):
+        raise FastPathError(f"Fila {i}: los campos del modelo deben ser numéricos o null.")
+    return contacts, raw
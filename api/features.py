@@ -1,7 +1,12 @@
-import pandas as pd
 import numpy as np
+from typing import TYPE_CHECKING
 
-def create_features(df: pd.DataFrame) -> pd.DataFrame:
+# pandas se importa solo donde se usa: el camino de servicio (FeatureCompiler
+# con el modelo compacto) no lo necesita y así el arranque es más rápido.
+if TYPE_CHECKING:
+    import pandas as pd
+
+def create_features(df: "pd.DataFrame") -> "pd.DataFrame":
     """
     Toma un DataFrame con los datos en crudo de la universidad y
     crea las características (features) de ingeniería que el modelo espera.
@@ -61,4 +66,242 @@ def create_features(df: pd.DataFrame) -> pd.DataFrame:
     Xn.replace([np.inf, -np.inf], 0, inplace=True)
     Xn.fillna(0, inplace=True)
     
-    return Xn
\ No newline at end of file
+    return Xn
+
+# --- Mapeo de nombres API -> nombres con los que se entrenó el modelo ---
+COLUMN_MAPPING = {
+    'Marital_status': 'Marital status',
+    'Application_mode': 'Application mode',
+    'Application_order': 'Application order',
+    'Daytime_evening_attendance': 'Daytime/evening attendance',
+    'Previous_qualification': 'Previous qualification',
+    'Previous_qualification_grade': 'Previous qualification (grade)',
+    'Nacionality': 'Nacionality',
+    'Mothers_qualification': "Mother's qualification",
+    'Fathers_qualification': "Father's qualification",
+    'Mothers_occupation': "Mother's occupation",
+    'Fathers_occupation': "Father's occupation",
+    'Admission_grade': 'Admission grade',
+    'Educational_special_needs': 'Educational special needs',
+    'Debtor': 'Debtor',
+    'Tuition_fees_up_to_date': 'Tuition fees up to date',
+    'Gender': 'Gender',
+    'Scholarship_holder': 'Scholarship holder',
+    'Age_at_enrollment': 'Age at enrollment',
+    'International': 'International',
+    'Curricular_units_1st_sem_credited': 'Curricular units 1st sem (credited)',
+    'Curricular_units_1st_sem_enrolled': 'Curricular units 1st sem (enrolled)',
+    'Curricular_units_1st_sem_evaluations': 'Curricular units 1st sem (evaluations)',
+    'Curricular_units_1st_sem_approved': 'Curricular units 1st sem (approved)',
+    'Curricular_units_1st_sem_grade': 'Curricular units 1st sem (grade)',
+    'Curricular_units_1st_sem_without_evaluations': 'Curricular units 1st sem (without evaluations)',
+    'Curricular_units_2nd_sem_credited': 'Curricular units 2nd sem (credited)',
+    'Curricular_units_2nd_sem_enrolled': 'Curricular units 2nd sem (enrolled)',
+    'Curricular_units_2nd_sem_evaluations': 'Curricular units 2nd sem (evaluations)',
+    'Curricular_units_2nd_sem_approved': 'Curricular units 2nd sem (approved)',
+    'Curricular_units_2nd_sem_grade': 'Curricular units 2nd sem (grade)',
+    'Curricular_units_2nd_sem_without_evaluations': 'Curricular units 2nd sem (without evaluations)',
+    'Unemployment_rate': 'Unemployment rate',
+    'Inflation_rate': 'Inflation rate',
+    'GDP': 'GDP'
+}
+
+# Campos numéricos crudos de StudentData (en el orden del schema)
+RAW_FIELDS = [
+    'Marital_status', 'Application_mode', 'Application_order', 'Course',
+    'Daytime_evening_attendance', 'Previous_qualification', 'Previous_qualification_grade',
+    'Nacionality', 'Mothers_qualification', 'Fathers_qualification',
+    'Mothers_occupation', 'Fathers_occupation', 'Admission_grade', 'Displaced',
+    'Educational_special_needs', 'Debtor', 'Tuition_fees_up_to_date', 'Gender',
+    'Scholarship_holder', 'Age_at_enrollment', 'International',
+    'Curricular_units_1st_sem_credited', 'Curricular_units_1st_sem_enrolled',
+    'Curricular_units_1st_sem_evaluations', 'Curricular_units_1st_sem_approved',
+    'Curricular_units_1st_sem_grade', 'Curricular_units_1st_sem_without_evaluations',
+    'Curricular_units_2nd_sem_credited', 'Curricular_units_2nd_sem_enrolled',
+    'Curricular_units_2nd_sem_evaluations', 'Curricular_units_2nd_sem_approved',
+    'Curricular_units_2nd_sem_grade', 'Curricular_units_2nd_sem_without_evaluations',
+    'Unemployment_rate', 'Inflation_rate', 'GDP'
+]
+
+# Campos con decimales; el resto son códigos, conteos o indicadores enteros
+CONTINUOUS_FIELDS = {
+    'Previous_qualification_grade', 'Admission_grade', 'Curricular_units_1st_sem_grade',
+    'Curricular_units_2nd_sem_grade', 'Unemployment_rate', 'Inflation_rate', 'GDP'
+}
+
+def compact_frame(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Reduce en el lugar los campos del modelo de un bloque (ej. un CSV leído
+    con int64/float64/object): los enteros sin nulos pasan al entero más chico
+    que los contiene (int8/int16), los enteros con nulos a float32 y los
+    continuos a float64 (texto no numérico -> NaN, igual que raw_from_frame).
+    Solo se reduce cuando los valores se conservan exactos, así que la matriz
+    del modelo (y las predicciones) no cambian.
+    """
+    import pandas as pd
+
+    for field in RAW_FIELDS:
+        if field not in df:
+            continue
+        column = pd.to_numeric(df[field], errors="coerce")
+        if field in CONTINUOUS_FIELDS:
+            if column.dtype != np.float64:
+                df[field] = column.astype(np.float64)
+            continue
+        values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        finite = np.isfinite(values)
+        if not np.array_equal(values[finite], np.round(values[finite])):
+            df[field] = column.astype(np.float64, copy=False)
+        elif finite.all():
+            df[field] = pd.to_numeric(values.astype(np.int64), downcast="integer")
+        elif np.array_equal(values.astype(np.float32), values, equal_nan=True):
+            df[field] = values.astype(np.float32)
+        else:
+            df[field] = values
+    return df
+
+
+# Features de ingeniería, en el mismo orden en que las crea create_features
+ENGINEERED_FEATURES = [
+    "fe_pct_aprob_1", "fe_pct_aprob_2", "fe_delta_grade_2_1",
+    "fe_total_aprob", "fe_mora_flag", "fe_z_Age at enrollment"
+]
+
+
+class FeatureCompiler:
+    """
+    Versión "precompilada" de create_features + rename.
+
+    Se construye UNA vez (al cargar el modelo) a partir de las columnas que el
+    modelo espera (feature_names_in_) y convierte los datos de los estudiantes
+    directamente en una matriz NumPy con ese orden de columnas, sin DataFrames
+    intermedios. El resultado es numéricamente idéntico a
+    create_features(df).rename(columns=COLUMN_MAPPING)[feature_names].
+    """
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.wrap_frame = True
+        self._raw_index = {field: i for i, field in enumerate(RAW_FIELDS)}
+        api_names = {model_name: api_name for api_name, model_name in COLUMN_MAPPING.items()}
+
+        # Para cada columna del modelo: de qué campo crudo sale, o qué feature de ingeniería es
+        self._raw_src = []  # (columna destino, índice en la matriz cruda)
+        self._fe_dst = {}   # nombre de feature -> columna destino
+        for j, name in enumerate(self.feature_names):
+            if name in ENGINEERED_FEATURES:
+                self._fe_dst[name] = j
+                continue
+            api_name = api_names.get(name, name)
+            if api_name not in self._raw_index:
+                raise ValueError(f"El modelo espera la columna '{name}', que no existe en StudentData.")
+            self._raw_src.append((j, self._raw_index[api_name]))
+
+        self._raw_dst_cols = np.array([j for j, _ in self._raw_src], dtype=np.intp)
+        self._raw_src_cols = np.array([i for _, i in self._raw_src], dtype=np.intp)
+
+    @classmethod
+    def from_model(cls, model) -> "FeatureCompiler":
+        """
+        Crea el compilador con las columnas que el modelo vio al entrenar.
+        Si el modelo no las expone, usa el orden por defecto (API renombrada + features).
+        """
+        feature_names = getattr(model, "feature_names_in_", None)
+        if feature_names is None:
+            feature_names = [COLUMN_MAPPING.get(f, f) for f in RAW_FIELDS] + ENGINEERED_FEATURES
+        compiler = cls(feature_names)
+        compiler.wrap_frame = not getattr(model, "accepts_ndarray", False)
+        return compiler
+
+    # --- Entradas: distintas fuentes -> matriz cruda (n, len(RAW_FIELDS)) ---
+
+    def raw_from_students(self, students) -> np.ndarray:
+        """Objetos StudentData -> matriz cruda (None -> NaN)."""
+        return np.array(
+            [[getattr(s, f) for f in RAW_FIELDS] for s in students],
+            dtype=np.float64
+        ).reshape(len(students), len(RAW_FIELDS))
+
+    def raw_from_records(self, records) -> np.ndarray:
+        """Diccionarios con nombres de la API -> matriz cruda (None/ausente -> NaN)."""
+        return np.array(
+            [[r.get(f) for f in RAW_FIELDS] for r in records],
+            dtype=np.float64
+        ).reshape(len(records), len(RAW_FIELDS))
+
+    def raw_from_frame(self, df: "pd.DataFrame") -> np.ndarray:
+        """DataFrame con nombres de la API (ej. un CSV) -> matriz cruda."""
+        import pandas as pd
+
+        raw = np.full((len(df), len(RAW_FIELDS)), np.nan, dtype=np.float64)
+        for i, field in enumerate(RAW_FIELDS):
+            if field in df:
+                raw[:, i] = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        return raw
+
+    def raw_from_arrow(self, table) -> np.ndarray:
+        """
+        Tabla de pyarrow (IPC o Parquet, columnas de demo_data.csv) -> matriz cruda.
+        Cada columna se convierte a float64 (null -> NaN) y se copia una sola vez
+        a su lugar en la matriz, sin pasar por pandas ni por filas de Python.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        raw = np.full((table.num_rows, len(RAW_FIELDS)), np.nan, dtype=np.float64)
+        names = set(table.column_names)
+        for i, field in enumerate(RAW_FIELDS):
+            if field in names:
+                column = pc.cast(table.column(field), pa.float64())
+                raw[:, i] = column.to_numpy(zero_copy_only=False)
+        return raw
+
+    # --- Compilación ---
+
+    def compile(self, raw: np.ndarray) -> np.ndarray:
+        """
+        Matriz cruda -> matriz del modelo (n, len(feature_names)), con las features
+        de ingeniería calculadas de forma vectorizada y NaN/inf reemplazados por 0.
+        """
+        out = np.empty((raw.shape[0], len(self.feature_names)), dtype=np.float64)
+        out[:, self._raw_dst_cols] = raw[:, self._raw_src_cols]
+
+        if self._fe_dst:
+            col = lambda name: raw[:, self._raw_index[name]]
+            a1, e1 = col("Curricular_units_1st_sem_approved"), col("Curricular_units_1st_sem_enrolled")
+            a2, e2 = col("Curricular_units_2nd_sem_approved"), col("Curricular_units_2nd_sem_enrolled")
+            with np.errstate(divide="ignore", invalid="ignore"):
+                engineered = {
+                    "fe_pct_aprob_1": a1 / e1,
+                    "fe_pct_aprob_2": a2 / e2,
+                    "fe_delta_grade_2_1": col("Curricular_units_2nd_sem_grade") - col("Curricular_units_1st_sem_grade"),
+                    # .sum(axis=1) de pandas ignora los NaN
+                    "fe_total_aprob": np.nansum(np.column_stack([a1, a2]), axis=1),
+                    "fe_mora_flag": (col("Tuition_fees_up_to_date") == 0).astype(np.float64),
+                    "fe_z_Age at enrollment": 0.0,
+                }
+            for name, j in self._fe_dst.items():
+                out[:, j] = engineered[name]
+
+        # Igual que create_features: infinitos y NaN -> 0
+        np.nan_to_num(out, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        return out
+
+    def to_model_input(self, matrix: np.ndarray):
+        """
+        Envuelve la matriz (sin copiarla) con los nombres de columnas, para que
+        el pipeline de scikit-learn pueda validar/seleccionar por nombre.
+        El modelo compacto recibe la matriz tal cual.
+        """
+        if not self.wrap_frame:
+            return matrix
+        import pandas as pd
+        return pd.DataFrame(matrix, columns=self.feature_names, copy=False)
+
+    def diagnostic_row(self, matrix: np.ndarray, i: int) -> dict:
+        """Features de ingeniería de la fila i (lo que usa el diagnóstico)."""
+        return {name: float(matrix[i, j]) for name, j in self._fe_dst.items()}
+
+    def diagnostic_columns(self, matrix: np.ndarray) -> dict:
+        """Features de ingeniería de todo el lote, como columnas (vistas, sin copiar)."""
+        return {name: matrix[:, j] for name, j in self._fe_dst.items()}
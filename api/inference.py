@@ -0,0 +1,151 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from api.loader import load_models, set_lgbm_threads
+
+# --- Configuración (variables de entorno) ---
+# thread: hilos (LightGBM libera el GIL) | process: procesos con su propia copia del modelo
+# inline: en el propio event loop (el comportamiento anterior, útil para comparar)
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+# Cuántas peticiones pueden esperar turno además de las que se están ejecutando
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", str(4 * INFERENCE_WORKERS)))
+
+
+def lgbm_threads_per_worker(workers: int) -> int:
+    """Reparte los núcleos entre los workers para no sobresuscribir la CPU."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+# --- Estado de cada proceso worker (solo en modo 'process') ---
+_WORKER_STATE = {}
+
+
+def _init_process_worker(model_path: str, threshold_path: str, lgbm_threads: int, shadow: bool):
+    from api.cache import create_prediction_cache
+    from api.registry import warm_up
+    from api.shadow import ShadowCollector
+
+    models = load_models(model_path, threshold_path)
+    set_lgbm_threads(models["pipeline"], lgbm_threads)
+    warm_up(models)
+    # Los candidatos en sombra viven solo en el proceso principal: aquí se juntan los lotes
+    if shadow:
+        models["shadow"] = ShadowCollector()
+    _WORKER_STATE["models"] = models
+    _WORKER_STATE["cache"] = create_prediction_cache(models["paths"])
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _call_in_process_worker(fn, students):
+    """Devuelve (resultado, lotes para la evaluación en sombra del proceso principal)."""
+    models = _WORKER_STATE["models"]
+    result = fn(models, students, _WORKER_STATE["cache"])
+    shadow = models.get("shadow")
+    return result, (shadow.drain() if shadow is not None else [])
+
+
+class InferencePool:
+    """
+    Ejecuta la inferencia (CPU) fuera del event loop de uvicorn.
+
+    La admisión está acotada: como máximo 'workers' tareas corriendo y
+    'queue_size' esperando. Si se supera, la petición se rechaza con 503
+    en lugar de acumular latencia.
+    """
+
+    def __init__(self, kind: str = INFERENCE_EXECUTOR, workers: int = INFERENCE_WORKERS,
+                 queue_size: int = INFERENCE_QUEUE_SIZE, model_paths=None, shadow: bool = False):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_size)
+        self.lgbm_threads = lgbm_threads_per_worker(self.workers) if kind != "inline" else (os.cpu_count() or 1)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inference")
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                initializer=_init_process_worker,
+                initargs=(*model_paths, self.lgbm_threads, shadow)
+            )
+        elif kind == "inline":
+            self._executor = None
+        else:
+            raise ValueError(f"INFERENCE_EXECUTOR desconocido: {kind}")
+
+    def warm_up(self):
+        """
+        Modo 'process': arranca los workers y espera a que carguen y calienten su
+        modelo (en el inicializador), para que ninguna petición pague ese arranque.
+        Los workers solo toman tareas después de inicializarse.
+        """
+        if self.kind != "process":
+            return
+        for future in [self._executor.submit(_worker_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def run(self, fn, models: dict, students, cache=None):
+        """
+        Ejecuta fn(models, students, cache) en el pool y espera el resultado.
+        En modo 'process' cada worker usa su propio modelo y caché, y los lotes
+        que evaluó pasan al scoring en sombra de 'models' (el del proceso principal).
+        """
+        if not self._admit():
+            raise HTTPException(status_code=503, detail="Servidor saturado: intente nuevamente en unos segundos.")
+        try:
+            if self._executor is None:
+                return fn(models, students, cache)
+            loop = asyncio.get_running_loop()
+            if self.kind == "process":
+                result, shadow_items = await loop.run_in_executor(
+                    self._executor, _call_in_process_worker, fn, students
+                )
+                shadow = models.get("shadow")
+                if shadow is not None:
+                    for item in shadow_items:
+                        shadow.enqueue(item)
+                return result
+            return await loop.run_in_executor(self._executor, fn, models, students, cache)
+        finally:
+            self._release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "lgbm_threads": self.lgbm_threads,
+            "in_flight": self._in_flight,
+            "capacity": self.capacity,
+            "rejected": self.rejected,
+        }
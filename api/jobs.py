@@ -0,0 +1,363 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# --- Configuración (variables de entorno) ---
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "/tmp/agente_jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "2000"))
+# Si un worker no renueva su trabajo en este tiempo (ej. el proceso murió), otro lo retoma
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BATCH = 200
+OUTBOX_BACKOFF_BASE = 5.0    # segundos (se duplica en cada intento)
+OUTBOX_BACKOFF_MAX = 900.0
+OUTBOX_SEND_LEASE = 300.0    # un email "enviándose" por más tiempo que esto se vuelve a intentar
+
+
+class OutboxDeferred(Exception):
+    """El email todavía no se puede enviar (ej. la misma alerta se está enviando): se reintenta sin gastar un intento."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,           -- queued | running | done | failed
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+CREATE TABLE IF NOT EXISTS job_inputs (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,           -- pending | sending | sent | failed | suppressed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+"""
+
+
+class JobStore:
+    """
+    Trabajos, sus entradas/resultados y la bandeja de salida de emails en un
+    archivo SQLite local (sobrevive reinicios; varios workers de gunicorn de
+    la misma máquina pueden compartirlo).
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (sqlite3 no permite compartirlas entre hilos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    # --- Trabajos ---
+
+    def create_job(self, records: list) -> dict:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, len(records), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_inputs (job_id, idx, payload) VALUES (?, ?, ?)",
+                ((job_id, i, json.dumps(record)) for i, record in enumerate(records))
+            )
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str):
+        row = self._conn().execute(
+            "SELECT id, status, total, done, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "status", "total", "done", "error", "created_at", "updated_at")
+        job = dict(zip(keys, row))
+        job["progress"] = round(job["done"] / job["total"], 4) if job["total"] else 1.0
+        return job
+
+    def claim_next(self, owner_lease: float = JOB_LEASE_SECONDS):
+        """
+        Toma el trabajo más antiguo en cola, o uno 'running' cuyo worker dejó de
+        renovarlo (se retoma desde 'done', sin volver a evaluar lo ya guardado).
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', lease_until = ?, updated_at = ? WHERE id = ?",
+                (now + owner_lease, now, row[0])
+            )
+        return self.get_job(row[0])
+
+    def load_inputs(self, job_id: str, start: int, stop: int) -> list:
+        rows = self._conn().execute(
+            "SELECT payload FROM job_inputs WHERE job_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+            (job_id, start, stop)
+        ).fetchall()
+        return [json.loads(payload) for payload, in rows]
+
+    def save_chunk(self, job_id: str, start: int, results: list, notifications: list):
+        """
+        Guarda los resultados de un bloque, encola sus emails y avanza el progreso
+        en UNA transacción: si el proceso muere a la mitad, el bloque se repite entero.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_results (job_id, idx, result) VALUES (?, ?, ?)",
+                ((job_id, start + i, json.dumps(result)) for i, result in enumerate(results))
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, kind, payload, status, next_attempt_at, updated_at) "
+                "VALUES (?, ?, ?, 'pending', ?, ?)",
+                ((key, kind, json.dumps(payload), now, now) for key, kind, payload in notifications)
+            )
+            conn.execute(
+                "UPDATE jobs SET done = ?, updated_at = ?, lease_until = ? WHERE id = ?",
+                (start + len(results), now, now + JOB_LEASE_SECONDS, job_id)
+            )
+
+    def finish_job(self, job_id: str, error: str = None):
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            ("failed" if error else "done", error, now, job_id)
+        )
+
+    def results_page(self, job_id: str, offset: int, limit: int) -> list:
+        rows = self._conn().execute(
+            "SELECT result FROM job_results WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?",
+            (job_id, offset, limit)
+        ).fetchall()
+        return [json.loads(result) for result, in rows]
+
+    # --- Bandeja de salida de emails ---
+
+    def claim_outbox(self, limit: int = OUTBOX_BATCH) -> list:
+        """Marca como 'sending' los emails pendientes cuyo turno llegó y los devuelve."""
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, idempotency_key, kind, payload, attempts FROM outbox "
+                "WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                ((now + OUTBOX_SEND_LEASE, now, row[0]) for row in rows)
+            )
+        return [
+            {"id": row[0], "key": row[1], "kind": row[2], "payload": json.loads(row[3]), "attempts": row[4]}
+            for row in rows
+        ]
+
+    def mark_outbox(self, entry_id: int, status: str, attempts: int):
+        """Resultado de un envío. Si falló, vuelve a 'pending' con backoff (o 'failed' al agotar intentos)."""
+        now = time.time()
+        next_attempt_at = now
+        if status == "pending":
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                status = "failed"
+            next_attempt_at = now + min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+        self._conn().execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+            (status, attempts, next_attempt_at, now, entry_id)
+        )
+
+    def defer_outbox(self, entry_id: int, delay: float = OUTBOX_BACKOFF_BASE):
+        """Vuelve a 'pending' después de 'delay' segundos, sin contar un intento."""
+        now = time.time()
+        self._conn().execute(
+            "UPDATE outbox SET status = 'pending', next_attempt_at = ?, updated_at = ? WHERE id = ?",
+            (now + delay, now, entry_id)
+        )
+
+    def outbox_stats(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class _Transaction:
+    """'with' que abre una transacción de escritura (BEGIN IMMEDIATE) y hace commit o rollback."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class JobRunner:
+    """
+    Pool de hilos que procesa los trabajos de la cola por bloques de
+    'chunk_size' estudiantes.
+
+    'score_chunk(registros, job_id, inicio) -> (resultados, notificaciones)'
+    evalúa un bloque; cada notificación es (llave de idempotencia, tipo, datos)
+    y se guarda en la bandeja de salida junto con los resultados.
+    """
+
+    def __init__(self, store: JobStore, score_chunk, workers: int = JOB_WORKERS, chunk_size: int = JOB_CHUNK_SIZE):
+        self.store = store
+        self.score_chunk = score_chunk
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 30.0):
+        """Los trabajos a medias quedan en la base y se retoman al volver a arrancar."""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Avisa que hay un trabajo nuevo (para no esperar a la siguiente revisión)."""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim_next()
+            except sqlite3.OperationalError as e:
+                print(f"Error al leer la cola de trabajos: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                continue
+            self._process(job)
+
+    def _process(self, job: dict):
+        job_id, start = job["job_id"], job["done"]
+        try:
+            while start < job["total"]:
+                if self._stop.is_set():
+                    return  # queda 'running'; se retoma cuando venza el lease
+                records = self.store.load_inputs(job_id, start, start + self.chunk_size)
+                results, notifications = self.score_chunk(records, job_id, start)
+                self.store.save_chunk(job_id, start, results, notifications)
+                start += len(records)
+            self.store.finish_job(job_id)
+        except Exception as e:
+            print(f"Error en el trabajo {job_id}: {e}")
+            self.store.finish_job(job_id, error=f"{type(e).__name__}: {e}")
+
+
+class OutboxRelay:
+    """
+    Hilo que pasa los emails de la bandeja de salida al dispatcher SMTP.
+    Un email se marca 'sent' solo cuando el servidor lo aceptó; si el proceso
+    muere antes, se vuelve a enviar (entrega "al menos una vez"). La llave de
+    idempotencia va como Message-ID para que el destino pueda descartar repetidos.
+
+    'build(kind, payload) -> (EmailMessage, on_result) | None' arma el mensaje
+    (None = suprimido); 'on_result(ok)' se llama con el resultado del envío.
+    Si build lanza OutboxDeferred, la entrada queda pendiente y se reintenta.
+    """
+
+    def __init__(self, store: JobStore, dispatcher, build, interval: float = 1.0):
+        self.store = store
+        self.dispatcher = dispatcher
+        self.build = build
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                entries = self.store.claim_outbox()
+            except sqlite3.OperationalError as e:
+                print(f"Error al leer la bandeja de salida: {e}")
+                continue
+            for entry in entries:
+                self._deliver(entry)
+
+    def _deliver(self, entry: dict):
+        attempts = entry["attempts"] + 1
+        try:
+            built = self.build(entry["kind"], entry["payload"])
+        except OutboxDeferred:
+            self.store.defer_outbox(entry["id"])
+            return
+        if built is None:
+            self.store.mark_outbox(entry["id"], "suppressed", attempts)
+            return
+        msg, sent_callback = built
+        msg["Message-ID"] = f"<{entry['key']}@agente-desercion>"
+
+        def on_result(ok: bool):
+            sent_callback(ok)
+            self.store.mark_outbox(entry["id"], "sent" if ok else "pending", attempts)
+
+        if not self.dispatcher.enqueue(msg, on_result=on_result):
+            sent_callback(False)
+            self.store.mark_outbox(entry["id"], "pending", attempts)
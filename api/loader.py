@@ -0,0 +1,113 @@
+import json
+import os
+
+from api.cache import file_fingerprint
+from api.features import FeatureCompiler
+
+JOBLIB_MODEL_PATH = "models/dropout_lgbm_calibrated.joblib"
+# Artefacto compacto generado con: python -m api.export_model
+COMPACT_MODEL_DIR = "models/serving"
+THRESHOLD_PATH = os.getenv("THRESHOLD_PATH", "models/threshold_95.txt")
+# Umbrales adicionales (ej. {"medium": 0.70}); el umbral alto sigue saliendo de THRESHOLD_PATH
+THRESHOLDS_CONFIG_PATH = os.getenv("THRESHOLDS_CONFIG_PATH", "models/thresholds.json")
+DEFAULT_MEDIUM_RISK_THRESHOLD = 0.70
+# auto: usa el artefacto compacto si existe, si no el .joblib | compact | joblib
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "auto")
+
+
+def default_model_path() -> str:
+    """Ruta del modelo a servir: un .joblib o un directorio con el artefacto compacto."""
+    if os.getenv("MODEL_PATH"):
+        return os.getenv("MODEL_PATH")
+    has_compact = os.path.exists(os.path.join(COMPACT_MODEL_DIR, "manifest.json"))
+    if MODEL_FORMAT == "compact" or (MODEL_FORMAT == "auto" and has_compact):
+        return COMPACT_MODEL_DIR
+    return JOBLIB_MODEL_PATH
+
+
+MODEL_PATH = default_model_path()
+
+
+def model_files(model_path: str) -> str:
+    """Archivo que identifica la versión del modelo (para la caché y el fingerprint)."""
+    if os.path.isdir(model_path):
+        return os.path.join(model_path, "manifest.json")
+    return model_path
+
+
+def iter_estimators(estimator):
+    """
+    Recorre el pipeline (Pipeline, CalibratedClassifierCV y sus clasificadores
+    calibrados) y devuelve cada estimador interno una sola vez.
+    """
+    seen = set()
+    stack = [estimator]
+    while stack:
+        est = stack.pop()
+        if est is None or isinstance(est, str) or id(est) in seen:
+            continue
+        seen.add(id(est))
+        yield est
+        stack.extend(step for _, step in getattr(est, "steps", []))
+        stack.extend(getattr(est, "calibrated_classifiers_", []))
+        stack.append(getattr(est, "estimator", None))
+
+
+def set_lgbm_threads(pipeline, n_threads: int) -> int:
+    """
+    Fija el número de hilos internos de LightGBM en todos los LGBM del pipeline
+    (o en el modelo compacto). Devuelve cuántos estimadores se modificaron.
+    """
+    if hasattr(pipeline, "set_num_threads"):
+        pipeline.set_num_threads(n_threads)
+        return len(getattr(pipeline, "boosters", [pipeline]))
+    changed = 0
+    for est in iter_estimators(pipeline):
+        if type(est).__name__ in ("LGBMClassifier", "LGBMRegressor", "LGBMModel"):
+            est.set_params(n_jobs=n_threads)
+            changed += 1
+    return changed
+
+
+def load_pipeline(model_path: str):
+    """
+    Carga el modelo. Un directorio es el artefacto compacto (sin joblib ni el pipeline;
+    lightgbm igual importa scikit-learn/pandas/scipy si están instalados);
+    un archivo es el pipeline completo con joblib (importa scikit-learn, etc.).
+    """
+    if os.path.isdir(model_path):
+        from api.compact_model import CompactModel
+        return CompactModel.load(model_path)
+    import joblib
+    return joblib.load(model_path)
+
+
+def load_thresholds(threshold_path: str = THRESHOLD_PATH, config_path: str = THRESHOLDS_CONFIG_PATH) -> dict:
+    """
+    Todos los umbrales de riesgo en un solo lugar: 'high' desde el archivo del
+    umbral al 95% y el resto desde el JSON opcional (con valores por defecto).
+    """
+    thresholds = {"medium": DEFAULT_MEDIUM_RISK_THRESHOLD}
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            thresholds.update({name: float(value) for name, value in json.load(f).items()})
+    with open(threshold_path, 'r') as f:
+        thresholds["high"] = float(f.read())
+    return thresholds
+
+
+def load_models(model_path: str = MODEL_PATH, threshold_path: str = THRESHOLD_PATH) -> dict:
+    """
+    Carga el pipeline y el umbral, y prepara todo lo que el scoring necesita:
+    el compilador de features y la versión (para la caché).
+    """
+    loaded_models = {}
+    loaded_models["pipeline"] = load_pipeline(model_path)
+    # El mapeo de columnas se "compila" una sola vez según lo que espera el modelo
+    loaded_models["compiler"] = FeatureCompiler.from_model(loaded_models["pipeline"])
+    loaded_models["thresholds"] = load_thresholds(threshold_path)
+    loaded_models["threshold"] = loaded_models["thresholds"]["high"]
+    # Versión del modelo + umbrales (forma parte de la llave de la caché de predicciones)
+    loaded_models["paths"] = (model_files(model_path), threshold_path, THRESHOLDS_CONFIG_PATH)
+    loaded_models["version"] = file_fingerprint(*loaded_models["paths"])
+    return loaded_models
@@ -1,65 +1,158 @@
-import joblib
-import pandas as pd
-from fastapi import FastAPI, Request, BackgroundTasks
+import asyncio
+import os
+import threading
+import time
+from functools import partial
+import numpy as np
+from typing import List, Optional, Tuple
+from fastapi import FastAPI, Request, Response, BackgroundTasks, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+from pydantic import ValidationError
 
 # --- INICIO DE LA ACTUALIZACIÓN ---
 # Importamos nuestros propios módulos, AÑADIENDO los de riesgo medio
-from api.features import create_features
+from api.batching import MICROBATCH_ENABLED, MICROBATCH_MAX_PENDING, MICROBATCH_MAX_SIZE, MicroBatcher
+from api.cache import PredictionCache, create_prediction_cache
+from api.columnar import (
+    ARROW_STREAM, RESULT_FIELDS, ColumnarUnsupported, contacts_from_table, encode_results, read_table, wants_arrow
+)
+from api.explain import EXPLAIN_MAX_K, EXPLAIN_MAX_ROWS, EXPLAIN_TOP_K, top_contributions
+from api.fastpath import FastPathError, decode_students, dumps
+from api.inference import InferencePool
+from api.jobs import JobRunner, JobStore, OutboxRelay
+from api.loader import MODEL_PATH, THRESHOLD_PATH
+from api.metrics import (
+    MODEL_INFO, PROFILE_SLOW_MS, REGISTRY, Gauge, MetricsMiddleware, SamplingProfiler,
+    count_tiers, observe_stage, timed
+)
 from api.notifications import (
     send_teacher_alert, 
     send_student_support,
     send_teacher_medium_alert,  # <-- NUEVA IMPORTACIÓN
-    send_student_medium_support # <-- NUEVA IMPORTACIÓN
+    send_student_medium_support, # <-- NUEVA IMPORTACIÓN
+    flush_notifications,
+    notification_message,
+    dispatcher,
+    ledger
 )
+from api.registry import ModelRegistry
+from api.shadow import create_shadow_scorer
+from api.score_store import STUDENT_ID_FIELD, ScoreStore, diff_against_store, student_id
+from api.rules import HIGH_RISK, MEDIUM_RISK, classify, columns_from_rows
 from api.schemas import StudentData, AnalysisResponse
 # --- FIN DE LA ACTUALIZACIÓN ---
 
 
-# --- 1. Lógica de Diagnóstico (Sin cambios) ---
-def get_diagnostic_and_resource(data_row: pd.Series) -> (str, str):
-    """
-    Analiza las features de un estudiante en riesgo y devuelve
-    un diagnóstico y un recurso de apoyo.
-    """
-    if data_row.get("fe_mora_flag") == 1:
-        diagnostic = "Alto riesgo detectado. Causa principal: **Mora en los pagos**."
-        resource = "Link a la Oficina de Bienestar Financiero para discutir opciones de pago."
-        return diagnostic, resource
+# --- 1. Lógica de Diagnóstico ---
+# Las reglas (mora / baja aprobación / caída de notas / combinación) están
+# declaradas como datos en api/rules.py y se evalúan vectorizadas por lote.
 
-    if data_row.get("fe_pct_aprob_1", 1) < 0.5:
-        diagnostic = "Alto riesgo detectado. Causa principal: **Bajo rendimiento en el Semestre 1**."
-        resource = "Link al portal de Tutorías Académicas para reforzar cursos."
-        return diagnostic, resource
-        
-    if data_row.get("fe_delta_grade_2_1", 0) < -2:
-        diagnostic = "Alto riesgo detectado. Causa principal: **Caída notable en las notas** del Sem1 al Sem2."
-        resource = "Link para agendar una cita con Consejería Académica."
-        return diagnostic, resource
 
-    diagnostic = "Alto riesgo detectado (combinación de factores)."
-    resource = "Link al Manual de Bienestar Estudiantil y Apoyo Psicológico."
-    return diagnostic, resource
-
-
-# --- 2. Carga del Modelo (Sin cambios) ---
+# --- 2. Carga del Modelo ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Carga el modelo y el umbral una sola vez y los guarda en 'app.state'.
     """
     print("Iniciando API...")
-    model_path = "models/dropout_lgbm_calibrated.joblib"
-    threshold_path = "models/threshold_95.txt"
-    
-    loaded_models = {}
-    loaded_models["pipeline"] = joblib.load(model_path)
-    with open(threshold_path, 'r') as f:
-        loaded_models["threshold"] = float(f.read())
-        
-    app.state.models = loaded_models
+    # El modo incremental identifica a cada estudiante por este campo: se valida antes de arrancar
+    if STUDENT_ID_FIELD not in StudentData.model_fields:
+        raise ValueError(f"STUDENT_ID_FIELD='{STUDENT_ID_FIELD}' no es un campo de StudentData (ej. Student_Email).")
+    # Modelos candidatos en sombra (SHADOW_MODELS): evalúan el mismo tráfico sin
+    # afectar respuestas ni emails, y ceden el paso mientras el pool está ocupado
+    app.state.shadow = create_shadow_scorer(
+        is_busy=lambda: app.state.inference.in_flight >= app.state.inference.workers
+    )
+    shadow_enabled = app.state.shadow is not None
+
+    # Pool de inferencia: los hilos internos de LightGBM se reparten entre los workers
+    inference = InferencePool(model_paths=(MODEL_PATH, THRESHOLD_PATH), shadow=shadow_enabled)
+    inference.warm_up()
+    app.state.inference = inference
+    prepared_pool = {}
+
+    def prepare_swap(models: dict):
+        """
+        En modo 'process' cada worker tiene su propia copia del modelo: antes de
+        publicar una versión nueva se levanta un pool nuevo y se espera a que sus
+        workers carguen y calienten el modelo (en el hilo de carga del registro).
+        """
+        if app.state.inference.kind == "process":
+            pool = InferencePool(kind="process", model_paths=(MODEL_PATH, THRESHOLD_PATH), shadow=shadow_enabled)
+            try:
+                pool.warm_up()
+            except Exception:
+                pool.shutdown()  # se sigue sirviendo con el pool anterior
+                raise
+            prepared_pool["next"] = pool
+
+    def on_swap(models: dict, previous: dict):
+        """Publica una versión nueva del modelo (carga inicial o recarga en caliente)."""
+        models["shadow"] = app.state.shadow
+        app.state.models = models
+        MODEL_INFO.clear()
+        MODEL_INFO.set(1, version=models["version"])
+        if previous is None:
+            return
+        if app.state.prediction_cache is not None:
+            app.state.prediction_cache.watch(*models["paths"])
+        # Se publica el pool ya calentado (prepare_swap) y el anterior se cierra
+        # cuando terminan sus tareas en curso
+        new_pool = prepared_pool.pop("next", None)
+        if new_pool is not None:
+            old_pool = app.state.inference
+            app.state.inference = new_pool
+            threading.Thread(target=old_pool.shutdown, daemon=True).start()
+
+    registry = ModelRegistry(MODEL_PATH, THRESHOLD_PATH, lgbm_threads=inference.lgbm_threads,
+                             on_swap=on_swap, prepare=prepare_swap)
+    app.state.registry = registry
+    app.state.prediction_cache = None
+    loaded_models = registry.load()
+    app.state.prediction_cache = create_prediction_cache(loaded_models["paths"])
+
+    # Micro-batching: las peticiones individuales simultáneas se evalúan juntas
+    # (devuelve también la versión del modelo con la que se evaluó el lote)
+    async def run_batch(students):
+        models = app.state.models
+        risk_probs, diag_rows = await app.state.inference.run(
+            score_students, models, students, app.state.prediction_cache
+        )
+        return risk_probs, diag_rows, models
+    # Cola acotada: por defecto, un lote completo por cada lugar del pool de inferencia
+    app.state.batcher = MicroBatcher(
+        run_batch, max_pending=MICROBATCH_MAX_PENDING or MICROBATCH_MAX_SIZE * inference.capacity
+    ) if MICROBATCH_ENABLED else None
+    registry.start_watching()
+
+    # Trabajos asíncronos: cola y resultados en SQLite; los emails que generan
+    # pasan por la bandeja de salida durable (se reanudan si el proceso se reinicia)
+    def score_job_chunk(records, job_id, start):
+        return score_records(app.state.models, records, job_id, start, app.state.prediction_cache)
+    app.state.job_store = JobStore()
+    app.state.job_runner = JobRunner(app.state.job_store, score_job_chunk)
+    app.state.outbox = OutboxRelay(app.state.job_store, dispatcher, notification_message)
+    app.state.job_runner.start()
+    app.state.outbox.start()
+    # Último resultado por estudiante (re-scoring incremental del endpoint por lotes)
+    app.state.score_store = ScoreStore()
+    if profiler is not None:
+        profiler.start()
     print("Modelo y Umbral cargados exitosamente.")
     yield
+    await registry.stop_watching()
+    if profiler is not None:
+        profiler.stop()
+    if app.state.batcher is not None:
+        await app.state.batcher.stop()
+    app.state.job_runner.stop()
+    app.state.outbox.stop()
+    # Enviamos los digest y emails pendientes y cerramos las sesiones SMTP
+    flush_notifications()
+    app.state.inference.shutdown()
+    if app.state.shadow is not None:
+        app.state.shadow.stop()
     app.state.models.clear()
     print("API detenida. Modelos limpiados.")
 
@@ -72,83 +165,160 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# --- 4. El Endpoint de Predicción (¡ACTUALIZADO!) ---
-@app.post("/analyze_student", response_model=AnalysisResponse)
-async def analyze_student(student: StudentData, request: Request, background_tasks: BackgroundTasks):
+# Latencia y conteo por ruta; con PROFILE_SLOW_MS > 0 se perfilan las peticiones lentas
+profiler = SamplingProfiler() if PROFILE_SLOW_MS > 0 else None
+app.add_middleware(MetricsMiddleware, profiler=profiler)
+
+REGISTRY.register(Gauge(
+    "agente_notification_queue_depth", "Emails esperando en la cola del dispatcher.",
+    callback=lambda: dispatcher.queue_depth
+))
+REGISTRY.register(Gauge(
+    "agente_notifications_suppressed", "Alertas no enviadas por estar repetidas dentro del TTL.",
+    callback=lambda: ledger.suppressed
+))
+REGISTRY.register(Gauge(
+    "agente_inference_in_flight", "Tareas en el pool de inferencia (corriendo o en espera).",
+    callback=lambda: app.state.inference.in_flight
+))
+
+# --- 4. Lógica de Scoring compartida (individual y por lotes) ---
+
+# Los umbrales (alto ~0.865 y medio 70%) vienen de api.loader.load_thresholds
+# y se recargan junto con el modelo
+
+# Límites del endpoint por lotes (configurables por variables de entorno)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50000"))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "2048"))
+# Token para los endpoints de administración (recarga del modelo). Vacío = deshabilitados
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Token de los clientes internos que pueden usar el camino rápido (/internal/...). Vacío = deshabilitado
+INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN", "")
+
+
+def score_students(models: dict, students: List[StudentData], cache: Optional[PredictionCache] = None) -> Tuple[np.ndarray, List[dict]]:
     """
-    Recibe los datos de UN estudiante, analiza su riesgo y toma acciones.
+    Obtiene las probabilidades de un grupo de estudiantes.
+
+    Los que ya están en la caché (mismo vector de datos y misma versión del
+    modelo) se devuelven directo; el resto se convierte en la matriz de features
+    del modelo (con el compilador precalculado) y se evalúa con UNA sola llamada
+    a predict_proba.
+    Devuelve las probabilidades (en el orden de entrada) y, por estudiante,
+    las features de ingeniería que usa el diagnóstico.
     """
-    
-    # 1. Obtener el modelo y los umbrales
-    model = request.app.state.models["pipeline"]
-    # Este es tu umbral de ~0.865
-    HIGH_RISK_THRESHOLD = request.app.state.models["threshold"] 
-    # Este es tu nuevo umbral de 70%
-    MEDIUM_RISK_THRESHOLD = 0.70 
-
-    # 2. Convertir los datos de entrada Pydantic a un DataFrame
-    student_dict = student.model_dump()
-    data_df = pd.DataFrame([student_dict])
-
-    # 3. Aplicar la Ingeniería de Características
-    data_with_features = create_features(data_df)
-
-    # 3.5. Renombrar columnas para que coincidan con el modelo entrenado
-    column_mapping = {
-        'Marital_status': 'Marital status',
-        'Application_mode': 'Application mode',
-        'Application_order': 'Application order',
-        'Daytime_evening_attendance': 'Daytime/evening attendance',
-        'Previous_qualification': 'Previous qualification',
-        'Previous_qualification_grade': 'Previous qualification (grade)',
-        'Nacionality': 'Nacionality',
-        'Mothers_qualification': "Mother's qualification",
-        'Fathers_qualification': "Father's qualification",
-        'Mothers_occupation': "Mother's occupation",
-        'Fathers_occupation': "Father's occupation",
-        'Admission_grade': 'Admission grade',
-        'Educational_special_needs': 'Educational special needs',
-        'Debtor': 'Debtor',
-        'Tuition_fees_up_to_date': 'Tuition fees up to date',
-        'Gender': 'Gender',
-        'Scholarship_holder': 'Scholarship holder',
-        'Age_at_enrollment': 'Age at enrollment',
-        'International': 'International',
-        'Curricular_units_1st_sem_credited': 'Curricular units 1st sem (credited)',
-        'Curricular_units_1st_sem_enrolled': 'Curricular units 1st sem (enrolled)',
-        'Curricular_units_1st_sem_evaluations': 'Curricular units 1st sem (evaluations)',
-        'Curricular_units_1st_sem_approved': 'Curricular units 1st sem (approved)',
-        'Curricular_units_1st_sem_grade': 'Curricular units 1st sem (grade)',
-        'Curricular_units_1st_sem_without_evaluations': 'Curricular units 1st sem (without evaluations)',
-        'Curricular_units_2nd_sem_credited': 'Curricular units 2nd sem (credited)',
-        'Curricular_units_2nd_sem_enrolled': 'Curricular units 2nd sem (enrolled)',
-        'Curricular_units_2nd_sem_evaluations': 'Curricular units 2nd sem (evaluations)',
-        'Curricular_units_2nd_sem_approved': 'Curricular units 2nd sem (approved)',
-        'Curricular_units_2nd_sem_grade': 'Curricular units 2nd sem (grade)',
-        'Curricular_units_2nd_sem_without_evaluations': 'Curricular units 2nd sem (without evaluations)',
-        'Unemployment_rate': 'Unemployment rate',
-        'Inflation_rate': 'Inflation rate',
-        'GDP': 'GDP'
-    }
+    with timed("to_matrix"):
+        raw = models["compiler"].raw_from_students(students)
+    return score_raw(models, raw, cache)
+
+
+def score_raw(models: dict, raw: np.ndarray, cache: Optional[PredictionCache] = None) -> Tuple[np.ndarray, List[dict]]:
+    """Igual que score_students, a partir de la matriz cruda (columnas en el orden de RAW_FIELDS)."""
+    risk_probs, diag_rows, _ = score_raw_explained(models, raw, cache, top_k=0)
+    return risk_probs, diag_rows
+
+
+def score_raw_explained(models: dict, raw: np.ndarray, cache: Optional[PredictionCache] = None,
+                        top_k: int = EXPLAIN_TOP_K) -> Tuple[np.ndarray, List[dict], Optional[List[list]]]:
+    """
+    Igual que score_raw y, con top_k > 0, además las 'top_k' features que más
+    contribuyen a la predicción de cada estudiante (TreeSHAP, api/explain.py),
+    calculadas para todo el lote de una vez. Las explicaciones se guardan en la
+    caché junto con la predicción; una entrada sin explicación cuenta como
+    faltante solo cuando se pide explicación.
+    """
+    model, compiler = models["pipeline"], models["compiler"]
+    n = raw.shape[0]
+    risk_probs = np.empty(n, dtype=np.float64)
+    diag_rows = [None] * n
+    explanations = [None] * n if top_k > 0 else None
+
+    pending = list(range(n))
+    keys = None
+    if cache is not None:
+        with timed("cache_lookup"):
+            keys = [cache.key(raw[i], models["version"]) for i in pending]
+            pending = []
+            # Una entrada sin explicación no sirve si se pide explicación (cuenta como faltante)
+            usable = (lambda entry: "e" in entry) if top_k > 0 else None
+            for i, key in enumerate(keys):
+                cached = cache.get(key, usable)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    risk_probs[i], diag_rows[i] = cached["p"], cached["d"]
+                    if top_k > 0:
+                        explanations[i] = cached["e"][:top_k]
+
+    if pending:
+        with timed("features"):
+            features = compiler.compile(raw[pending])
+        with timed("predict"):
+            probs = model.predict_proba(compiler.to_model_input(features))[:, 1]
+        top = None
+        if top_k > 0:
+            with timed("explain"):
+                top = top_contributions(models, features, EXPLAIN_MAX_K)
+        new_entries = []
+        for j, i in enumerate(pending):
+            risk_probs[i] = probs[j]
+            diag_rows[i] = compiler.diagnostic_row(features, j)
+            entry = {"p": float(probs[j]), "d": diag_rows[i]}
+            if top is not None:
+                entry["e"] = top[j]
+                explanations[i] = top[j][:top_k]
+            if cache is not None:
+                new_entries.append((keys[i], entry))
+        if cache is not None:
+            # Todos los faltantes del lote se guardan juntos (una transacción en SQLite)
+            with timed("cache_store"):
+                cache.set_many(new_entries)
+
+    # Los candidatos en sombra evalúan, en su propio hilo, todas las filas del lote
+    # (también las que salieron de la caché, para no sesgar la comparación); esas
+    # filas van crudas y se compilan en el hilo de la sombra, no en esta petición
+    shadow = models.get("shadow")
+    if shadow is not None and n and shadow.sampled():
+        rows = {}
+        if pending:
+            rows.update(features=features, feature_rows=np.asarray(pending))
+        if len(pending) < n:
+            hits = np.setdiff1d(np.arange(n), pending)
+            rows.update(raw=raw[hits], raw_rows=hits)
+        shadow.submit(models, risk_probs.copy(), **rows)
+
+    return risk_probs, diag_rows, explanations
+
 
-    data_to_predict = data_with_features.rename(columns=column_mapping, errors='ignore')
+def score_students_explained(models: dict, students: List[StudentData], cache: Optional[PredictionCache] = None,
+                             top_k: int = EXPLAIN_TOP_K):
+    """score_students + explicaciones (ver score_raw_explained)."""
+    with timed("to_matrix"):
+        raw = models["compiler"].raw_from_students(students)
+    return score_raw_explained(models, raw, cache, top_k)
 
-    # 4. Obtener la probabilidad de riesgo
-    risk_prob = model.predict_proba(data_to_predict)[:, 1][0]
-    
-    # --- INICIO DE LA ACTUALIZACIÓN: Lógica de 3 niveles ---
 
+def schedule_notifications(
+    student,
+    risk_prob: float,
+    prediction_label: str,
+    diagnostic: str,
+    resource: str,
+    background_tasks: BackgroundTasks
+):
+    """
+    Programa los emails que corresponden al nivel de riesgo de UN estudiante.
+    'student' es un StudentData o cualquier objeto con Student_Name,
+    Student_Email y Teacher_Email.
+    """
     # Nivel 1: Alto Riesgo (Acción Urgente)
-    if risk_prob >= HIGH_RISK_THRESHOLD:
-        prediction_label = "Alto Riesgo"
-        diagnostic, resource = get_diagnostic_and_resource(data_with_features.iloc[0])
-        action_taken = "Acción: Emails de ALERTA enviados"
-        
+    if prediction_label == HIGH_RISK:
         background_tasks.add_task(
             send_teacher_alert,
             student_name=student.Student_Name,
             teacher_email=student.Teacher_Email,
-            diagnostic_reason=diagnostic
+            diagnostic_reason=diagnostic,
+            student_email=student.Student_Email
         )
         background_tasks.add_task(
             send_student_support,
@@ -158,16 +328,13 @@ async def analyze_student(student: StudentData, request: Request, background_tas
         )
         
     # Nivel 2: Riesgo Medio (Acción Preventiva)
-    elif risk_prob >= MEDIUM_RISK_THRESHOLD:
-        prediction_label = "Riesgo Medio"
-        diagnostic = "Monitoreo preventivo recomendado (Probabilidad: {:.1%})".format(risk_prob)
-        action_taken = "Acción: Emails PREVENTIVOS enviados"
-        
+    elif prediction_label == MEDIUM_RISK:
         background_tasks.add_task(
             send_teacher_medium_alert,
             student_name=student.Student_Name,
             teacher_email=student.Teacher_Email,
-            risk_prob=risk_prob
+            risk_prob=risk_prob,
+            student_email=student.Student_Email
         )
         background_tasks.add_task(
             send_student_medium_support,
@@ -175,22 +342,538 @@ async def analyze_student(student: StudentData, request: Request, background_tas
             student_email=student.Student_Email
         )
         
-    # Nivel 3: Bajo Riesgo (Solo Monitoreo)
-    else:
-        prediction_label = "Bajo Riesgo"
-        diagnostic = "N/A"
-        action_taken = "Acción: Monitoreo"
-    # --- FIN DE LA ACTUALIZACIÓN ---
+    # Nivel 3: Bajo Riesgo (Solo Monitoreo): sin emails
+
+
+def build_analysis(
+    student: StudentData,
+    risk_prob: float,
+    prediction_label: str,
+    action_taken: str,
+    diagnostic: str,
+    resource: str,
+    background_tasks: BackgroundTasks,
+    notify: bool = True,
+    explanation: Optional[list] = None
+) -> AnalysisResponse:
+    """
+    Programa los emails que corresponden al nivel de riesgo de UN estudiante
+    y arma su respuesta. Con notify=False solo arma la respuesta.
+    """
+    if notify:
+        schedule_notifications(student, risk_prob, prediction_label, diagnostic, resource, background_tasks)
 
-    # 6. Devolver la respuesta
     return AnalysisResponse(
         student_name=student.Student_Name,
         risk_probability=round(risk_prob, 4),
         prediction_label=prediction_label, # El dashboard ya no usa esto
         action_taken=action_taken,
-        diagnostic=diagnostic
+        diagnostic=diagnostic,
+        explanation=explanation
+    )
+
+
+def analyze_scored(
+    students: List[StudentData],
+    risk_probs: np.ndarray,
+    diag_rows: List[dict],
+    thresholds: dict,
+    background_tasks: BackgroundTasks,
+    previous_tiers: Optional[List[Optional[str]]] = None,
+    explanations: Optional[List[list]] = None
+) -> List[AnalysisResponse]:
+    """
+    Lógica de 3 niveles y diagnóstico para todo el lote (vectorizada en
+    api/rules.py), y luego acciones + respuesta por estudiante.
+    Con 'previous_tiers', solo se notifica a quienes cambiaron de nivel.
+    """
+    with timed("rules"):
+        labels, actions, diagnostics, resources = classify(risk_probs, columns_from_rows(diag_rows), thresholds)
+    count_tiers(labels)
+    with timed("actions"):
+        return [
+            build_analysis(
+                student, float(risk_probs[i]), labels[i], actions[i],
+                diagnostics[i], resources[i], background_tasks,
+                notify=previous_tiers is None or previous_tiers[i] != labels[i],
+                explanation=explanations[i] if explanations is not None else None
+            )
+            for i, student in enumerate(students)
+        ]
+
+
+def diff_chunk(store: ScoreStore, models: dict, chunk: List[StudentData]):
+    """Matriz cruda del bloque + diff_against_store (CPU y SQLite: corre fuera del event loop)."""
+    ids = [student_id(getattr(student, STUDENT_ID_FIELD)) for student in chunk]
+    with timed("to_matrix"):
+        raw = models["compiler"].raw_from_students(chunk)
+    fingerprints, previous, changed = diff_against_store(store, ids, raw, models["version"])
+    return ids, raw, fingerprints, previous, changed
+
+
+async def score_chunk_incremental(request: Request, models: dict, chunk: List[StudentData], cache):
+    """
+    Compara el bloque con el almacén de resultados y solo manda al modelo a los
+    estudiantes nuevos o cuyos datos (o el modelo) cambiaron; el resto reutiliza
+    su probabilidad y diagnóstico guardados.
+    Devuelve (probabilidades, diag_rows, niveles previos, estado para guardar).
+    """
+    ids, raw, fingerprints, previous, changed = await asyncio.to_thread(
+        diff_chunk, request.app.state.score_store, models, chunk
     )
 
+    risk_probs = np.array([p["risk_probability"] if p else np.nan for p in previous], dtype=np.float64)
+    diag_rows = [p["diag"] if p else None for p in previous]
+    if changed:
+        # Las filas que cambiaron se evalúan desde la misma matriz cruda (no se vuelve a armar)
+        probs, rows = await request.app.state.inference.run(score_raw, models, raw[changed], cache)
+        risk_probs[changed] = probs
+        for j, i in enumerate(changed):
+            diag_rows[i] = rows[j]
+    previous_tiers = [p["tier"] if p else None for p in previous]
+    return risk_probs, diag_rows, previous_tiers, (ids, fingerprints, len(changed))
+
+
+def job_notifications(key: str, student: StudentData, label: str, diagnostic: str, resource: str, risk_prob: float) -> list:
+    """Emails de UN estudiante de un trabajo: (llave de idempotencia, tipo, datos), mismos niveles que build_analysis."""
+    if label == HIGH_RISK:
+        items = [
+            ("teacher_alert", {"student_name": student.Student_Name, "teacher_email": student.Teacher_Email,
+                               "student_email": student.Student_Email, "diagnostic_reason": diagnostic}),
+            ("student_support", {"student_name": student.Student_Name, "student_email": student.Student_Email,
+                                 "support_resource": resource}),
+        ]
+    elif label == MEDIUM_RISK:
+        items = [
+            ("teacher_medium_alert", {"student_name": student.Student_Name, "teacher_email": student.Teacher_Email,
+                                      "student_email": student.Student_Email, "risk_prob": risk_prob}),
+            ("student_medium_support", {"student_name": student.Student_Name, "student_email": student.Student_Email}),
+        ]
+    else:
+        items = []
+    return [(f"{key}:{kind}", kind, payload) for kind, payload in items]
+
+
+def score_records(models: dict, records: List[dict], job_id: str, start: int, cache: Optional[PredictionCache] = None):
+    """
+    Evalúa un bloque de un trabajo (registros JSON sin validar). Las filas
+    inválidas quedan como resultado de error, sin cortar el resto del trabajo.
+    Devuelve (resultados, notificaciones) en el formato de JobStore.save_chunk.
+    """
+    results = [None] * len(records)
+    students, positions = [], []
+    for i, record in enumerate(records):
+        try:
+            students.append(StudentData.model_validate(record))
+            positions.append(i)
+        except ValidationError as e:
+            results[i] = {
+                "student_name": str(record.get("Student_Name") or "N/A"),
+                "risk_probability": 0, "prediction_label": "Error de Validación",
+                "action_taken": "N/A", "diagnostic": str(e),
+            }
+
+    notifications = []
+    if students:
+        risk_probs, diag_rows = score_students(models, students, cache)
+        with timed("rules"):
+            labels, actions, diagnostics, resources = classify(
+                risk_probs, columns_from_rows(diag_rows), models["thresholds"]
+            )
+        count_tiers(labels)
+        for j, (i, student) in enumerate(zip(positions, students)):
+            risk_prob = float(risk_probs[j])
+            results[i] = AnalysisResponse(
+                student_name=student.Student_Name,
+                risk_probability=round(risk_prob, 4),
+                prediction_label=labels[j],
+                action_taken=actions[j],
+                diagnostic=diagnostics[j]
+            ).model_dump(exclude_none=True)
+            notifications.extend(job_notifications(
+                f"{job_id}:{start + i}", student, labels[j], diagnostics[j], resources[j], risk_prob
+            ))
+    return results, notifications
+
+
+def parse_csv_records(body: bytes) -> List[dict]:
+    """CSV con las columnas de demo_data.csv -> registros JSON (celdas vacías -> null)."""
+    import io
+    import json
+
+    import pandas as pd
+
+    df = pd.read_csv(io.BytesIO(body))
+    return json.loads(df.to_json(orient="records"))
+
+
+def check_batch_size(n: int):
+    if n > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote tiene {n} estudiantes; el máximo permitido es {MAX_BATCH_SIZE}."
+        )
+
+
+def records_from_columns(columns: dict) -> List[dict]:
+    """Respuesta por columnas (RESULT_FIELDS -> listas) -> un dict por estudiante."""
+    return [dict(zip(RESULT_FIELDS, row)) for row in zip(*(columns[field] for field in RESULT_FIELDS))]
+
+
+def observe_decode(request: Request):
+    """Tiempo desde que llegó la petición hasta el endpoint: lectura del cuerpo + JSON + Pydantic."""
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        observe_stage("decode_validate", time.perf_counter() - received_at)
+
+
+# --- 5. El Endpoint de Predicción ---
+@app.post("/analyze_student", response_model=AnalysisResponse, response_model_exclude_none=True)
+async def analyze_student(
+    student: StudentData,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    explain: bool = False,
+    top_k: int = Query(EXPLAIN_TOP_K, ge=1, le=EXPLAIN_MAX_K)
+):
+    """
+    Recibe los datos de UN estudiante, analiza su riesgo y toma acciones.
+    Con 'explain=true' la respuesta incluye las 'top_k' features que más
+    pesaron en su predicción.
+    """
+    observe_decode(request)
+
+    # 1. Obtener el modelo y los umbrales vigentes (si se recarga el modelo
+    # mientras tanto, esta petición termina con la versión que tomó aquí; con el
+    # micro-batcher, con la versión que evaluó su lote)
+    models = request.app.state.models
+
+    # 2. Features + probabilidad de riesgo (o la predicción en caché)
+    # La inferencia corre en el pool de workers, fuera del event loop; con el
+    # micro-batcher se agrupa con otras peticiones que llegan al mismo tiempo
+    batcher = request.app.state.batcher
+    explanations = None
+    if explain:
+        risk_probs, diag_rows, explanations = await request.app.state.inference.run(
+            partial(score_students_explained, top_k=top_k), models, [student], request.app.state.prediction_cache
+        )
+    elif batcher is not None:
+        risk_prob, diag_row, models = await batcher.submit(student)
+        risk_probs, diag_rows = np.array([risk_prob]), [diag_row]
+    else:
+        risk_probs, diag_rows = await request.app.state.inference.run(
+            score_students, models, [student], request.app.state.prediction_cache
+        )
+
+    # 3. Lógica de 3 niveles, acciones y respuesta
+    return analyze_scored(
+        [student], risk_probs, diag_rows, models["thresholds"], background_tasks, explanations=explanations
+    )[0]
+
+
+# --- 6. El Endpoint de Predicción por Lotes ---
+@app.post("/analyze_students", response_model=List[AnalysisResponse], response_model_exclude_none=True)
+async def analyze_students(
+    students: List[StudentData],
+    request: Request,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    chunk_size: int = Query(BATCH_CHUNK_SIZE, ge=1, le=MAX_BATCH_SIZE),
+    incremental: bool = False,
+    explain: bool = False,
+    top_k: int = Query(EXPLAIN_TOP_K, ge=1, le=EXPLAIN_MAX_K)
+):
+    """
+    Recibe los datos de una cohorte completa y la analiza con llamadas
+    vectorizadas al modelo (una por bloque de 'chunk_size' estudiantes).
+    Devuelve una respuesta por estudiante, en el mismo orden de entrada.
+
+    Con 'incremental=true' solo se re-evalúa a los estudiantes cuyos datos
+    cambiaron desde la última carga (según STUDENT_ID_FIELD) y solo se notifica
+    a quienes cambiaron de nivel. Los encabezados X-Rows-Scored y X-Rows-Reused
+    indican cuántos se evaluaron y cuántos se reutilizaron.
+
+    Con 'explain=true' cada respuesta incluye las 'top_k' features que más
+    pesaron en la predicción (hasta EXPLAIN_MAX_ROWS estudiantes por petición;
+    no se combina con 'incremental').
+    """
+    observe_decode(request)
+    check_batch_size(len(students))
+    if explain and incremental:
+        raise HTTPException(status_code=400, detail="'explain' no se puede combinar con 'incremental'.")
+    if explain and len(students) > EXPLAIN_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Se pueden explicar hasta {EXPLAIN_MAX_ROWS} estudiantes por petición; el lote tiene {len(students)}."
+        )
+
+    models = request.app.state.models
+    cache = request.app.state.prediction_cache
+
+    results = []
+    scored = 0
+    # Procesamos por bloques para que la memoria quede acotada en cohortes grandes
+    for start in range(0, len(students), chunk_size):
+        chunk = students[start:start + chunk_size]
+        if explain:
+            risk_probs, diag_rows, explanations = await request.app.state.inference.run(
+                partial(score_students_explained, top_k=top_k), models, chunk, cache
+            )
+            results.extend(analyze_scored(
+                chunk, risk_probs, diag_rows, models["thresholds"], background_tasks, explanations=explanations
+            ))
+            scored += len(chunk)
+            continue
+        if not incremental:
+            risk_probs, diag_rows = await request.app.state.inference.run(score_students, models, chunk, cache)
+            results.extend(analyze_scored(chunk, risk_probs, diag_rows, models["thresholds"], background_tasks))
+            scored += len(chunk)
+            continue
+
+        risk_probs, diag_rows, previous_tiers, (ids, fingerprints, n_scored) = await score_chunk_incremental(
+            request, models, chunk, cache
+        )
+        analyses = analyze_scored(
+            chunk, risk_probs, diag_rows, models["thresholds"], background_tasks, previous_tiers
+        )
+        await asyncio.to_thread(request.app.state.score_store.upsert, [
+            (ids[i], fingerprints[i], models["version"], risk_probs[i], analysis.prediction_label, diag_rows[i])
+            for i, analysis in enumerate(analyses)
+        ])
+        results.extend(analyses)
+        scored += n_scored
+
+    response.headers["X-Rows-Scored"] = str(scored)
+    response.headers["X-Rows-Reused"] = str(len(students) - scored)
+    return results
+
+# --- 6b. Camino rápido para clientes internos (sin validación Pydantic, respuesta con orjson) ---
+async def score_decoded(request: Request, contacts: list, raw: np.ndarray, background_tasks: BackgroundTasks) -> dict:
+    """
+    Evalúa un lote ya decodificado (contactos + matriz cruda), programa los
+    emails y devuelve la respuesta por columnas (RESULT_FIELDS -> listas).
+    """
+    models = request.app.state.models
+    columns = {field: [] for field in RESULT_FIELDS}
+    for start in range(0, len(contacts), BATCH_CHUNK_SIZE):
+        chunk = slice(start, start + BATCH_CHUNK_SIZE)
+        risk_probs, diag_rows = await request.app.state.inference.run(
+            score_raw, models, raw[chunk], request.app.state.prediction_cache
+        )
+        with timed("rules"):
+            labels, actions, diagnostics, resources = classify(
+                risk_probs, columns_from_rows(diag_rows), models["thresholds"]
+            )
+        count_tiers(labels)
+        with timed("actions"):
+            chunk_contacts = contacts[chunk]
+            for i, contact in enumerate(chunk_contacts):
+                schedule_notifications(
+                    contact, float(risk_probs[i]), labels[i], diagnostics[i], resources[i], background_tasks
+                )
+            columns["student_name"].extend(contact.Student_Name for contact in chunk_contacts)
+            columns["risk_probability"].extend(np.round(risk_probs, 4).tolist())
+            columns["prediction_label"].extend(labels)
+            columns["action_taken"].extend(actions)
+            columns["diagnostic"].extend(diagnostics)
+    return columns
+
+
+async def analyze_fast(request: Request, background_tasks: BackgroundTasks, many: bool) -> Response:
+    if not INTERNAL_TOKEN or request.headers.get("x-internal-token") != INTERNAL_TOKEN:
+        raise HTTPException(status_code=403, detail="Token interno inválido o no configurado.")
+    body = await request.body()
+    try:
+        with timed("decode_fast"):
+            contacts, raw = decode_students(body, many)
+    except FastPathError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    check_batch_size(len(contacts))
+
+    columns = await score_decoded(request, contacts, raw, background_tasks)
+    results = records_from_columns(columns)
+    # Los BackgroundTasks se ejecutan después de enviar esta respuesta
+    return Response(dumps(results if many else results[0]), media_type="application/json", background=background_tasks)
+
+@app.post("/internal/analyze_student", response_model=AnalysisResponse)
+async def analyze_student_fast(request: Request, background_tasks: BackgroundTasks):
+    """
+    Igual que /analyze_student para clientes internos de confianza
+    (encabezado X-Internal-Token): el JSON va directo a la matriz del modelo.
+    """
+    return await analyze_fast(request, background_tasks, many=False)
+
+@app.post("/internal/analyze_students", response_model=List[AnalysisResponse])
+async def analyze_students_fast(request: Request, background_tasks: BackgroundTasks):
+    """Igual que /analyze_students (sin modo incremental) por el camino rápido."""
+    return await analyze_fast(request, background_tasks, many=True)
+
+# --- 6c. Lotes en formato columnar (Arrow IPC / Parquet) ---
+@app.post("/analyze_students/columnar", response_model=List[AnalysisResponse])
+async def analyze_students_columnar(request: Request, background_tasks: BackgroundTasks):
+    """
+    Igual que /analyze_students, pero el cuerpo es una tabla con las columnas
+    de demo_data.csv en Arrow IPC (Content-Type: application/vnd.apache.arrow.stream)
+    o Parquet (application/vnd.apache.parquet). Las columnas numéricas van
+    directo a la matriz del modelo, sin pasar por JSON ni Pydantic; los emails
+    se validan como en StudentData (un lote con filas inválidas responde 422).
+
+    Con 'Accept: application/vnd.apache.arrow.stream' la respuesta también es
+    un stream de Arrow IPC (una columna por campo); si no, JSON.
+    """
+    body = await request.body()
+    try:
+        with timed("decode_columnar"):
+            table = read_table(body, request.headers.get("content-type"))
+            check_batch_size(table.num_rows)
+            contacts = contacts_from_table(table)
+            raw = request.app.state.models["compiler"].raw_from_arrow(table)
+    except ColumnarUnsupported as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except FastPathError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except (TypeError, ValueError) as e:
+        # pyarrow.ArrowInvalid es un ValueError: columna del modelo no numérica
+        raise HTTPException(status_code=422, detail=f"Los campos del modelo deben ser numéricos o null: {e}")
+    del table
+
+    columns = await score_decoded(request, contacts, raw, background_tasks)
+    if wants_arrow(request.headers.get("accept")):
+        return Response(encode_results(columns), media_type=ARROW_STREAM, background=background_tasks)
+    return Response(dumps(records_from_columns(columns)), media_type="application/json", background=background_tasks)
+
+# --- 7. Trabajos asíncronos (cohortes grandes) ---
+async def create_job(request: Request, records: List[dict]) -> dict:
+    if not records:
+        raise HTTPException(status_code=400, detail="La cohorte está vacía.")
+    job = await asyncio.to_thread(request.app.state.job_store.create_job, records)
+    request.app.state.job_runner.notify()
+    return job
+
+@app.post("/jobs", status_code=202)
+async def submit_job(students: List[StudentData], request: Request):
+    """
+    Encola una cohorte (JSON) para analizarla en segundo plano.
+    Devuelve el id del trabajo para consultar su progreso y sus resultados.
+    """
+    return await create_job(request, [student.model_dump(mode="json") for student in students])
+
+@app.post("/jobs/csv", status_code=202)
+async def submit_job_csv(request: Request):
+    """
+    Encola una cohorte enviada como CSV (cuerpo de la petición, columnas de
+    demo_data.csv). Las filas inválidas aparecen como error en los resultados.
+    """
+    body = await request.body()
+    try:
+        records = await asyncio.to_thread(parse_csv_records, body)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo leer el CSV: {e}")
+    return await create_job(request, records)
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str, request: Request):
+    """Estado y progreso de un trabajo (queued | running | done | failed)."""
+    job = request.app.state.job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    return job
+
+@app.get("/jobs/{job_id}/results")
+def job_results(
+    job_id: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    """
+    Una página de resultados, en el orden de la cohorte. 'next_offset' es None
+    cuando no hay más resultados listos (el trabajo puede seguir corriendo).
+    """
+    store = request.app.state.job_store
+    job = store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    items = store.results_page(job_id, offset, limit)
+    next_offset = offset + len(items)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "offset": offset,
+        "items": items,
+        "next_offset": next_offset if next_offset < job["done"] else None,
+    }
+
+@app.get("/outbox/stats")
+def outbox_stats(request: Request):
+    """Emails de los trabajos por estado (pending | sending | sent | failed | suppressed)."""
+    return request.app.state.job_store.outbox_stats()
+
+@app.get("/config")
+def get_config(request: Request):
+    """Umbrales vigentes y su versión, y los límites de las explicaciones (el dashboard los lee de aquí)."""
+    models = request.app.state.models
+    return {
+        "version": models["version"],
+        "thresholds": models["thresholds"],
+        "explain": {"top_k": EXPLAIN_TOP_K, "max_k": EXPLAIN_MAX_K, "max_rows": EXPLAIN_MAX_ROWS},
+    }
+
+@app.get("/admin/model")
+def model_info(request: Request):
+    """Versión cargada, cantidad de recargas y último error de recarga."""
+    return request.app.state.registry.info()
+
+@app.post("/admin/reload")
+async def reload_model(request: Request, force: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """
+    Carga y calienta en segundo plano la versión del modelo/umbrales que está
+    en disco y la publica sin cortar las peticiones en curso.
+    Requiere el encabezado X-Admin-Token igual a ADMIN_TOKEN.
+    """
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Token de administración inválido o no configurado.")
+    try:
+        return await request.app.state.registry.reload(force=force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo recargar el modelo (se sigue usando el anterior): {e}")
+
+@app.get("/shadow/stats")
+def shadow_stats(request: Request):
+    """
+    Modelos en sombra: cola, lotes descartados y, por candidato, la diferencia
+    de probabilidad y los desacuerdos de nivel con el modelo principal.
+    Se evalúan todas las filas que puntúa el modelo principal (aciertos de caché
+    incluidos); los lotes se muestrean con SHADOW_SAMPLE_RATE y se descartan
+    enteros si la cola está llena (ver 'sample_rate' y 'dropped').
+    """
+    shadow = request.app.state.shadow
+    if shadow is None:
+        return {"enabled": False}
+    return {"enabled": True, **shadow.stats(), "comparison": shadow.log.summary()}
+
+@app.get("/inference/stats")
+def inference_stats(request: Request):
+    """Estado del pool de inferencia (ocupación y peticiones rechazadas)."""
+    return request.app.state.inference.stats()
+
+@app.get("/batcher/stats")
+def batcher_stats(request: Request):
+    """Histogramas de tamaño de lote y espera en cola del micro-batcher."""
+    batcher = request.app.state.batcher
+    return batcher.stats() if batcher is not None else {"enabled": False}
+
+@app.get("/cache/stats")
+def cache_stats(request: Request):
+    """Aciertos/fallos de la caché de predicciones."""
+    cache = request.app.state.prediction_cache
+    return cache.stats() if cache is not None else {"backend": "off"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Métricas en formato de texto de Prometheus (latencias por etapa, niveles, emails, cola, modelo)."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"status": "Agente de IA está activo y escuchando."}
\ No newline at end of file
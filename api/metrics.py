@@ -0,0 +1,363 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+
+class Histogram:
+    """
+    Histograma acumulativo con buckets fijos (mismo formato que Prometheus:
+    cada bucket cuenta las observaciones <= su límite superior).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = {}, 0
+        for bound, c in zip(self.buckets + [float("inf")], counts):
+            running += c
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {
+            "buckets": cumulative,
+            "sum": total,
+            "count": count,
+            "mean": total / count if count else 0.0,
+        }
+
+
+# --- Registro de métricas con salida en formato de texto de Prometheus ---
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Perfilador por muestreo: si una petición tarda más de PROFILE_SLOW_MS, se guardan
+# sus pilas en formato "folded" (flamegraph.pl / speedscope). 0 = desactivado
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/agente_profiles")
+
+LATENCY_BUCKETS_S = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+def _format_labels(label_names, values, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(label_names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Contador monótono, opcionalmente con etiquetas."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.label_names), 0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Gauge:
+    """Valor instantáneo. Con 'callback' se lee en el momento de exportar."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names=(), callback=None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value: float, **labels):
+        self._values[tuple(labels.get(name, "") for name in self.label_names)] = value
+
+    def clear(self):
+        self._values = {}
+
+    def render(self) -> list:
+        values = self._values
+        if self.callback is not None:
+            try:
+                values = {(): float(self.callback())}
+            except Exception:
+                return []
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in sorted(values.items())]
+
+
+class HistogramFamily:
+    """Histogramas (ver Histogram) separados por etiquetas, ej. una serie por etapa."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS_S, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.label_names = tuple(label_names)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def child(self, **labels) -> Histogram:
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        histogram = self._children.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._children.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, value: float, **labels):
+        self.child(**labels).observe(value)
+
+    def render(self) -> list:
+        lines = []
+        for key, histogram in sorted(self._children.items()):
+            snap = histogram.snapshot()
+            for bound, count in snap["buckets"].items():
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {snap['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {snap['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(HistogramFamily(
+    "agente_stage_seconds", "Duración de cada etapa del scoring.", label_names=("stage",)
+))
+REQUEST_SECONDS = REGISTRY.register(HistogramFamily(
+    "agente_request_seconds", "Latencia total de las peticiones HTTP.", label_names=("path",)
+))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "agente_requests_total", "Peticiones HTTP atendidas.", label_names=("path", "status")
+))
+STUDENTS_TOTAL = REGISTRY.register(Counter(
+    "agente_students_scored_total", "Estudiantes evaluados, por nivel de riesgo.", label_names=("tier",)
+))
+EMAILS_TOTAL = REGISTRY.register(Counter(
+    "agente_emails_total", "Emails procesados por el dispatcher.", label_names=("result",)
+))
+EMAIL_SEND_SECONDS = REGISTRY.register(HistogramFamily(
+    "agente_email_send_seconds", "Duración de cada envío SMTP (incluye reintentos)."
+))
+SHADOW_ROWS_TOTAL = REGISTRY.register(Counter(
+    "agente_shadow_rows_total", "Filas evaluadas en sombra por los modelos candidatos.",
+    label_names=("candidate", "result")
+))
+MODEL_INFO = REGISTRY.register(Gauge(
+    "agente_model_info", "Versión del modelo y umbral que se está sirviendo.", label_names=("version",)
+))
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+def timed(stage: str):
+    """
+    'with timed("predict"): ...' registra la duración del bloque en
+    agente_stage_seconds. Con METRICS_ENABLED=0 no hace nada.
+    """
+    return _StageTimer(stage) if METRICS_ENABLED else _NULL_TIMER
+
+
+def observe_stage(stage: str, seconds: float):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def count_tiers(labels):
+    """Suma los niveles de riesgo de un lote (arreglo de etiquetas) a STUDENTS_TOTAL."""
+    if not METRICS_ENABLED:
+        return
+    counts = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    for tier, count in counts.items():
+        STUDENTS_TOTAL.inc(count, tier=tier)
+
+
+# --- Perfilador por muestreo para peticiones lentas ---
+
+class SamplingProfiler:
+    """
+    Hilo que toma, cada 'interval_ms', la pila de todos los hilos
+    (sys._current_frames) y guarda las muestras recientes en un buffer circular.
+    Cuando una petición resulta lenta, se vuelcan las muestras de su ventana de
+    tiempo en formato "folded" (una línea 'f1;f2;f3 N' por pila distinta).
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, out_dir: str = PROFILE_DIR, max_samples: int = 20000):
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self._samples = deque(maxlen=max_samples)  # (instante, pila)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                # Los hilos inactivos (esperando trabajo) no aportan nada al flame graph
+                if stack and not stack[0].startswith(("wait ", "_worker ", "select ", "_run_once ")):
+                    self._samples.append((now, ";".join(reversed(stack))))
+
+    def dump(self, start: float, end: float, name: str):
+        """Escribe las muestras tomadas entre 'start' y 'end' (perf_counter). Devuelve la ruta o None."""
+        folded = {}
+        for at, stack in list(self._samples):
+            if start <= at <= end:
+                folded[stack] = folded.get(stack, 0) + 1
+        if not folded:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.folded")
+        with open(path, "w") as f:
+            for stack, count in sorted(folded.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_label(scope) -> str:
+    """Plantilla de la ruta resuelta (el router la deja en el scope al despachar)."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI (sin BaseHTTPMiddleware, para no agregar costo por petición):
+    mide la latencia total y cuenta las respuestas por ruta y código.
+    La ruta es la plantilla que resolvió el router (ej. /jobs/{job_id}); las
+    peticiones que no coinciden con ninguna se agrupan en "<unmatched>", para
+    que la cantidad de series no crezca con cada URL distinta.
+    Guarda en el scope el instante de llegada para que los endpoints puedan medir
+    cuánto tomó leer el cuerpo y validarlo ('decode_validate').
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler = None, slow_ms: float = PROFILE_SLOW_MS):
+        self.app = app
+        self.slow = slow_ms / 1000
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        scope.setdefault("state", {})["received_at"] = start
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            path = route_label(scope)
+            REQUEST_SECONDS.observe(elapsed, path=path)
+            REQUESTS_TOTAL.inc(path=path, status=str(status["code"]))
+            if self.profiler is not None and self.slow and elapsed >= self.slow:
+                raw_path = scope["path"]
+                dumped = self.profiler.dump(start, start + elapsed, raw_path.strip("/").replace("/", "_") or "root")
+                if dumped:
+                    print(f"Petición lenta ({elapsed * 1000:.0f} ms) en {raw_path}: perfil en {dumped}")
@@ -1,38 +1,81 @@
 import smtplib
 import os
+import queue
+import threading
+import time
 from email.message import EmailMessage
 from dotenv import load_dotenv
 
+from api.jobs import OutboxDeferred
+from api.metrics import EMAIL_SEND_SECONDS, EMAILS_TOTAL, METRICS_ENABLED
+
 # Carga las variables (EMAIL_USER, EMAIL_PASS) desde el archivo .env
 load_dotenv()
 
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+# Servidor SMTP (configurable para poder probar contra un servidor local, ej. aiosmtpd)
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_REQUIRE_AUTH = os.getenv("SMTP_REQUIRE_AUTH", "1") == "1"
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
-def send_email(to_email: str, subject: str, body: str) -> bool:
-    """
-    Función genérica para conectarse a Gmail y enviar un correo.
-    """
+# Pool de conexiones persistentes
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))          # conexiones (y envíos) simultáneos
+SMTP_MAX_PER_SESSION = int(os.getenv("SMTP_MAX_PER_SESSION", "100"))  # mensajes por sesión antes de reconectar
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "30"))  # segundos sin trabajo antes de cerrar la sesión
+SMTP_MAX_RETRIES = int(os.getenv("SMTP_MAX_RETRIES", "4"))
+SMTP_BACKOFF_BASE = float(os.getenv("SMTP_BACKOFF_BASE", "1.0"))  # segundos (se duplica en cada reintento)
+SMTP_BACKOFF_MAX = 30.0
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+
+
+def _credentials_ok() -> bool:
     # Verifica que las credenciales se hayan cargado desde .env
-    if not EMAIL_USER or not EMAIL_PASS:
+    if SMTP_REQUIRE_AUTH and (not EMAIL_USER or not EMAIL_PASS):
         print("Error: Credenciales EMAIL_USER o EMAIL_PASS no están en .env")
         return False
+    return True
+
 
-    # Crear el objeto del mensaje
+def build_message(to_email: str, subject: str, body: str) -> EmailMessage:
+    """
+    Crea el objeto del mensaje con el remitente del agente.
+    """
     msg = EmailMessage()
     msg.set_content(body)
     msg['Subject'] = subject
     msg['From'] = f"Agente de IA Tecsup <{EMAIL_USER}>"
     msg['To'] = to_email
+    return msg
 
-    try:
-        # Conectarse al servidor SMTP de Gmail
-        print(f"Intentando enviar email a: {to_email}...")
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+
+def open_smtp_connection() -> smtplib.SMTP:
+    """
+    Abre una sesión SMTP autenticada (STARTTLS + login si corresponde).
+    """
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+    if SMTP_STARTTLS:
         server.starttls()  # Iniciar conexión segura
+    if EMAIL_USER and EMAIL_PASS:
         server.login(EMAIL_USER, EMAIL_PASS)
+    return server
+
+
+def send_email(to_email: str, subject: str, body: str) -> bool:
+    """
+    Función genérica para conectarse al servidor y enviar UN correo
+    (una sesión SMTP completa por mensaje). Las notificaciones del agente
+    usan el dispatcher de abajo; esta función queda para envíos sueltos.
+    """
+    if not _credentials_ok():
+        return False
+
+    msg = build_message(to_email, subject, body)
+
+    try:
+        print(f"Intentando enviar email a: {to_email}...")
+        server = open_smtp_connection()
         server.send_message(msg)
         server.quit()
         print(f"Email enviado exitosamente a: {to_email}")
@@ -41,25 +84,419 @@ def send_email(to_email: str, subject: str, body: str) -> bool:
         print(f"Error al enviar email: {e}")
         return False
 
-def send_teacher_alert(student_name: str, teacher_email: str, diagnostic_reason: str):
+
+def is_permanent_smtp_error(error: Exception) -> bool:
     """
-    Envía una alerta al profesor/tutor.
+    Errores que no se arreglan reintentando: destinatarios rechazados con 5xx,
+    cualquier respuesta 5xx del servidor o un mensaje que no se puede serializar.
+    Los 4xx, las desconexiones y los timeouts son transitorios.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return isinstance(error, (ValueError, TypeError, UnicodeError))
+
+
+class NotificationDispatcher:
+    """
+    Envía los emails en segundo plano a través de un pool pequeño de
+    conexiones SMTP persistentes.
+
+    - Cada worker (hilo) mantiene UNA sesión autenticada abierta y la reutiliza
+      para muchos mensajes (hasta SMTP_MAX_PER_SESSION o SMTP_IDLE_TIMEOUT).
+    - La concurrencia está acotada por el tamaño del pool.
+    - Los errores transitorios (4xx, desconexión, timeout) se reintentan con
+      backoff exponencial; si la conexión se perdió, se abre una sesión nueva.
+      Los permanentes (5xx, destinatario rechazado) fallan de inmediato sin
+      cerrar la sesión, que sigue sirviendo para los demás mensajes.
+    - Con la cola llena, el email se descarta (la API no debe bloquearse); los
+      scripts por lotes activan 'block_when_full' para esperar lugar en la cola.
+    """
+
+    _STOP = object()
+
+    def __init__(self, pool_size: int = SMTP_POOL_SIZE, max_queue: int = NOTIFY_QUEUE_SIZE):
+        self.pool_size = max(1, pool_size)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._workers = []
+        self._lock = threading.Lock()
+        self.block_when_full = False
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.pool_size):
+                worker = threading.Thread(target=self._run, name=f"smtp-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self, timeout: float = 30.0):
+        """Envía lo que queda en la cola y cierra las sesiones."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(self._STOP)
+        for worker in workers:
+            worker.join(timeout)
+
+    def join(self):
+        """Bloquea hasta que la cola quede vacía (útil en scripts y benchmarks)."""
+        self._queue.join()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    # --- API pública ---
+
+    def enqueue(self, msg: EmailMessage, on_result=None) -> bool:
+        """
+        Encola un mensaje para envío. Devuelve False si no se pudo encolar.
+        'on_result(ok: bool)' se llama (desde el worker) cuando termina el envío.
+        """
+        if not _credentials_ok():
+            return False
+        self.start()
+        try:
+            self._queue.put((msg, on_result), block=self.block_when_full)
+        except queue.Full:
+            print(f"Error: cola de notificaciones llena, se descarta el email a {msg['To']}")
+            with self._lock:
+                self.dropped += 1
+            EMAILS_TOTAL.inc(result="dropped")
+            return False
+        return True
+
+    # --- Worker ---
+
+    def _run(self):
+        server = None
+        sent_in_session = 0
+        while True:
+            try:
+                item = self._queue.get(timeout=SMTP_IDLE_TIMEOUT)
+            except queue.Empty:
+                # Sin trabajo: liberamos la sesión para no mantenerla abierta de más
+                server = self._close(server)
+                continue
+
+            if item is self._STOP:
+                self._close(server)
+                self._queue.task_done()
+                return
+
+            msg, on_result = item
+            if server is not None and sent_in_session >= SMTP_MAX_PER_SESSION:
+                server = self._close(server)
+
+            ok = False
+            send_start = time.perf_counter()
+            for attempt in range(SMTP_MAX_RETRIES + 1):
+                try:
+                    if server is None:
+                        server = open_smtp_connection()
+                        sent_in_session = 0
+                    server.send_message(msg)
+                    sent_in_session += 1
+                    ok = True
+                    break
+                except Exception as e:
+                    if is_permanent_smtp_error(e):
+                        print(f"Error permanente al enviar email a {msg['To']}: {e}")
+                        break
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        # Desconexión, timeout o error de red: la sesión ya no sirve
+                        server = self._close(server)
+                    if attempt == SMTP_MAX_RETRIES:
+                        print(f"Error al enviar email a {msg['To']} tras {attempt + 1} intentos: {e}")
+                        break
+                    time.sleep(min(SMTP_BACKOFF_BASE * 2 ** attempt, SMTP_BACKOFF_MAX))
+
+            with self._lock:
+                if ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            if METRICS_ENABLED:
+                EMAIL_SEND_SECONDS.observe(time.perf_counter() - send_start)
+                EMAILS_TOTAL.inc(result="sent" if ok else "failed")
+            if on_result is not None:
+                try:
+                    on_result(ok)
+                except Exception as e:
+                    print(f"Error en el callback de notificación: {e}")
+            self._queue.task_done()
+
+    @staticmethod
+    def _close(server):
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+        return None
+
+
+# Dispatcher compartido por toda la API (se inicia con el primer email)
+dispatcher = NotificationDispatcher()
+
+
+def enqueue_email(to_email: str, subject: str, body: str, on_result=None) -> bool:
+    """
+    Encola un email en el dispatcher compartido (no bloquea).
+    'on_result(ok)' se llama cuando termina el envío (ver NotificationDispatcher.enqueue).
+    """
+    return dispatcher.enqueue(build_message(to_email, subject, body), on_result=on_result)
+
+
+# --- Deduplicación y modo "digest" ---
+
+# Segundos durante los que NO se repite la misma alerta (estudiante, nivel, destinatario). 0 = desactivado
+NOTIFY_DEDUP_TTL = float(os.getenv("NOTIFY_DEDUP_TTL", str(24 * 3600)))
+# Ventana (segundos) para agrupar las alertas de un mismo docente en UN email. 0 = desactivado
+NOTIFY_DIGEST_WINDOW = float(os.getenv("NOTIFY_DIGEST_WINDOW", "0"))
+
+
+class NotificationLedger:
     """
+    Registro en memoria de las notificaciones ya enviadas, con expiración (TTL).
+    Evita que re-ejecutar una cohorte vuelva a enviar las mismas alertas.
+
+    Cada alerta se identifica por (email del estudiante, nivel, destinatario).
+    'claim' la reserva mientras se envía (así dos peticiones simultáneas no la
+    duplican); solo 'confirm' (envío aceptado por el servidor SMTP) la bloquea
+    durante el TTL. Si el envío falla o no se pudo encolar, 'release' la libera.
+    """
+
+    def __init__(self, ttl: float = NOTIFY_DEDUP_TTL):
+        self.ttl = ttl
+        self._sent = {}         # llave -> momento en que expira
+        self._in_flight = set()  # llaves reservadas, con el envío en curso
+        self._lock = threading.Lock()
+        self._next_purge = 10000
+        self.suppressed = 0
+
+    @staticmethod
+    def key(student_email: str, tier: str, recipient: str) -> tuple:
+        return (str(student_email).strip().lower(), tier, str(recipient).strip().lower())
+
+    def claim(self, student_email: str, tier: str, recipient: str):
+        """
+        Reserva la alerta y devuelve su llave, o None si ya se envió dentro del
+        TTL o se está enviando (en ese caso se cuenta como suprimida).
+        """
+        key, _ = self.try_claim(student_email, tier, recipient)
+        return key
+
+    def try_claim(self, student_email: str, tier: str, recipient: str, count_in_flight: bool = True):
+        """
+        Como claim, pero devuelve (llave o None, estado): "claimed", "sent" (ya
+        enviada dentro del TTL) o "in_flight" (otro envío la tiene reservada y
+        todavía puede fallar). Con count_in_flight=False, "in_flight" no se
+        cuenta como suprimida (el llamador la reintenta).
+        """
+        key = self.key(student_email, tier, recipient)
+        if self.ttl <= 0:
+            return key, "claimed"
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._sent.get(key)
+            if expires_at is not None and expires_at > now:
+                self.suppressed += 1
+                return None, "sent"
+            if key in self._in_flight:
+                if count_in_flight:
+                    self.suppressed += 1
+                return None, "in_flight"
+            self._in_flight.add(key)
+        return key, "claimed"
+
+    def confirm(self, key: tuple):
+        """El envío se completó: la alerta queda bloqueada durante el TTL."""
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight.discard(key)
+            self._sent[key] = now + self.ttl
+            # Limpieza ocasional de entradas vencidas para que el registro no crezca sin límite
+            if len(self._sent) > self._next_purge:
+                self._sent = {k: v for k, v in self._sent.items() if v > now}
+                self._next_purge = max(10000, 2 * len(self._sent))
+
+    def release(self, key: tuple):
+        """El envío falló o no se encoló: la alerta se puede volver a intentar."""
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def settle(self, key: tuple, ok: bool):
+        """confirm o release según el resultado del envío (callback del dispatcher)."""
+        if ok:
+            self.confirm(key)
+        else:
+            self.release(key)
+
+    def clear(self):
+        with self._lock:
+            self._sent.clear()
+            self._in_flight.clear()
+
+
+class TeacherDigest:
+    """
+    Agrupa las alertas dirigidas a un mismo docente durante NOTIFY_DIGEST_WINDOW
+    segundos y las envía en UN solo email, armado con las mismas plantillas.
+    Un solo hilo revisa los digest vencidos (no un temporizador por docente).
+    """
+
+    def __init__(self, window: float = NOTIFY_DIGEST_WINDOW):
+        self.window = window
+        self._pending = {}  # teacher_email -> [(asunto, detalle, llave del registro), ...]
+        self._due = {}      # teacher_email -> momento en que se envía su digest
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flusher = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, teacher_email: str, subject: str, details: str, ledger_key: tuple = None) -> bool:
+        with self._lock:
+            self._pending.setdefault(teacher_email, []).append((subject, details, ledger_key))
+            if teacher_email not in self._due:
+                self._due[teacher_email] = time.monotonic() + self.window
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="teacher-digest", daemon=True)
+                self._flusher.start()
+            self._wakeup.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = [teacher for teacher, at in self._due.items() if at <= now]
+                if not due:
+                    next_at = min(self._due.values(), default=None)
+                    self._wakeup.wait(None if next_at is None else next_at - now)
+                    continue
+            for teacher_email in due:
+                self.flush(teacher_email)
+
+    def flush(self, teacher_email: str) -> bool:
+        with self._lock:
+            items = self._pending.pop(teacher_email, [])
+            self._due.pop(teacher_email, None)
+        if not items:
+            return False
+        keys = [key for _, _, key in items if key is not None]
+
+        def on_result(ok: bool):
+            for key in keys:
+                ledger.settle(key, ok)
+
+        if len(items) == 1:
+            subject, details, _ = items[0]
+            body = TEACHER_GREETING + details + TEACHER_SIGNATURE
+        else:
+            subject = f"Alerta de IA: {len(items)} estudiantes requieren su atención"
+            sections = "".join(
+                f"--- {i}. {item_subject} ---\n{details}" for i, (item_subject, details, _) in enumerate(items, 1)
+            )
+            body = (
+                TEACHER_GREETING
+                + f"Nuestro agente de IA generó {len(items)} alertas para sus estudiantes:\n\n"
+                + sections
+                + TEACHER_SIGNATURE
+            )
+        if enqueue_email(teacher_email, subject, body, on_result=on_result):
+            return True
+        on_result(False)
+        return False
+
+    def flush_all(self):
+        with self._lock:
+            recipients = list(self._pending)
+        for teacher_email in recipients:
+            self.flush(teacher_email)
+
+
+ledger = NotificationLedger()
+digest = TeacherDigest()
+
+
+def flush_notifications(wait: bool = False):
+    """
+    Envía los digest pendientes y espera a que el dispatcher termine (al apagar
+    la API). Con 'wait' espera a que se envíe toda la cola, sin límite de tiempo.
+    """
+    digest.flush_all()
+    if wait:
+        dispatcher.join()
+    dispatcher.stop()
+
+
+def _send_once(key: tuple, to_email: str, subject: str, body: str) -> bool:
+    """Encola el email; la alerta queda registrada solo si el servidor SMTP lo acepta."""
+    if enqueue_email(to_email, subject, body, on_result=lambda ok: ledger.settle(key, ok)):
+        return True
+    ledger.release(key)
+    return False
+
+
+def _notify_teacher(student_email: str, tier: str, teacher_email: str, subject: str, details: str) -> bool:
+    key = ledger.claim(student_email, tier, teacher_email)
+    if key is None:
+        return False
+    if digest.enabled:
+        return digest.add(teacher_email, subject, details, ledger_key=key)
+    return _send_once(key, teacher_email, subject, TEACHER_GREETING + details + TEACHER_SIGNATURE)
+
+
+def _notify_student(student_email: str, tier: str, subject: str, body: str) -> bool:
+    key = ledger.claim(student_email, tier, student_email)
+    if key is None:
+        return False
+    return _send_once(key, student_email, subject, body)
+
+
+# --- Plantillas ---
+
+TEACHER_GREETING = "Estimado docente,\n\n"
+TEACHER_SIGNATURE = (
+    f"Atentamente,\n"
+    f"Agente de Retención Estudiantil Tecsup"
+)
+
+
+def teacher_alert_content(student_name: str, diagnostic_reason: str):
     subject = f"Alerta de IA: Riesgo de deserción detectado para {student_name}"
-    body = (
-        f"Estimado docente,\n\n"
+    details = (
         f"Nuestro agente de IA ha identificado que el estudiante {student_name} presenta un alto riesgo de deserción.\n\n"
         f"**Diagnóstico Principal:** {diagnostic_reason}.\n\n"
         f"Se sugiere contactar al estudiante para una intervención oportuna y ofrecerle apoyo académico.\n\n"
-        f"Atentamente,\n"
-        f"Agente de Retención Estudiantil Tecsup"
     )
-    return send_email(teacher_email, subject, body)
+    return subject, details
 
-def send_student_support(student_name: str, student_email: str, support_resource: str):
-    """
-    Envía un correo de apoyo al estudiante.
-    """
+
+def teacher_medium_alert_content(student_name: str, risk_prob: float):
+    subject = f"Aviso de IA: Monitoreo preventivo para {student_name}"
+    details = (
+        f"Nuestro agente de IA ha identificado que el estudiante {student_name} presenta un **Riesgo Medio** de deserción (Probabilidad: {risk_prob:.1%}).\n\n"
+        f"No se requiere una acción urgente, pero se recomienda un seguimiento preventivo en las próximas semanas para asegurar su progreso.\n\n"
+    )
+    return subject, details
+
+
+def student_support_content(student_name: str, support_resource: str):
     subject = f"¡Hola {student_name}! Tenemos nuevos recursos de apoyo para ti"
     body = (
         f"¡Hola {student_name}!\n\n"
@@ -70,29 +507,10 @@ def send_student_support(student_name: str, student_email: str, support_resource
         f"Atentamente,\n"
         f"Tu Asistente Académico IA"
     )
-    return send_email(student_email, subject, body)
-
+    return subject, body
 
-# --- AÑADIR ESTAS DOS NUEVAS FUNCIONES AL FINAL DEL ARCHIVO ---
 
-def send_teacher_medium_alert(student_name: str, teacher_email: str, risk_prob: float):
-    """
-    Envía una alerta PREVENTIVA al profesor/tutor para Riesgo Medio.
-    """
-    subject = f"Aviso de IA: Monitoreo preventivo para {student_name}"
-    body = (
-        f"Estimado docente,\n\n"
-        f"Nuestro agente de IA ha identificado que el estudiante {student_name} presenta un **Riesgo Medio** de deserción (Probabilidad: {risk_prob:.1%}).\n\n"
-        f"No se requiere una acción urgente, pero se recomienda un seguimiento preventivo en las próximas semanas para asegurar su progreso.\n\n"
-        f"Atentamente,\n"
-        f"Agente de Retención Estudiantil Tecsup"
-    )
-    return send_email(teacher_email, subject, body)
-
-def send_student_medium_support(student_name: str, student_email: str):
-    """
-    Envía un correo de apoyo "ligero" al estudiante para Riesgo Medio.
-    """
+def student_medium_support_content(student_name: str):
     subject = f"¡Hola {student_name}! Recursos de apoyo disponibles"
     body = (
         f"¡Hola {student_name}!\n\n"
@@ -103,4 +521,76 @@ def send_student_medium_support(student_name: str, student_email: str):
         f"Atentamente,\n"
         f"Tu Asistente Académico IA"
     )
-    return send_email(student_email, subject, body)
\ No newline at end of file
+    return subject, body
+
+
+# --- Notificaciones del agente ---
+
+def send_teacher_alert(student_name: str, teacher_email: str, diagnostic_reason: str, student_email: str):
+    """
+    Envía una alerta al profesor/tutor.
+    'student_email' identifica al estudiante en la deduplicación (los nombres se repiten).
+    """
+    subject, details = teacher_alert_content(student_name, diagnostic_reason)
+    return _notify_teacher(student_email, "Alto Riesgo", teacher_email, subject, details)
+
+def send_student_support(student_name: str, student_email: str, support_resource: str):
+    """
+    Envía un correo de apoyo al estudiante.
+    """
+    subject, body = student_support_content(student_name, support_resource)
+    return _notify_student(student_email, "Alto Riesgo", subject, body)
+
+def send_teacher_medium_alert(student_name: str, teacher_email: str, risk_prob: float, student_email: str):
+    """
+    Envía una alerta PREVENTIVA al profesor/tutor para Riesgo Medio.
+    """
+    subject, details = teacher_medium_alert_content(student_name, risk_prob)
+    return _notify_teacher(student_email, "Riesgo Medio", teacher_email, subject, details)
+
+def send_student_medium_support(student_name: str, student_email: str):
+    """
+    Envía un correo de apoyo "ligero" al estudiante para Riesgo Medio.
+    """
+    subject, body = student_medium_support_content(student_name)
+    return _notify_student(student_email, "Riesgo Medio", subject, body)
+
+
+
+# --- Notificaciones durables (bandeja de salida de los trabajos, ver api/jobs.py) ---
+
+def notification_message(kind: str, payload: dict):
+    """
+    Arma el email de una notificación guardada en la bandeja de salida.
+    Devuelve (mensaje, on_result) o None si la deduplicación la suprime (ya se
+    envió); si la misma alerta se está enviando por otro camino, lanza
+    OutboxDeferred para que la bandeja de salida la reintente.
+    'on_result(ok)' registra la alerta solo si el envío se completó; si falló,
+    la libera y el reintento de la bandeja de salida la vuelve a reservar.
+    """
+    student_name = payload["student_name"]
+    student_email = payload["student_email"]
+    if kind == "teacher_alert":
+        tier, to_email = "Alto Riesgo", payload["teacher_email"]
+        subject, details = teacher_alert_content(student_name, payload["diagnostic_reason"])
+        body = TEACHER_GREETING + details + TEACHER_SIGNATURE
+    elif kind == "student_support":
+        tier, to_email = "Alto Riesgo", payload["student_email"]
+        subject, body = student_support_content(student_name, payload["support_resource"])
+    elif kind == "teacher_medium_alert":
+        tier, to_email = "Riesgo Medio", payload["teacher_email"]
+        subject, details = teacher_medium_alert_content(student_name, payload["risk_prob"])
+        body = TEACHER_GREETING + details + TEACHER_SIGNATURE
+    elif kind == "student_medium_support":
+        tier, to_email = "Riesgo Medio", payload["student_email"]
+        subject, body = student_medium_support_content(student_name)
+    else:
+        raise ValueError(f"Tipo de notificación desconocido: {kind}")
+
+    key, state = ledger.try_claim(student_email, tier, to_email, count_in_flight=False)
+    if state == "in_flight":
+        # Si ese otro envío falla, esta entrada es la que tiene que llegar: se reintenta más tarde
+        raise OutboxDeferred(f"{kind} para {to_email} ya se está enviando")
+    if key is None:
+        return None
+    return build_message(to_email, subject, body), lambda ok: ledger.settle(key, ok)
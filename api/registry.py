@@ -0,0 +1,135 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from api.cache import file_fingerprint
+from api.features import RAW_FIELDS
+from api.loader import MODEL_PATH, THRESHOLD_PATH, THRESHOLDS_CONFIG_PATH, load_models, model_files, set_lgbm_threads
+
+# --- Configuración (variables de entorno) ---
+# Cada cuántos segundos se revisa si cambiaron el modelo o los umbrales en disco. 0 = sin vigilancia
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "10"))
+# Filas sintéticas con las que se "calienta" un modelo recién cargado antes de publicarlo
+MODEL_WARMUP_ROWS = int(os.getenv("MODEL_WARMUP_ROWS", "256"))
+
+
+def warm_up(models: dict, rows: int = MODEL_WARMUP_ROWS):
+    """Primera predicción fuera del camino de las peticiones (inicializa LightGBM, cachés, etc.)."""
+    if rows > 0:
+        compiler = models["compiler"]
+        features = compiler.compile(np.zeros((rows, len(RAW_FIELDS))))
+        models["pipeline"].predict_proba(compiler.to_model_input(features))
+
+
+class ModelRegistry:
+    """
+    Mantiene la versión vigente del modelo + umbrales y permite recargarla
+    sin reiniciar el worker.
+
+    La carga y el calentamiento de la versión nueva corren en un hilo aparte;
+    cuando terminan, la referencia se reemplaza con una sola asignación. Las
+    peticiones en curso ya tomaron la referencia anterior y terminan con ella.
+    'on_swap(nuevo, anterior)' se llama después de cada reemplazo.
+    'prepare(nuevo)' (opcional) corre en el hilo de carga de cada recarga, antes
+    de publicar: ej. levantar y calentar los workers que van a servir la versión nueva.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, threshold_path: str = THRESHOLD_PATH,
+                 lgbm_threads: int = None, on_swap=None, prepare=None):
+        self.model_path = model_path
+        self.threshold_path = threshold_path
+        self.lgbm_threads = lgbm_threads
+        self.on_swap = on_swap
+        self.prepare = prepare
+        self.current = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.last_error = None
+        self._files_version = None
+        self._lock = asyncio.Lock()
+        self._watcher = None
+
+    @property
+    def watched_paths(self):
+        return (model_files(self.model_path), self.threshold_path, THRESHOLDS_CONFIG_PATH)
+
+    def _load_and_warm(self) -> dict:
+        files_version = file_fingerprint(*self.watched_paths)
+        models = load_models(self.model_path, self.threshold_path)
+        if self.lgbm_threads is not None:
+            set_lgbm_threads(models["pipeline"], self.lgbm_threads)
+        warm_up(models)
+        models["files_version"] = files_version
+        if self.prepare is not None and self.current is not None:
+            self.prepare(models)
+        return models
+
+    def load(self) -> dict:
+        """Carga inicial (bloqueante, al arrancar la API)."""
+        self._publish(self._load_and_warm())
+        return self.current
+
+    def _publish(self, models: dict):
+        previous = self.current
+        self.current = models
+        self._files_version = models["files_version"]
+        self.loaded_at = time.time()
+        if previous is not None:
+            self.reloads += 1
+        if self.on_swap is not None:
+            self.on_swap(models, previous)
+
+    async def reload(self, force: bool = False) -> dict:
+        """
+        Carga la versión en disco en segundo plano y la publica.
+        Sin 'force', no hace nada si los archivos no cambiaron.
+        """
+        async with self._lock:
+            if not force and file_fingerprint(*self.watched_paths) == self._files_version:
+                return {"reloaded": False, **self.info()}
+            try:
+                models = await asyncio.to_thread(self._load_and_warm)
+            except Exception as e:
+                # Se sigue sirviendo la versión anterior
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Error al recargar el modelo: {self.last_error}")
+                raise
+            self.last_error = None
+            self._publish(models)
+            print(f"Modelo recargado: versión {models['version']}.")
+            return {"reloaded": True, **self.info()}
+
+    # --- Vigilancia de la carpeta models/ ---
+
+    def start_watching(self, interval: float = MODEL_WATCH_INTERVAL):
+        if interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(interval))
+
+    async def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload()
+            except Exception:
+                pass  # ya quedó registrado en last_error; se reintenta en la siguiente vuelta
+
+    def info(self) -> dict:
+        models = self.current or {}
+        return {
+            "version": models.get("version"),
+            "thresholds": models.get("thresholds"),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,117 @@
+import numpy as np
+
+# --- Reglas de diagnóstico (Alto Riesgo), en orden de prioridad ---
+# Cada regla se evalúa como una máscara sobre todo el lote; gana la PRIMERA que
+# se cumple. 'default' es el valor que se asume si la feature no está disponible.
+# Para agregar una causa nueva basta con agregar una entrada aquí.
+DIAGNOSTIC_RULES = [
+    {
+        "cause": "mora",
+        "feature": "fe_mora_flag", "op": "==", "value": 1, "default": 0,
+        "diagnostic": "Alto riesgo detectado. Causa principal: **Mora en los pagos**.",
+        "resource": "Link a la Oficina de Bienestar Financiero para discutir opciones de pago.",
+    },
+    {
+        "cause": "baja_aprobacion_sem1",
+        "feature": "fe_pct_aprob_1", "op": "<", "value": 0.5, "default": 1,
+        "diagnostic": "Alto riesgo detectado. Causa principal: **Bajo rendimiento en el Semestre 1**.",
+        "resource": "Link al portal de Tutorías Académicas para reforzar cursos.",
+    },
+    {
+        "cause": "caida_notas",
+        "feature": "fe_delta_grade_2_1", "op": "<", "value": -2, "default": 0,
+        "diagnostic": "Alto riesgo detectado. Causa principal: **Caída notable en las notas** del Sem1 al Sem2.",
+        "resource": "Link para agendar una cita con Consejería Académica.",
+    },
+]
+
+FALLBACK_DIAGNOSTIC = {
+    "cause": "combinacion",
+    "diagnostic": "Alto riesgo detectado (combinación de factores).",
+    "resource": "Link al Manual de Bienestar Estudiantil y Apoyo Psicológico.",
+}
+
+OPERATORS = {
+    "==": np.equal,
+    "!=": np.not_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+
+# --- Niveles de riesgo, del más alto al más bajo ---
+# 'threshold' es el nombre del umbral (se resuelve con los umbrales vigentes).
+HIGH_RISK = "Alto Riesgo"
+MEDIUM_RISK = "Riesgo Medio"
+LOW_RISK = "Bajo Riesgo"
+
+TIERS = [
+    {"label": HIGH_RISK, "threshold": "high", "action": "Acción: Emails de ALERTA enviados"},
+    {"label": MEDIUM_RISK, "threshold": "medium", "action": "Acción: Emails PREVENTIVOS enviados"},
+]
+LOWEST_TIER = {"label": LOW_RISK, "action": "Acción: Monitoreo"}
+
+
+def assign_tiers(risk_probs: np.ndarray, thresholds: dict) -> np.ndarray:
+    """Nivel de riesgo de cada estudiante (la primera regla de TIERS que se cumple)."""
+    risk_probs = np.asarray(risk_probs, dtype=np.float64)
+    conditions = [risk_probs >= thresholds[tier["threshold"]] for tier in TIERS]
+    return np.select(conditions, [tier["label"] for tier in TIERS], default=LOWEST_TIER["label"]).astype(object)
+
+
+def tier_actions(labels: np.ndarray) -> np.ndarray:
+    """Texto de la acción tomada para cada nivel."""
+    actions = {tier["label"]: tier["action"] for tier in TIERS}
+    actions[LOWEST_TIER["label"]] = LOWEST_TIER["action"]
+    return np.array([actions[label] for label in labels], dtype=object)
+
+
+def columns_from_rows(rows: list) -> dict:
+    """Lista de dicts {feature: valor} (una por estudiante) -> columnas NumPy."""
+    names = {rule["feature"] for rule in DIAGNOSTIC_RULES}
+    return {
+        name: np.array([row.get(name, np.nan) for row in rows], dtype=np.float64)
+        for name in names
+    }
+
+
+def evaluate_diagnostics(columns: dict, n: int):
+    """
+    Aplica DIAGNOSTIC_RULES a todo el lote.
+    'columns' mapea nombre de feature -> arreglo de n valores (NaN = no disponible).
+    Devuelve (diagnósticos, recursos) como arreglos de n textos.
+    """
+    conditions = []
+    for rule in DIAGNOSTIC_RULES:
+        values = columns.get(rule["feature"])
+        if values is None:
+            values = np.full(n, rule["default"], dtype=np.float64)
+        else:
+            values = np.where(np.isnan(values), rule["default"], values)
+        conditions.append(OPERATORS[rule["op"]](values, rule["value"]))
+
+    diagnostics = np.select(
+        conditions, [rule["diagnostic"] for rule in DIAGNOSTIC_RULES], default=FALLBACK_DIAGNOSTIC["diagnostic"]
+    ).astype(object)
+    resources = np.select(
+        conditions, [rule["resource"] for rule in DIAGNOSTIC_RULES], default=FALLBACK_DIAGNOSTIC["resource"]
+    ).astype(object)
+    return diagnostics, resources
+
+
+def classify(risk_probs: np.ndarray, columns: dict, thresholds: dict):
+    """
+    Lógica de 3 niveles para todo el lote, vectorizada.
+    Devuelve (niveles, acciones, diagnósticos, recursos).
+    """
+    n = len(risk_probs)
+    labels = assign_tiers(risk_probs, thresholds)
+    diagnostics, resources = evaluate_diagnostics(columns, n)
+
+    high = labels == HIGH_RISK
+    diagnostics[~high] = "N/A"
+    resources[~high] = ""
+    for i in np.flatnonzero(labels == MEDIUM_RISK):
+        diagnostics[i] = "Monitoreo preventivo recomendado (Probabilidad: {:.1%})".format(risk_probs[i])
+    return labels, tier_actions(labels), diagnostics, resources
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, TypeAdapter, ValidationError
+from typing import List, Optional
 
 # Este es el "molde" de los datos que SIMULAMOS recibir de la universidad
 # Se basa en las columnas de tu notebook + los campos de simulación
@@ -53,10 +53,29 @@ class StudentData(BaseModel):
     Inflation_rate: Optional[float] = None
     GDP: Optional[float] = None
 
+# Una feature y cuánto empuja la predicción (TreeSHAP, en log-odds; positivo = más riesgo)
+class FeatureContribution(BaseModel):
+    feature: str           # (Ej: "Curricular_units_2nd_sem_approved")
+    value: float           # Valor que vio el modelo
+    contribution: float
+
 # Este es el "molde" de la respuesta que nuestra API enviará
 class AnalysisResponse(BaseModel):
     student_name: str
     risk_probability: float
     prediction_label: str  # (Ej: "Alto Riesgo" o "Bajo Riesgo")
     action_taken: str      # (Ej: "Emails enviados" o "Monitoreo")
-    diagnostic: str        # (Ej: "Bajo rendimiento en Sem1")
\ No newline at end of file
+    diagnostic: str        # (Ej: "Bajo rendimiento en Sem1")
+    explanation: Optional[List[FeatureContribution]] = None  # Solo con ?explain=true
+
+_EMAIL = TypeAdapter(EmailStr)
+
+def valid_email(value) -> bool:
+    """Misma validación que EmailStr en StudentData, para datos que no pasan por el modelo Pydantic."""
+    if not isinstance(value, str):
+        return False  # NaN, None o celda vacía
+    try:
+        _EMAIL.validate_python(value)
+        return True
+    except ValidationError:
+        return False
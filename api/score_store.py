@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# --- Configuración (variables de entorno) ---
+SCORE_STORE_PATH = os.getenv("SCORE_STORE_PATH", "/tmp/agente_scores.sqlite")
+# Campo que identifica a un estudiante entre una carga y la siguiente
+STUDENT_ID_FIELD = os.getenv("STUDENT_ID_FIELD", "Student_Email")
+
+
+def student_id(value) -> str:
+    """Identificador estable (los emails se comparan sin mayúsculas ni espacios)."""
+    return str(value).strip().lower()
+
+
+def row_fingerprints(raw: np.ndarray) -> list:
+    """Huella de cada fila cruda (los campos que usa el modelo, None -> NaN)."""
+    raw = np.ascontiguousarray(raw, dtype=np.float64)
+    return [hashlib.sha256(row.tobytes()).hexdigest()[:32] for row in raw]
+
+
+class ScoreStore:
+    """
+    Último resultado conocido de cada estudiante, en un archivo SQLite local:
+    huella de sus datos, versión del modelo, probabilidad, nivel y las features
+    que usa el diagnóstico. Permite re-evaluar solo a quienes cambiaron.
+    """
+
+    def __init__(self, path: str = SCORE_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS student_scores ("
+            "student_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, model_version TEXT NOT NULL, "
+            "risk_probability REAL NOT NULL, tier TEXT NOT NULL, diag TEXT NOT NULL, updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (sqlite3 no permite compartirlas entre hilos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, ids: list) -> dict:
+        """student_id -> {fingerprint, model_version, risk_probability, tier, diag} de los que existen."""
+        found = {}
+        conn = self._conn()
+        unique = list(dict.fromkeys(ids))
+        # SQLite limita la cantidad de parámetros por consulta
+        for start in range(0, len(unique), 500):
+            part = unique[start:start + 500]
+            rows = conn.execute(
+                "SELECT student_id, fingerprint, model_version, risk_probability, tier, diag FROM student_scores "
+                f"WHERE student_id IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for sid, fingerprint, version, prob, tier, diag in rows:
+                found[sid] = {
+                    "fingerprint": fingerprint, "model_version": version,
+                    "risk_probability": prob, "tier": tier, "diag": json.loads(diag),
+                }
+        return found
+
+    def upsert(self, rows):
+        """rows: (student_id, fingerprint, model_version, probabilidad, nivel, diag_row)."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO student_scores "
+                "(student_id, fingerprint, model_version, risk_probability, tier, diag, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((sid, fp, version, float(prob), str(tier), json.dumps(diag), now)
+                 for sid, fp, version, prob, tier, diag in rows)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM student_scores").fetchone()[0]
+
+
+def diff_against_store(store: ScoreStore, ids: list, raw: np.ndarray, version: str):
+    """
+    Compara un lote con el almacén. Devuelve (huellas, resultados previos por
+    fila o None, índices que hay que volver a evaluar): cambió la huella, cambió
+    el modelo, o el estudiante es nuevo.
+    """
+    fingerprints = row_fingerprints(raw)
+    stored = store.lookup(ids)
+    previous, changed = [], []
+    for i, (sid, fp) in enumerate(zip(ids, fingerprints)):
+        prior = stored.get(sid)
+        previous.append(prior)
+        if prior is None or prior["fingerprint"] != fp or prior["model_version"] != version:
+            changed.append(i)
+    return fingerprints, previous, changed
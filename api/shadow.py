@@ -0,0 +1,275 @@
+"""
+Scoring en sombra: versiones candidatas del modelo (ej. el reentrenamiento del
+próximo período) evalúan el mismo tráfico que el modelo principal, sin afectar
+las respuestas ni las notificaciones.
+
+Después de cada predicción del modelo principal, la matriz de features ya
+calculada se encola (sin copiarla) para un hilo aparte que la evalúa con cada
+candidato y guarda en SQLite ambas probabilidades y niveles, para comparar
+offline. Las filas que salieron de la caché de predicciones llegan crudas y se
+compilan en ese mismo hilo. Para no sumar latencia a las peticiones:
+  - la cola es acotada y, si está llena, el lote se descarta (se cuenta);
+  - los candidatos usan pocos hilos de LightGBM (SHADOW_LGBM_THREADS);
+  - mientras el pool de inferencia principal está ocupado, el hilo espera.
+
+Hay un solo ShadowScorer, en el proceso de la API. En modo 'process' los
+workers de inferencia solo juntan sus lotes (ShadowCollector) y los devuelven
+con el resultado; el proceso principal los encola.
+"""
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from api.loader import THRESHOLD_PATH, load_models, set_lgbm_threads
+from api.metrics import SHADOW_ROWS_TOTAL
+from api.rules import assign_tiers
+
+# --- Configuración (variables de entorno) ---
+# Candidatos: "nombre=ruta_modelo[|ruta_umbral],..." (modelo .joblib o directorio compacto). Vacío = sin sombra
+SHADOW_MODELS = os.getenv("SHADOW_MODELS", "")
+SHADOW_LOG_PATH = os.getenv("SHADOW_LOG_PATH", "/tmp/agente_shadow.sqlite")
+# Lotes esperando evaluación en sombra; si se llena, los nuevos se descartan
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "64"))
+# Fracción de los lotes del modelo principal que se evalúan en sombra
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1.0"))
+SHADOW_LGBM_THREADS = int(os.getenv("SHADOW_LGBM_THREADS", "1"))
+# Cuánto puede esperar un lote a que el pool principal se desocupe antes de evaluarse igual
+SHADOW_MAX_DEFER_S = float(os.getenv("SHADOW_MAX_DEFER_S", "2.0"))
+
+
+def parse_candidates(spec: str) -> dict:
+    """'nombre=modelo[|umbral],...' -> {nombre: (ruta_modelo, ruta_umbral)}."""
+    candidates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, paths = entry.partition("=")
+        if not sep or not name or not paths:
+            raise ValueError(f"SHADOW_MODELS: se esperaba 'nombre=ruta_modelo[|ruta_umbral]', no '{entry}'.")
+        model_path, _, threshold_path = paths.partition("|")
+        candidates[name.strip()] = (model_path.strip(), threshold_path.strip() or THRESHOLD_PATH)
+    return candidates
+
+
+def _sampled(sample_rate: float) -> bool:
+    return sample_rate >= 1.0 or random.random() < sample_rate
+
+
+def shadow_item(primary: dict, primary_probs, features=None, feature_rows=None, raw=None, raw_rows=None) -> tuple:
+    """
+    Lo que necesita la evaluación en sombra de un lote del modelo principal:
+    las filas 'feature_rows' con la matriz ya compilada ('features') y las
+    'raw_rows' con la matriz cruda ('raw', ej. aciertos de caché).
+    """
+    return (primary["version"], primary["thresholds"], primary["compiler"].feature_names,
+            np.asarray(primary_probs), features, feature_rows, raw, raw_rows)
+
+
+class ShadowCollector:
+    """
+    En un proceso worker: guarda los lotes (ya muestreados) para devolverlos al
+    proceso principal, que es el único que carga los candidatos.
+    """
+
+    def __init__(self, sample_rate: float = SHADOW_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._items = []
+
+    def sampled(self) -> bool:
+        return _sampled(self.sample_rate)
+
+    def submit(self, primary: dict, primary_probs: np.ndarray, **rows):
+        self._items.append(shadow_item(primary, primary_probs, **rows))
+
+    def drain(self) -> list:
+        items, self._items = self._items, []
+        return items
+
+
+class ShadowLog:
+    """Predicciones en sombra, una fila por estudiante y candidato, en un archivo SQLite local."""
+
+    def __init__(self, path: str = SHADOW_LOG_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS shadow_scores ("
+            "created_at REAL NOT NULL, primary_version TEXT NOT NULL, candidate TEXT NOT NULL, "
+            "candidate_version TEXT NOT NULL, primary_prob REAL NOT NULL, candidate_prob REAL NOT NULL, "
+            "primary_tier TEXT NOT NULL, candidate_tier TEXT NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (sqlite3 no permite compartirlas entre hilos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, primary_version: str, candidate: str, candidate_version: str,
+               primary_probs, candidate_probs, primary_tiers, candidate_tiers):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO shadow_scores VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((now, primary_version, candidate, candidate_version, p, c, pt, ct)
+                 for p, c, pt, ct in zip(primary_probs, candidate_probs, primary_tiers, candidate_tiers))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def summary(self) -> list:
+        """Por candidato y versión: filas, diferencia media/máxima de probabilidad y desacuerdos de nivel."""
+        rows = self._conn().execute(
+            "SELECT candidate, candidate_version, primary_version, COUNT(*), "
+            "AVG(ABS(candidate_prob - primary_prob)), MAX(ABS(candidate_prob - primary_prob)), "
+            "SUM(candidate_tier != primary_tier) "
+            "FROM shadow_scores GROUP BY candidate, candidate_version, primary_version"
+        ).fetchall()
+        return [
+            {
+                "candidate": candidate, "candidate_version": version, "primary_version": primary_version,
+                "rows": n, "mean_abs_diff": mean_diff, "max_abs_diff": max_diff,
+                "tier_disagreements": disagreements, "disagreement_rate": disagreements / n if n else 0.0,
+            }
+            for candidate, version, primary_version, n, mean_diff, max_diff, disagreements in rows
+        ]
+
+
+class ShadowScorer:
+    """
+    Evalúa en sombra, en un hilo propio, los lotes que ya evaluó el modelo
+    principal. 'is_busy()' (opcional) indica que el pool principal está
+    ocupado: el hilo espera hasta SHADOW_MAX_DEFER_S antes de seguir.
+    """
+
+    def __init__(self, candidates: dict, log: ShadowLog, queue_size: int = SHADOW_QUEUE_SIZE,
+                 sample_rate: float = SHADOW_SAMPLE_RATE, is_busy=None):
+        self.candidates = candidates  # nombre -> dict de load_models
+        self.log = log
+        self.sample_rate = sample_rate
+        self.is_busy = is_busy
+        self.submitted = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self._stats_lock = threading.Lock()  # submit corre en varios hilos de inferencia
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(target=self._run, name="shadow-scoring", daemon=True)
+        self._thread.start()
+
+    def sampled(self) -> bool:
+        """Si el próximo lote se evalúa en sombra (SHADOW_SAMPLE_RATE); se consulta antes de submit."""
+        return _sampled(self.sample_rate)
+
+    def submit(self, primary: dict, primary_probs: np.ndarray, **rows):
+        """
+        Encola un lote ya evaluado por el modelo principal (nunca bloquea).
+        'rows' son las matrices de shadow_item; no se modifican después.
+        """
+        self.enqueue(shadow_item(primary, primary_probs, **rows))
+
+    def enqueue(self, item: tuple):
+        """Encola un lote armado con shadow_item (ej. devuelto por un worker de proceso)."""
+        n_rows = len(item[3])
+        try:
+            self._queue.put_nowait(item)
+            with self._stats_lock:
+                self.submitted += 1
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            SHADOW_ROWS_TOTAL.inc(n_rows, candidate="*", result="dropped")
+
+    def _wait_for_idle(self):
+        if self.is_busy is None:
+            return
+        deadline = time.monotonic() + SHADOW_MAX_DEFER_S
+        while self.is_busy() and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._wait_for_idle()
+            primary_version, thresholds, feature_names, primary_probs = item[:4]
+            primary_tiers = assign_tiers(primary_probs, thresholds)
+            for name, models in self.candidates.items():
+                try:
+                    features = self._candidate_matrix(models["compiler"], feature_names, len(primary_probs), *item[4:])
+                    self._score_candidate(name, models, primary_version, primary_tiers, features, primary_probs)
+                except Exception as e:
+                    with self._stats_lock:
+                        self.errors += 1
+                        self.last_error = f"{name}: {type(e).__name__}: {e}"
+                    SHADOW_ROWS_TOTAL.inc(len(primary_probs), candidate=name, result="error")
+
+    @staticmethod
+    def _candidate_matrix(compiler, feature_names, n, features, feature_rows, raw, raw_rows) -> np.ndarray:
+        """Matriz del candidato para todo el lote: la del modelo principal + las filas crudas compiladas aquí."""
+        if features is not None and compiler.feature_names != feature_names:
+            # La misma matriz; si el candidato espera otro orden de columnas, solo se reordena
+            index = {feature: j for j, feature in enumerate(feature_names)}
+            missing = [feature for feature in compiler.feature_names if feature not in index]
+            if missing:
+                raise ValueError(f"el candidato espera columnas que el modelo principal no calcula: {missing}")
+            features = features[:, [index[feature] for feature in compiler.feature_names]]
+        if raw is None:
+            return features
+        compiled = compiler.compile(raw)
+        if features is None:
+            return compiled
+        matrix = np.empty((n, compiled.shape[1]), dtype=compiled.dtype)
+        matrix[feature_rows] = features
+        matrix[raw_rows] = compiled
+        return matrix
+
+    def _score_candidate(self, name, models, primary_version, primary_tiers, features, primary_probs):
+        compiler = models["compiler"]
+        probs = models["pipeline"].predict_proba(compiler.to_model_input(features))[:, 1]
+        tiers = assign_tiers(probs, models["thresholds"])
+        self.log.record(primary_version, name, models["version"], primary_probs.tolist(), probs.tolist(),
+                        primary_tiers.tolist(), tiers.tolist())
+        SHADOW_ROWS_TOTAL.inc(len(probs), candidate=name, result="scored")
+        SHADOW_ROWS_TOTAL.inc(int(np.sum(tiers != primary_tiers)), candidate=name, result="tier_disagreement")
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=30)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            counters = {"submitted": self.submitted, "dropped": self.dropped,
+                        "errors": self.errors, "last_error": self.last_error}
+        return {
+            "candidates": {name: models["version"] for name, models in self.candidates.items()},
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            **counters,
+        }
+
+
+def create_shadow_scorer(spec: str = None, is_busy=None):
+    """Carga los candidatos de SHADOW_MODELS (o 'spec'). Sin candidatos devuelve None."""
+    candidates = parse_candidates(SHADOW_MODELS if spec is None else spec)
+    if not candidates:
+        return None
+    loaded = {}
+    for name, (model_path, threshold_path) in candidates.items():
+        models = load_models(model_path, threshold_path)
+        set_lgbm_threads(models["pipeline"], SHADOW_LGBM_THREADS)
+        loaded[name] = models
+        print(f"Modelo en sombra '{name}' cargado: versión {models['version']}.")
+    return ShadowScorer(loaded, ShadowLog(), is_busy=is_busy)
@@ -0,0 +1,114 @@
+"""
+Pico de memoria (RSS del proceso principal + workers) del scoring masivo
+(api.bulk_score) sobre una cohorte sintética grande, con el tamaño de bloque
+elegido a partir de un presupuesto de memoria.
+
+La cohorte se genera en un proceso aparte, para que su memoria no cuente en
+la medición. Termina con código 1 si el pico supera el límite.
+
+Uso:
+    python -m benchmarks.bulk_memory [--rows 5000000] [--memory-cap-mb 2048] [--workers N] [--format csv|parquet]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+
+from api import bulk_score
+from benchmarks.synthetic import write_cohort_csv
+
+PAGE_MB = os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def tree_rss_mb(root: int) -> float:
+    """RSS de 'root' y todos sus descendientes, leído de /proc (solo Linux)."""
+    children, rss = {}, {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/statm") as f:
+                rss[int(entry)] = int(f.read().split()[1]) * PAGE_MB
+        except (OSError, ValueError, IndexError):
+            continue  # el proceso terminó mientras se leía
+        children.setdefault(ppid, []).append(int(entry))
+    total, stack = 0.0, [root]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0.0)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+class PeakSampler(threading.Thread):
+    """Muestrea el RSS del árbol de procesos cada 'interval' segundos y guarda el máximo."""
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        root = os.getpid()
+        while not self._stop_event.is_set():
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(root))
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> float:
+        self._stop_event.set()
+        self.join()
+        return self.peak_mb
+
+
+def _write_input(path: str, rows: int, fmt: str):
+    write_cohort_csv(path + ".csv", rows)
+    if fmt == "parquet":
+        import pyarrow.csv
+        import pyarrow.parquet as pq
+
+        # CSV -> Parquet por streaming, sin cargar la cohorte entera
+        reader = pyarrow.csv.open_csv(path + ".csv")
+        with pq.ParquetWriter(path + ".parquet", reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--memory-cap-mb", type=float, default=2048)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "cohorte")
+        writer = multiprocessing.Process(target=_write_input, args=(base, args.rows, args.format))
+        writer.start()
+        writer.join()
+        if writer.exitcode != 0:
+            sys.exit("No se pudo generar la cohorte sintética.")
+        input_path = f"{base}.{args.format}"
+        output_path = os.path.join(tmp, f"resultados.{args.format}")
+
+        sampler = PeakSampler()
+        sampler.start()
+        summary = bulk_score.run(input_path, output_path, workers=args.workers,
+                                 memory_budget_mb=args.memory_cap_mb)
+        peak_mb = sampler.stop()
+
+    within = peak_mb <= args.memory_cap_mb
+    print(f"{summary['rows']} filas en {summary['seconds']} s -> {summary['rows_per_second']} filas/s "
+          f"(bloques de {summary['chunk_size']}, workers={args.workers or os.cpu_count()})")
+    print(f"Pico de RSS: {peak_mb:.0f} MB (límite {args.memory_cap_mb:.0f} MB) -> {'OK' if within else 'EXCEDIDO'}")
+    if not within:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Throughput (filas/s) del scoring masivo (api.bulk_score) sobre una cohorte
+sintética con el esquema de demo_data.csv.
+
+Uso:
+    python -m benchmarks.bulk_throughput [--rows 1000000] [--chunk-size 50000] [--workers N] [--format csv|parquet]
+"""
+import argparse
+import os
+import tempfile
+
+from api import bulk_score
+from benchmarks.synthetic import write_cohort_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = write_cohort_csv(os.path.join(tmp, "cohorte.csv"), args.rows)
+        if args.format == "parquet":
+            import pandas as pd
+            parquet_path = os.path.join(tmp, "cohorte.parquet")
+            pd.read_csv(input_path).to_parquet(parquet_path, index=False)
+            input_path = parquet_path
+        output_path = os.path.join(tmp, f"resultados.{args.format}")
+
+        summary = bulk_score.run(input_path, output_path, args.chunk_size, args.workers)
+
+    print(f"{summary['rows']} filas en {summary['seconds']} s -> {summary['rows_per_second']} filas/s "
+          f"(chunk={args.chunk_size}, workers={args.workers or os.cpu_count()})")
+    print(f"Niveles: {summary['tiers']}")
+
+
+if __name__ == "__main__":
+    main()
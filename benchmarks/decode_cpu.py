@@ -0,0 +1,85 @@
+"""
+CPU por petición del camino normal (/analyze_student[s], validación Pydantic)
+contra el camino rápido para clientes internos (/internal/..., JSON directo a
+la matriz y respuesta con orjson). La API corre en el mismo proceso (cliente
+ASGI) y se mide time.process_time, así que se cuenta el CPU de todo el proceso.
+
+Requiere: pip install httpx aiosmtpd orjson
+
+Uso:
+    python -m benchmarks.decode_cpu [--requests 2000] [--batch 100]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+INTERNAL_TOKEN = "benchmark"
+SMTP_HOST, SMTP_PORT = "127.0.0.1", 8028
+os.environ.update({
+    "INTERNAL_TOKEN": INTERNAL_TOKEN,
+    "SMTP_SERVER": SMTP_HOST,
+    "SMTP_PORT": str(SMTP_PORT),
+    "SMTP_STARTTLS": "0",
+    "SMTP_REQUIRE_AUTH": "0",
+    "EMAIL_USER": "",
+    "EMAIL_PASS": "",
+    # Sin caché ni micro-batching: cada petición pasa por el modelo por separado
+    "PREDICTION_CACHE_BACKEND": "off",
+    "MICROBATCH_ENABLED": "0",
+    "MODEL_WATCH_INTERVAL": "0",
+})
+
+import httpx  # noqa: E402
+from aiosmtpd.controller import Controller  # noqa: E402
+from aiosmtpd.handlers import Sink  # noqa: E402
+
+from benchmarks.load_test import build_payloads  # noqa: E402
+
+CASES = [
+    ("normal  /analyze_student ", "/analyze_student", False, {}),
+    ("rápido  /internal/analyze_student ", "/internal/analyze_student", False, {"X-Internal-Token": INTERNAL_TOKEN}),
+    ("normal  /analyze_students", "/analyze_students", True, {}),
+    ("rápido  /internal/analyze_students", "/internal/analyze_students", True, {"X-Internal-Token": INTERNAL_TOKEN}),
+]
+
+
+async def run(total: int, batch: int):
+    from api.main import app
+
+    payloads = build_payloads(total)
+    batches = [payloads[i:i + batch] for i in range(0, total, batch)]
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for label, path, many, headers in CASES:
+                bodies = batches if many else payloads
+                # Calentamiento
+                for body in bodies[:10]:
+                    (await client.post(path, json=body, headers=headers)).raise_for_status()
+                cpu_start, wall_start = time.process_time(), time.perf_counter()
+                for body in bodies:
+                    (await client.post(path, json=body, headers=headers)).raise_for_status()
+                cpu = time.process_time() - cpu_start
+                wall = time.perf_counter() - wall_start
+                unit = f"lote de {batch}" if many else "petición"
+                print(f"{label}: {cpu / len(bodies) * 1e6:10.0f} µs de CPU por {unit}  "
+                      f"({cpu / total * 1e6:7.0f} µs por estudiante, {total / wall:8.0f} estudiantes/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+    controller = Controller(Sink(), hostname=SMTP_HOST, port=SMTP_PORT)
+    controller.start()
+    try:
+        asyncio.run(run(args.requests, args.batch))
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Verifica que FeatureCompiler sea numéricamente idéntico a
+create_features + rename (el camino original de la API).
+
+Uso:
+    python -m benchmarks.feature_parity [--rows 5000] [--seed 0]
+"""
+import argparse
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from api.features import COLUMN_MAPPING, RAW_FIELDS, FeatureCompiler, create_features
+from api.schemas import StudentData
+
+MODEL_PATH = "models/dropout_lgbm_calibrated.joblib"
+
+
+def reference_matrix(df: pd.DataFrame, feature_names) -> np.ndarray:
+    """El camino original: create_features -> rename -> columnas del modelo."""
+    renamed = create_features(df).rename(columns=COLUMN_MAPPING, errors='ignore')
+    return renamed[list(feature_names)].to_numpy(dtype=np.float64)
+
+
+def random_cohort(n: int, seed: int) -> pd.DataFrame:
+    """
+    Cohorte aleatoria con los casos borde que importan: nulos, semestres sin
+    materias inscritas (0/0 y x/0), notas negativas y mora.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({field: rng.integers(0, 10, n).astype(float) for field in RAW_FIELDS})
+    for field in ["Curricular_units_1st_sem_grade", "Curricular_units_2nd_sem_grade",
+                  "Admission_grade", "Previous_qualification_grade", "GDP", "Inflation_rate"]:
+        df[field] = rng.normal(10, 6, n)
+    df["Tuition_fees_up_to_date"] = rng.integers(0, 2, n).astype(float)
+    # ~15% de valores nulos en cualquier columna
+    df = df.mask(rng.random(df.shape) < 0.15)
+    return df
+
+
+def to_students(records) -> list:
+    """Registros -> StudentData validados, como los recibe /analyze_students/."""
+    contact = {"Student_Name": "Estudiante", "Student_Email": "estudiante@example.com",
+               "Teacher_Email": "docente@example.com"}
+    return [StudentData(**{**contact, **{k: v for k, v in r.items() if v is not None}}) for r in records]
+
+
+def check(df: pd.DataFrame, compiler: FeatureCompiler, label: str) -> None:
+    expected = reference_matrix(df, compiler.feature_names)
+
+    from_frame = compiler.compile(compiler.raw_from_frame(df))
+    records = [{k: (None if pd.isna(v) else v) for k, v in row.items()} for row in df.to_dict(orient="records")]
+    from_records = compiler.compile(compiler.raw_from_records(records))
+    from_students = compiler.compile(compiler.raw_from_students(to_students(records)))
+
+    for name, got in [("raw_from_frame", from_frame), ("raw_from_records", from_records),
+                      ("raw_from_students", from_students)]:
+        if not np.array_equal(expected, got):
+            bad = np.argwhere(expected != got)[:5]
+            raise AssertionError(f"[{label}] {name} difiere de create_features en (fila, col): {bad.tolist()}")
+    print(f"[{label}] OK: {len(df)} filas x {len(compiler.feature_names)} columnas idénticas.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model = joblib.load(MODEL_PATH) if os.path.exists(MODEL_PATH) else None
+    compiler = FeatureCompiler.from_model(model)
+
+    check(pd.read_csv("demo_data.csv"), compiler, "demo_data.csv")
+    check(random_cohort(args.rows, args.seed), compiler, f"aleatorio seed={args.seed}")
+
+
+if __name__ == "__main__":
+    main()
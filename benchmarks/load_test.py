@@ -0,0 +1,97 @@
+"""
+Prueba de carga contra una API ya levantada: N peticiones a /analyze_student
+con C peticiones concurrentes. Reporta p50/p99 y peticiones por segundo,
+y también la latencia de '/' (health check) medida durante la carga.
+
+Para comparar antes/después, levantar la API con cada modo de inferencia:
+    INFERENCE_EXECUTOR=inline uvicorn api.main:app   # antes (en el event loop)
+    INFERENCE_EXECUTOR=thread uvicorn api.main:app   # después (pool de hilos)
+
+Requiere: pip install httpx
+
+Uso:
+    python -m benchmarks.load_test [--url http://127.0.0.1:8000] [--requests 2000] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+# Cada petición lleva datos distintos para que la caché de predicciones no influya
+NOISE_COLUMN = "Admission_grade"
+
+
+def build_payloads(n: int) -> list:
+    demo = pd.read_csv("demo_data.csv").to_dict(orient="records")
+    payloads = []
+    for i in range(n):
+        student = dict(demo[i % len(demo)])
+        student["Student_Name"] = f"Estudiante {i}"
+        student[NOISE_COLUMN] = float(student[NOISE_COLUMN]) + i * 1e-6
+        payloads.append(student)
+    return payloads
+
+
+def summarize(label: str, latencies: list, elapsed: float = None) -> str:
+    if not latencies:
+        return f"{label}: sin datos"
+    ms = np.array(latencies) * 1000
+    line = f"{label}: p50={np.percentile(ms, 50):7.1f} ms  p99={np.percentile(ms, 99):7.1f} ms"
+    if elapsed:
+        line += f"  {len(latencies) / elapsed:8.1f} req/s"
+    return line
+
+
+async def run(url: str, total: int, concurrency: int):
+    payloads = build_payloads(total)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, health_latencies = [], []
+    status_counts = {}
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def worker():
+            while not queue.empty():
+                payload = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.post("/analyze_student", json=payload)
+                latencies.append(time.perf_counter() - start)
+                status_counts[response.status_code] = status_counts.get(response.status_code, 0) + 1
+
+        async def health_probe(stop: asyncio.Event):
+            async with httpx.AsyncClient(base_url=url, timeout=60) as probe:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    await probe.get("/")
+                    health_latencies.append(time.perf_counter() - start)
+                    await asyncio.sleep(0.05)
+
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(health_probe(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe_task
+
+    print(summarize("/analyze_student", latencies, elapsed))
+    print(summarize("/ (health)       ", health_latencies))
+    print(f"Códigos de respuesta: {status_counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Mide la latencia de /analyze_student mientras se recarga el modelo en
+caliente (POST /admin/reload?force=true), con la API en el mismo proceso
+(cliente ASGI). Compara p50/p99 antes, durante y después de la recarga.
+
+Los emails van a un servidor SMTP local que los descarta.
+Requiere: pip install httpx aiosmtpd
+
+Uso:
+    python -m benchmarks.reload_latency [--requests 3000] [--concurrency 32] [--reloads 3]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+ADMIN_TOKEN = "benchmark"
+SMTP_HOST, SMTP_PORT = "127.0.0.1", 8027
+os.environ.update({
+    "ADMIN_TOKEN": ADMIN_TOKEN,
+    "SMTP_SERVER": SMTP_HOST,
+    "SMTP_PORT": str(SMTP_PORT),
+    "SMTP_STARTTLS": "0",
+    "SMTP_REQUIRE_AUTH": "0",
+    "EMAIL_USER": "",
+    "EMAIL_PASS": "",
+    # Sin caché: cada petición pasa por el modelo
+    "PREDICTION_CACHE_BACKEND": "off",
+    "MODEL_WATCH_INTERVAL": "0",
+})
+
+import httpx  # noqa: E402
+from aiosmtpd.controller import Controller  # noqa: E402
+from aiosmtpd.handlers import Sink  # noqa: E402
+
+from benchmarks.load_test import build_payloads, summarize  # noqa: E402
+
+
+async def run(total: int, concurrency: int, reloads: int):
+    from api.main import app
+
+    payloads = build_payloads(total)
+    samples = []  # (inicio, latencia)
+    reload_windows = []  # (inicio, fin)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for payload in payloads[:concurrency]:  # calentamiento
+                await client.post("/analyze_student", json=payload)
+
+            queue = asyncio.Queue()
+            for payload in payloads:
+                queue.put_nowait(payload)
+
+            async def worker():
+                while not queue.empty():
+                    payload = queue.get_nowait()
+                    start = time.perf_counter()
+                    response = await client.post("/analyze_student", json=payload)
+                    samples.append((start, time.perf_counter() - start))
+                    response.raise_for_status()
+
+            async def reloader():
+                # Recargas repartidas a lo largo de la corrida
+                for i in range(reloads):
+                    while len(samples) < total * (i + 1) / (reloads + 1):
+                        await asyncio.sleep(0.01)
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/admin/reload", params={"force": "true"}, headers={"X-Admin-Token": ADMIN_TOKEN}
+                    )
+                    response.raise_for_status()
+                    reload_windows.append((start, time.perf_counter()))
+
+            await asyncio.gather(reloader(), *(worker() for _ in range(concurrency)))
+
+    def in_reload(started_at: float, latency: float) -> bool:
+        return any(started_at <= end and started_at + latency >= start for start, end in reload_windows)
+
+    during = [lat for started_at, lat in samples if in_reload(started_at, lat)]
+    outside = [lat for started_at, lat in samples if not in_reload(started_at, lat)]
+    print(f"Recargas: {len(reload_windows)} (duración media "
+          f"{sum(end - start for start, end in reload_windows) / max(1, len(reload_windows)):.2f} s)")
+    print(summarize("sin recarga     ", outside))
+    print(summarize("durante recarga ", during))
+    print(summarize("total           ", [lat for _, lat in samples]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--reloads", type=int, default=3)
+    args = parser.parse_args()
+    controller = Controller(Sink(), hostname=SMTP_HOST, port=SMTP_PORT)
+    controller.start()
+    try:
+        asyncio.run(run(args.requests, args.concurrency, args.reloads))
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Costo del scoring en sombra sobre la latencia del modelo principal: corre la
+misma carga contra /analyze_student (cliente ASGI en el mismo proceso) sin
+candidatos y con SHADOW_MODELS apuntando a un candidato (por defecto, el
+mismo modelo), cada corrida en un proceso aparte. Compara p50/p99 y termina
+con código 1 si el p99 sube más que --max-p99-increase.
+
+Los emails van a un servidor SMTP local que los descarta.
+Requiere: pip install httpx aiosmtpd
+
+Uso:
+    python -m benchmarks.shadow_overhead [--requests 5000] [--concurrency 32] [--candidate RUTA]
+                                         [--max-p99-increase 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SMTP_HOST, SMTP_PORT = "127.0.0.1", 8029
+BENCH_ENV = {
+    "SMTP_SERVER": SMTP_HOST,
+    "SMTP_PORT": str(SMTP_PORT),
+    "SMTP_STARTTLS": "0",
+    "SMTP_REQUIRE_AUTH": "0",
+    "EMAIL_USER": "",
+    "EMAIL_PASS": "",
+    # Sin caché: cada petición pasa por el modelo (y por la sombra)
+    "PREDICTION_CACHE_BACKEND": "off",
+    "NOTIFY_DEDUP_TTL": "0",
+    "MODEL_WATCH_INTERVAL": "0",
+}
+
+
+async def measure(total: int, concurrency: int) -> dict:
+    """Una corrida (dentro del proceso hijo): latencias de /analyze_student."""
+    import httpx
+
+    from api.main import app
+    from benchmarks.load_test import build_payloads
+
+    payloads = build_payloads(total)
+    latencies = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for payload in payloads[:concurrency]:  # calentamiento
+                await client.post("/analyze_student", json=payload)
+
+            queue = asyncio.Queue()
+            for payload in payloads:
+                queue.put_nowait(payload)
+
+            async def worker():
+                while not queue.empty():
+                    payload = queue.get_nowait()
+                    start = time.perf_counter()
+                    response = await client.post("/analyze_student", json=payload)
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            shadow = (await client.get("/shadow/stats")).json()
+    return {"latencies": latencies, "elapsed": elapsed, "shadow": shadow}
+
+
+def run_child(shadow_spec: str, total: int, concurrency: int, log_path: str) -> dict:
+    env = {**os.environ, **BENCH_ENV, "SHADOW_MODELS": shadow_spec, "SHADOW_LOG_PATH": log_path}
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.shadow_overhead", "--child",
+         "--requests", str(total), "--concurrency", str(concurrency)],
+        env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--candidate", default=None, help="Modelo candidato (por defecto, el mismo modelo principal)")
+    parser.add_argument("--max-p99-increase", type=float, default=0.05)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args.requests, args.concurrency))))
+        return
+
+    import numpy as np
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.handlers import Sink
+
+    from api.loader import MODEL_PATH
+    from benchmarks.load_test import summarize
+
+    candidate = args.candidate or MODEL_PATH
+    controller = Controller(Sink(), hostname=SMTP_HOST, port=SMTP_PORT)
+    controller.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = os.path.join(tmp, "shadow.sqlite")
+            baseline = run_child("", args.requests, args.concurrency, log_path)
+            shadowed = run_child(f"candidato={candidate}", args.requests, args.concurrency, log_path)
+    finally:
+        controller.stop()
+
+    print(summarize("sin sombra ", baseline["latencies"], baseline["elapsed"]))
+    print(summarize("con sombra ", shadowed["latencies"], shadowed["elapsed"]))
+    stats = shadowed["shadow"]
+    print(f"Sombra: {stats.get('submitted', 0)} lotes evaluados, {stats.get('dropped', 0)} descartados, "
+          f"{stats.get('errors', 0)} errores")
+    for row in stats.get("comparison", []):
+        print(f"  {row['candidate']}: {row['rows']} filas, diferencia media {row['mean_abs_diff']:.4f}, "
+              f"desacuerdos de nivel {row['disagreement_rate']:.2%}")
+
+    p99_base = float(np.percentile(baseline["latencies"], 99))
+    p99_shadow = float(np.percentile(shadowed["latencies"], 99))
+    increase = (p99_shadow - p99_base) / p99_base if p99_base else 0.0
+    print(f"p99: {p99_base * 1000:.1f} ms -> {p99_shadow * 1000:.1f} ms ({increase:+.1%}, "
+          f"tolerado {args.max_p99_increase:+.0%})")
+    if increase > args.max_p99_increase:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compara el envío de emails "una sesión SMTP por mensaje" (send_email)
+contra el NotificationDispatcher con conexiones persistentes.
+
+Levanta un servidor SMTP local que descarta los mensajes (aiosmtpd),
+así que no envía nada real. Requiere: pip install aiosmtpd
+
+Uso:
+    python -m benchmarks.smtp_throughput [--messages 500] [--pool-size 2]
+"""
+import argparse
+import os
+import time
+
+HOST, PORT = "127.0.0.1", 8025
+
+# La configuración SMTP se lee al importar api.notifications
+os.environ.update({
+    "SMTP_SERVER": HOST,
+    "SMTP_PORT": str(PORT),
+    "SMTP_STARTTLS": "0",
+    "SMTP_REQUIRE_AUTH": "0",
+    "EMAIL_USER": "",
+    "EMAIL_PASS": "",
+})
+
+from aiosmtpd.controller import Controller  # noqa: E402
+from aiosmtpd.handlers import Sink  # noqa: E402
+
+from api import notifications  # noqa: E402
+
+
+def bench_one_session_per_message(n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        notifications.send_email(f"docente{i}@example.com", "Benchmark", "Cuerpo de prueba")
+    return n / (time.perf_counter() - start)
+
+
+def bench_dispatcher(n: int, pool_size: int) -> float:
+    dispatcher = notifications.NotificationDispatcher(pool_size=pool_size)
+    start = time.perf_counter()
+    for i in range(n):
+        dispatcher.enqueue(notifications.build_message(f"docente{i}@example.com", "Benchmark", "Cuerpo de prueba"))
+    dispatcher.join()
+    elapsed = time.perf_counter() - start
+    dispatcher.stop()
+    return n / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=notifications.SMTP_POOL_SIZE)
+    args = parser.parse_args()
+
+    controller = Controller(Sink(), hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        before = bench_one_session_per_message(args.messages)
+        after = bench_dispatcher(args.messages, args.pool_size)
+    finally:
+        controller.stop()
+
+    print(f"send_email (1 sesión por mensaje): {before:8.1f} emails/s")
+    print(f"dispatcher (pool={args.pool_size}):            {after:8.1f} emails/s  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compara el arranque de un worker con el pipeline completo (.joblib) contra el
+artefacto compacto (python -m api.export_model), y verifica que ambos den
+las mismas predicciones sobre demo_data.csv.
+
+Cada medición corre en un proceso nuevo (como un worker de gunicorn recién creado).
+
+Uso:
+    python -m benchmarks.startup_time [--repeat 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+from api.loader import COMPACT_MODEL_DIR, JOBLIB_MODEL_PATH, THRESHOLD_PATH, load_models
+
+HEAVY_MODULES = ["pandas", "sklearn", "imblearn", "shap", "scipy"]
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import api.main
+from api.loader import load_models
+models = load_models({model_path!r}, {threshold_path!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(model_path: str, repeat: int) -> dict:
+    code = CHILD_CODE.format(model_path=model_path, threshold_path=THRESHOLD_PATH, heavy=HEAVY_MODULES)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "median_seconds": statistics.median(r["seconds"] for r in runs),
+        "modules": runs[-1]["modules"],
+    }
+
+
+def check_parity():
+    demo = pd.read_csv("demo_data.csv")
+    probs = {}
+    for label, path in [("joblib", JOBLIB_MODEL_PATH), ("compact", COMPACT_MODEL_DIR)]:
+        models = load_models(path, THRESHOLD_PATH)
+        compiler = models["compiler"]
+        features = compiler.compile(compiler.raw_from_frame(demo))
+        probs[label] = models["pipeline"].predict_proba(compiler.to_model_input(features))[:, 1]
+    diff = np.max(np.abs(probs["joblib"] - probs["compact"]))
+    if not np.allclose(probs["joblib"], probs["compact"], rtol=0, atol=1e-9):
+        raise AssertionError(f"Las predicciones difieren (máx. diferencia {diff:.3g})")
+    print(f"Paridad OK en demo_data.csv (máx. diferencia {diff:.3g})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    check_parity()
+    for label, path in [("joblib ", JOBLIB_MODEL_PATH), ("compact", COMPACT_MODEL_DIR)]:
+        result = measure(path, args.repeat)
+        print(f"{label}: {result['median_seconds'] * 1000:8.1f} ms (mediana de {args.repeat})  "
+              f"módulos pesados cargados: {', '.join(result['modules']) or 'ninguno'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Suite reproducible de benchmarks: feature engineering, inferencia (con y sin
+explicaciones TreeSHAP), /analyze_student de punta a punta (cliente ASGI en el mismo proceso) y
+notificaciones contra un servidor SMTP local que descarta los mensajes.
+
+Las cohortes son sintéticas (benchmarks.synthetic, esquema de demo_data.csv)
+y con semilla fija. Los resultados se guardan en JSON; el modo 'compare'
+falla (código de salida 1) si el throughput baja o la latencia sube más del
+umbral respecto de una línea base guardada.
+
+Requiere: pip install httpx aiosmtpd
+
+Uso:
+    python -m benchmarks.suite run [--sizes 1,100,10000,1000000] [--repeat 5] [--out bench_results.json]
+    python -m benchmarks.suite compare bench_results.json baseline.json [--threshold 0.10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+SMTP_HOST, SMTP_PORT = "127.0.0.1", 8026
+
+# La configuración SMTP se lee al importar api.notifications (la importa api.main)
+os.environ.update({
+    "SMTP_SERVER": SMTP_HOST,
+    "SMTP_PORT": str(SMTP_PORT),
+    "SMTP_STARTTLS": "0",
+    "SMTP_REQUIRE_AUTH": "0",
+    "EMAIL_USER": "",
+    "EMAIL_PASS": "",
+    # Sin deduplicación ni caché: cada repetición hace el mismo trabajo
+    "NOTIFY_DEDUP_TTL": "0",
+    "PREDICTION_CACHE_BACKEND": "off",
+})
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from api.features import COLUMN_MAPPING, create_features  # noqa: E402
+from api.loader import MODEL_PATH, THRESHOLD_PATH, load_models  # noqa: E402
+from benchmarks.synthetic import synthetic_cohort  # noqa: E402
+
+DEFAULT_SIZES = [1, 100, 10_000, 1_000_000]
+# Tope de peticiones HTTP por caso (más allá de esto solo se mide más de lo mismo)
+MAX_REQUESTS = 2000
+MAX_EMAILS = 5000
+# Métricas que se comparan contra la línea base: (clave, True si "más alto es mejor")
+COMPARED_METRICS = [("rows_per_second", True), ("p50_ms", False), ("p99_ms", False)]
+
+
+def summarize(rows: int, seconds: list, latencies: list = None) -> dict:
+    """Resumen de un caso: mediana de las repeticiones y, si hay, percentiles por petición."""
+    median = statistics.median(seconds)
+    result = {
+        "rows": rows,
+        "repeat": len(seconds),
+        "seconds_median": median,
+        "rows_per_second": rows / median if median else 0.0,
+    }
+    if latencies:
+        ms = np.array(latencies) * 1000
+        result["p50_ms"] = float(np.percentile(ms, 50))
+        result["p99_ms"] = float(np.percentile(ms, 99))
+    return result
+
+
+def timeit(fn, repeat: int) -> list:
+    fn()  # calentamiento (imports, cachés de LightGBM, etc.)
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+# --- Casos ---
+
+def bench_features(cohort: pd.DataFrame, models: dict, repeat: int) -> dict:
+    compiler = models["compiler"]
+    feature_names = compiler.feature_names
+
+    def original():
+        renamed = create_features(cohort).rename(columns=COLUMN_MAPPING, errors="ignore")
+        return renamed[feature_names]
+
+    def compiled():
+        return compiler.compile(compiler.raw_from_frame(cohort))
+
+    n = len(cohort)
+    return {
+        f"features/create_features/{n}": summarize(n, timeit(original, repeat)),
+        f"features/compiler/{n}": summarize(n, timeit(compiled, repeat)),
+    }
+
+
+def bench_inference(cohort: pd.DataFrame, models: dict, repeat: int) -> dict:
+    compiler = models["compiler"]
+    model_input = compiler.to_model_input(compiler.compile(compiler.raw_from_frame(cohort)))
+    seconds = timeit(lambda: models["pipeline"].predict_proba(model_input), repeat)
+    return {f"inference/predict_proba/{len(cohort)}": summarize(len(cohort), seconds)}
+
+
+def bench_explain(cohort: pd.DataFrame, models: dict, repeat: int) -> dict:
+    """Predicción sola vs. predicción + top-k TreeSHAP (api/explain.py), sobre la misma matriz."""
+    from api.explain import EXPLAIN_MAX_K, EXPLAIN_MAX_ROWS, top_contributions
+
+    compiler = models["compiler"]
+    # Las explicaciones están acotadas por petición: se mide hasta ese tamaño
+    n = min(len(cohort), EXPLAIN_MAX_ROWS)
+    features = compiler.compile(compiler.raw_from_frame(cohort.iloc[:n]))
+
+    def plain():
+        return models["pipeline"].predict_proba(compiler.to_model_input(features))
+
+    def explained():
+        plain()
+        return top_contributions(models, features, EXPLAIN_MAX_K)
+
+    base = summarize(n, timeit(plain, repeat))
+    with_shap = summarize(n, timeit(explained, repeat))
+    with_shap["overhead_vs_plain"] = with_shap["seconds_median"] / base["seconds_median"] if base["seconds_median"] else 0.0
+    return {
+        f"explain/plain/{n}": base,
+        f"explain/treeshap_top{EXPLAIN_MAX_K}/{n}": with_shap,
+    }
+
+
+def cohort_records(cohort: pd.DataFrame) -> list:
+    """Filas como JSON (NaN -> null), igual que las manda el dashboard."""
+    return json.loads(cohort.to_json(orient="records"))
+
+
+async def _bench_api(records: list, size: int, repeat: int, concurrency: int) -> dict:
+    import httpx
+
+    from api.main import app
+
+    n = min(len(records), MAX_REQUESTS)
+    results = {}
+    # ASGITransport no ejecuta el lifespan: lo abrimos a mano para cargar el modelo
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def one_pass(latencies: list):
+                queue = asyncio.Queue()
+                for record in records[:n]:
+                    queue.put_nowait(record)
+
+                async def worker():
+                    while not queue.empty():
+                        record = queue.get_nowait()
+                        start = time.perf_counter()
+                        response = await client.post("/analyze_student", json=record)
+                        latencies.append(time.perf_counter() - start)
+                        response.raise_for_status()
+
+                await asyncio.gather(*(worker() for _ in range(min(concurrency, n))))
+
+            await one_pass([])  # calentamiento
+            seconds, latencies = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await one_pass(latencies)
+                seconds.append(time.perf_counter() - start)
+            results[f"api/analyze_student/{size}"] = summarize(n, seconds, latencies)
+
+            if len(records) > 1:
+                seconds = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = await client.post("/analyze_students", json=records)
+                    response.raise_for_status()
+                    seconds.append(time.perf_counter() - start)
+                results[f"api/analyze_students/{size}"] = summarize(len(records), seconds)
+    return results
+
+
+def bench_api(cohort: pd.DataFrame, repeat: int, concurrency: int) -> dict:
+    from api.main import MAX_BATCH_SIZE
+
+    # El endpoint por lotes rechaza más de MAX_BATCH_SIZE estudiantes
+    records = cohort_records(cohort.iloc[:MAX_BATCH_SIZE])
+    return asyncio.run(_bench_api(records, len(cohort), repeat, concurrency))
+
+
+def bench_notifications(n: int, repeat: int) -> dict:
+    from api import notifications
+
+    n = min(n, MAX_EMAILS)
+    messages = [
+        notifications.build_message(f"docente{i}@example.com", "Benchmark", "Cuerpo de prueba")
+        for i in range(n)
+    ]
+
+    def run():
+        dispatcher = notifications.NotificationDispatcher()
+        for msg in messages:
+            dispatcher.enqueue(msg)
+        dispatcher.join()
+        dispatcher.stop()
+
+    return {f"notifications/dispatcher/{n}": summarize(n, timeit(run, repeat))}
+
+
+# --- Ejecución y comparación ---
+
+def run_suite(sizes: list, repeat: int, concurrency: int, seed: int, skip: set) -> dict:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.handlers import Sink
+
+    models = load_models(MODEL_PATH, THRESHOLD_PATH)
+    results = {}
+    controller = Controller(Sink(), hostname=SMTP_HOST, port=SMTP_PORT)
+    controller.start()
+    try:
+        for n in sizes:
+            cohort = synthetic_cohort(n, seed)
+            print(f"Cohorte de {n} estudiantes...", file=sys.stderr)
+            if "features" not in skip:
+                results.update(bench_features(cohort, models, repeat))
+            if "inference" not in skip:
+                results.update(bench_inference(cohort, models, repeat))
+            if "explain" not in skip:
+                results.update(bench_explain(cohort, models, repeat))
+            if "api" not in skip:
+                results.update(bench_api(cohort, repeat, concurrency))
+            if "notifications" not in skip:
+                results.update(bench_notifications(n, repeat))
+            del cohort
+    finally:
+        controller.stop()
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "model_version": models["version"],
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Devuelve las regresiones: throughput que baja, o latencia que sube, más de
+    'threshold' (fracción) respecto de la línea base. Solo se comparan los casos
+    presentes en ambos archivos.
+    """
+    regressions = []
+    for name, base in baseline["results"].items():
+        now = current["results"].get(name)
+        if now is None:
+            continue
+        for key, higher_is_better in COMPARED_METRICS:
+            if key not in base or key not in now or not base[key]:
+                continue
+            change = (now[key] - base[key]) / base[key]
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append(f"{name} {key}: {base[key]:.4g} -> {now[key]:.4g} ({change:+.1%})")
+    return regressions
+
+
+def print_results(report: dict):
+    for name, r in report["results"].items():
+        line = f"{name:45s} {r['rows_per_second']:14.1f} filas/s  mediana {r['seconds_median'] * 1000:10.2f} ms"
+        if "p99_ms" in r:
+            line += f"  p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms"
+        if "overhead_vs_plain" in r:
+            line += f"  ({r['overhead_vs_plain']:.1f}x la predicción sola)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Ejecuta la suite y guarda los resultados en JSON")
+    run_parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES))
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--concurrency", type=int, default=32)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--skip", default="", help="Grupos a omitir: features,inference,explain,api,notifications")
+    run_parser.add_argument("--out", default="bench_results.json")
+
+    compare_parser = sub.add_parser("compare", help="Compara un resultado contra una línea base")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Regresión tolerada (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        sizes = [int(n) for n in args.sizes.split(",") if n]
+        skip = {s for s in args.skip.split(",") if s}
+        report = run_suite(sizes, args.repeat, args.concurrency, args.seed, skip)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print_results(report)
+        print(f"Resultados guardados en {args.out}")
+        return
+
+    with open(args.current) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold)
+    if regressions:
+        print(f"Regresiones (umbral {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"Sin regresiones respecto de {args.baseline} (umbral {args.threshold:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
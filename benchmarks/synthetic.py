@@ -0,0 +1,51 @@
+"""
+Cohortes sintéticas con el esquema de demo_data.csv, para benchmarks.
+Los valores se muestrean alrededor de las filas de demo_data.csv (con ruido
+y algunos nulos), así que cubren los tres niveles de riesgo.
+"""
+import numpy as np
+import pandas as pd
+
+from api.features import CONTINUOUS_FIELDS, RAW_FIELDS
+
+DEMO_PATH = "demo_data.csv"
+
+
+def synthetic_cohort(n: int, seed: int = 0, null_rate: float = 0.02, offset: int = 0) -> pd.DataFrame:
+    """
+    Devuelve un DataFrame de 'n' estudiantes con las columnas de demo_data.csv.
+    Nombres y emails se numeran desde 'offset' (para armar una cohorte por partes).
+    """
+    rng = np.random.default_rng(seed)
+    demo = pd.read_csv(DEMO_PATH)
+    base = demo.iloc[rng.integers(0, len(demo), n)].reset_index(drop=True)
+
+    ids = np.arange(offset, offset + n)
+    cohort = pd.DataFrame({
+        "Student_Name": [f"Estudiante {i}" for i in ids],
+        "Student_Email": [f"alumno{i}@example.com" for i in ids],
+        # ~30 estudiantes por docente
+        "Teacher_Email": [f"docente{i // 30}@example.com" for i in ids],
+    })
+    for field in RAW_FIELDS:
+        values = base[field].to_numpy(dtype=np.float64)
+        if field in CONTINUOUS_FIELDS:
+            values = values + rng.normal(0, 1.5, n)
+        elif field.endswith(("_approved", "_evaluations", "_enrolled")):
+            values = np.clip(values + rng.integers(-3, 4, n), 0, None)
+        elif field == "Tuition_fees_up_to_date":
+            values = (rng.random(n) > 0.12).astype(np.float64)
+        values[rng.random(n) < null_rate] = np.nan
+        cohort[field] = values
+    return cohort
+
+
+def write_cohort_csv(path: str, n: int, seed: int = 0, chunk: int = 200000) -> str:
+    """
+    Escribe una cohorte grande a CSV por partes (sin tenerla entera en memoria).
+    Cada fila tiene nombre y email únicos (numerados por su posición en la cohorte).
+    """
+    for start in range(0, n, chunk):
+        part = synthetic_cohort(min(chunk, n - start), seed + start, offset=start)
+        part.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    return path
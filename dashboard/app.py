@@ -1,8 +1,20 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import requests
+import hashlib
+import io
 import json
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # sin pyarrow, los lotes se envían como JSON
+    pa = None
 
 # --- Configuración de la Página ---
 st.set_page_config(
@@ -16,7 +28,281 @@ st.title("🤖 Centro de Comando del Agente de IA")
 st.markdown("Carga el reporte de alumnos para que el agente analice el riesgo y tome acciones.")
 
 # URL de nuestra API (Backend) que está corriendo en http://127.0.0.1:8000
-API_URL = "http://127.0.0.1:8000/analyze_student"
+API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:8000")
+API_URL = f"{API_BASE_URL}/analyze_student"
+API_BATCH_URL = f"{API_BASE_URL}/analyze_students"
+API_COLUMNAR_URL = f"{API_BASE_URL}/analyze_students/columnar"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# --- Opciones del cliente HTTP ---
+st.sidebar.header("⚙️ Conexión con la API")
+max_in_flight = st.sidebar.slider("Peticiones simultáneas", min_value=1, max_value=32, value=8)
+use_batch = st.sidebar.checkbox("Usar endpoint por lotes (si la API lo ofrece)", value=True)
+batch_size = st.sidebar.number_input("Estudiantes por lote", min_value=1, max_value=5000, value=200, step=50)
+explain = st.sidebar.checkbox("Explicar cada predicción (SHAP)", value=False,
+                              help="Las features que más pesaron en el riesgo de cada estudiante. Es más lento.")
+explain_top_k = st.sidebar.slider("Factores por estudiante", min_value=1, max_value=10, value=5, disabled=not explain)
+
+
+@st.cache_resource
+def get_http_session(pool_size: int) -> requests.Session:
+    """Sesión HTTP reutilizable (keep-alive) con un pool del tamaño de la concurrencia."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=60)
+def api_paths() -> set:
+    """Endpoints que publica la API en su OpenAPI (vacío si no responde)."""
+    try:
+        response = requests.get(f"{API_BASE_URL}/openapi.json", timeout=5)
+        return set(response.json().get("paths", {})) if response.ok else set()
+    except Exception:
+        return set()
+
+
+def api_supports_batch() -> bool:
+    """Revisa en el OpenAPI de la API si existe el endpoint por lotes."""
+    return "/analyze_students" in api_paths()
+
+
+def api_supports_columnar() -> bool:
+    """Lotes en Arrow IPC: la API debe ofrecer el endpoint y pyarrow estar instalado aquí."""
+    return pa is not None and "/analyze_students/columnar" in api_paths()
+
+
+@st.cache_data(ttl=30)
+def fetch_explain_limits() -> dict:
+    """Límites de las explicaciones según la API (máximo de estudiantes por petición)."""
+    try:
+        response = requests.get(f"{API_BASE_URL}/config", timeout=5)
+        if response.ok and "explain" in response.json():
+            return response.json()["explain"]
+    except Exception:
+        pass
+    return {"top_k": 5, "max_k": 10, "max_rows": 2000}
+
+
+def format_explanation(explanation) -> str:
+    """[{feature, value, contribution}, ...] -> 'Feature (+0.42), ...' (positivo = sube el riesgo)."""
+    if not isinstance(explanation, list):
+        return ""
+    return ", ".join(f"{item['feature']} ({item['contribution']:+.2f})" for item in explanation)
+
+
+def error_result(student: dict, label: str, detail: str) -> dict:
+    """Fila de resultado para un estudiante que no se pudo analizar."""
+    return {
+        "student_name": student.get('Student_Name', 'N/A'),
+        "prediction_label": label,
+        "risk_probability": 0, "diagnostic": detail, "action_taken": "N/A"
+    }
+
+
+def to_arrow_stream(frame: pd.DataFrame) -> bytes:
+    """Bloque del CSV -> stream de Arrow IPC (una columna por columna del CSV)."""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def analyze_chunk_columnar(session: requests.Session, chunk: pd.DataFrame):
+    """
+    Analiza un bloque del CSV con UNA petición en Arrow IPC (sin pasar por
+    JSON) y pide la respuesta también en Arrow; si la API rechaza el bloque con
+    422, se reintenta por estudiante. Devuelve (resultados, errores).
+    """
+    errors = []
+    students = chunk[["Student_Name"]].to_dict("records") if "Student_Name" in chunk else [{}] * len(chunk)
+    try:
+        response = session.post(
+            API_COLUMNAR_URL, data=to_arrow_stream(chunk),
+            headers={"Content-Type": ARROW_STREAM, "Accept": ARROW_STREAM}
+        )
+        if response.status_code == 200:
+            return pa.ipc.open_stream(response.content).read_all().to_pylist(), errors
+        if response.status_code == 422:
+            # Alguna fila es inválida: como en analyze_chunk, se reintenta por estudiante (JSON)
+            return analyze_chunk(session, json.loads(chunk.to_json(orient='records')), batch=False)
+        errors.append(f"Error al analizar un lote de {len(chunk)} estudiantes: {response.text}")
+        return [error_result(s, "Error de Análisis", response.text) for s in students], errors
+    except Exception as e:
+        errors.append(f"Error de conexión con la API al procesar un lote de {len(chunk)} estudiantes: {e}")
+        return [error_result(s, "Error de Conexión", str(e)) for s in students], errors
+
+
+def analyze_chunk(session: requests.Session, chunk: list, batch: bool, params: dict = None):
+    """
+    Analiza un bloque de estudiantes (1 petición por estudiante, o 1 por bloque
+    si 'batch'; si la API rechaza el bloque con 422, se reintenta por
+    estudiante). Devuelve (resultados, errores) — los errores se muestran
+    desde el hilo principal de Streamlit. 'params' va en la query (ej. explain).
+    """
+    results, errors = [], []
+    if batch:
+        try:
+            response = session.post(API_BATCH_URL, json=chunk, params=params)
+            if response.status_code == 200:
+                return response.json(), errors
+            if response.status_code == 422:
+                # Un estudiante inválido rechaza todo el lote: se reintenta uno por uno
+                # para que solo las filas con datos inválidos queden como error
+                return analyze_chunk(session, chunk, batch=False, params=params)
+            errors.append(f"Error al analizar un lote de {len(chunk)} estudiantes: {response.text}")
+            return [error_result(s, "Error de Análisis", response.text) for s in chunk], errors
+        except Exception as e:
+            errors.append(f"Error de conexión con la API al procesar un lote de {len(chunk)} estudiantes: {e}")
+            return [error_result(s, "Error de Conexión", str(e)) for s in chunk], errors
+
+    for student in chunk:
+        try:
+            response = session.post(API_URL, json=student, params=params)
+            if response.status_code == 200:
+                results.append(response.json())
+            else:
+                errors.append(f"Error al analizar a {student.get('Student_Name', 'N/A')}: {response.text}")
+                results.append(error_result(student, "Error de Análisis", response.text))
+        except Exception as e:
+            errors.append(f"Error de conexión con la API al procesar a {student.get('Student_Name', 'N/A')}: {e}")
+            results.append(error_result(student, "Error de Conexión", str(e)))
+    return results, errors
+
+
+TIER_COLORS = {
+    "Alto Riesgo": 'background-color: #ef9a9a',   # Rojo más fuerte
+    "Riesgo Medio": 'background-color: #ffb74d',  # Naranja-Amarillo más fuerte
+}
+RESULT_COLUMNS = [
+    'student_name', 'Nivel de Riesgo', 'risk_probability',
+    'action_taken', 'diagnostic', 'Factores principales'
+]
+
+
+@st.cache_data(show_spinner=False)
+def load_csv(data: bytes) -> pd.DataFrame:
+    """El CSV se lee una sola vez por archivo (no en cada interacción)."""
+    return pd.read_csv(io.BytesIO(data))
+
+
+def build_results_frame(results: list) -> pd.DataFrame:
+    """
+    Respuestas de la API -> tabla de resultados. El nivel es el 'prediction_label'
+    que decidió la API (los niveles se asignan solo allí, en api/rules.py).
+    """
+    results_df = pd.DataFrame(results)
+    results_df = results_df.sort_values(by="risk_probability", ascending=False, ignore_index=True)
+    results_df['Nivel de Riesgo'] = results_df['prediction_label']
+    if 'explanation' in results_df.columns:
+        results_df['Factores principales'] = results_df['explanation'].map(format_explanation)
+    return results_df
+
+
+def style_page(page: pd.DataFrame):
+    """Colores por nivel solo para la página visible (una operación vectorizada, sin callbacks por fila)."""
+    colors = page['Nivel de Riesgo'].map(TIER_COLORS).fillna('').to_numpy()
+    return page.style.apply(
+        lambda frame: pd.DataFrame(
+            np.repeat(colors[:, None], frame.shape[1], axis=1), index=frame.index, columns=frame.columns
+        ),
+        axis=None
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def export_bytes(run_id: str, fmt: str, _results_df: pd.DataFrame) -> bytes:
+    """Archivo de exportación, generado una vez por análisis ('_results_df' no se hashea)."""
+    export = _results_df.drop(columns=['explanation'], errors='ignore')
+    if fmt == "parquet":
+        buffer = io.BytesIO()
+        export.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    return export.to_csv(index=False).encode("utf-8")
+
+
+def render_results(run: dict):
+    """Resultados guardados en session_state: resumen, filtros, grilla paginada, detalle y exportación."""
+    results_df = run["results"]
+    st.header("Paso 3: Revisar Resultados y Diagnósticos")
+
+    counts = results_df['Nivel de Riesgo'].value_counts()
+    total_col, high_col, medium_col, low_col = st.columns(4)
+    total_col.metric("Estudiantes", len(results_df))
+    high_col.metric("🚨 Alto Riesgo", int(counts.get("Alto Riesgo", 0)))
+    medium_col.metric("⚠️ Riesgo Medio", int(counts.get("Riesgo Medio", 0)))
+    low_col.metric("Bajo Riesgo", int(counts.get("Bajo Riesgo", 0)))
+
+    # --- Filtros (máscaras vectorizadas sobre toda la tabla) ---
+    tier_col, name_col, prob_col = st.columns([2, 2, 1])
+    # Además de los tres niveles, las etiquetas de error presentes (ej. "Error de Análisis")
+    risk_tiers = ["Alto Riesgo", "Riesgo Medio", "Bajo Riesgo"]
+    labels = risk_tiers + sorted(set(results_df['Nivel de Riesgo'].dropna().unique()) - set(risk_tiers))
+    tiers = tier_col.multiselect("Nivel de riesgo", labels, default=labels)
+    name_query = name_col.text_input("Buscar por nombre")
+    min_prob = prob_col.number_input("Probabilidad mínima (%)", min_value=0, max_value=100, value=0, step=5)
+
+    mask = results_df['Nivel de Riesgo'].isin(tiers).to_numpy()
+    mask &= results_df['risk_probability'].to_numpy() >= min_prob / 100
+    if name_query:
+        mask &= results_df['student_name'].str.contains(name_query, case=False, regex=False, na=False).to_numpy()
+    filtered = results_df[mask]
+
+    # --- Grilla paginada ---
+    size_col, page_col, info_col = st.columns([1, 1, 2])
+    page_size = size_col.selectbox("Filas por página", [50, 100, 250, 500], index=1)
+    pages = max(1, -(-len(filtered) // page_size))
+    page_number = page_col.number_input("Página", min_value=1, max_value=pages, value=1, step=1)
+    start = (page_number - 1) * page_size
+    page = filtered.iloc[start:start + page_size]
+    info_col.caption(f"{len(filtered)} de {len(results_df)} estudiantes · página {page_number} de {pages}")
+
+    columns = [col for col in RESULT_COLUMNS if col in page.columns]
+    selection = st.dataframe(
+        style_page(page[columns]),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "student_name": st.column_config.TextColumn("Estudiante"),
+            "risk_probability": st.column_config.NumberColumn("Probabilidad", format="percent"),
+            "action_taken": st.column_config.TextColumn("Acción tomada"),
+            "diagnostic": st.column_config.TextColumn("Diagnóstico"),
+        },
+        on_select="rerun",
+        selection_mode="single-row",
+        key="results_grid",
+    )
+
+    # --- Detalle del estudiante seleccionado (solo uno a la vez) ---
+    selected_rows = [i for i in (selection.selection.rows if selection else []) if i < len(page)]
+    if not selected_rows:
+        st.caption("Selecciona una fila para ver el diagnóstico completo del estudiante.")
+    else:
+        row = page.iloc[selected_rows[0]]
+        icon = {"Alto Riesgo": "🚨", "Riesgo Medio": "⚠️"}.get(row['Nivel de Riesgo'], "✅")
+        with st.container(border=True):
+            st.subheader(f"{icon} {row['student_name']} - {row['Nivel de Riesgo']} ({row['risk_probability']:.2%})")
+            st.write(f"**Diagnóstico del Agente:** {row['diagnostic']}")
+            st.write(f"**Acción Tomada:** {row['action_taken']}")
+            if isinstance(row.get('explanation'), list):
+                st.write("**Factores que más pesaron** (positivo = sube el riesgo):")
+                st.dataframe(pd.DataFrame(row['explanation']), hide_index=True)
+
+    # --- Exportación (todos los resultados, no solo el filtro) ---
+    csv_col, parquet_col = st.columns(2)
+    csv_col.download_button(
+        "⬇️ Exportar CSV", export_bytes(run["run_id"], "csv", results_df),
+        file_name="resultados_agente.csv", mime="text/csv"
+    )
+    if pa is not None:
+        parquet_col.download_button(
+            "⬇️ Exportar Parquet", export_bytes(run["run_id"], "parquet", results_df),
+            file_name="resultados_agente.parquet", mime="application/vnd.apache.parquet"
+        )
+
 
 # --- Paso 1: Carga del Archivo ---
 st.header("Paso 1: Cargar Reporte de Alumnos")
@@ -25,116 +311,88 @@ uploaded_file = st.file_uploader("Selecciona un archivo CSV", type="csv")
 if uploaded_file is not None:
     try:
         # Leer el CSV
-        df = pd.read_csv(uploaded_file)
+        file_bytes = uploaded_file.getvalue()
+        df = load_csv(file_bytes)
         st.success(f"Archivo '{uploaded_file.name}' cargado exitosamente.")
         st.dataframe(df.head(), use_container_width=True)
+    except Exception as e:
+        st.error(f"Error al leer el archivo CSV. Asegúrate de que el formato sea correcto. Detalle: {e}")
+        st.stop()
+
+    # Los resultados quedan en session_state: filtrar, paginar o seleccionar
+    # una fila vuelve a ejecutar el script, pero no vuelve a llamar a la API
+    # (el análisis se identifica por el contenido: otro archivo con el mismo nombre y tamaño es otro análisis)
+    file_id = hashlib.sha256(file_bytes).hexdigest()
+    if st.session_state.get("run", {}).get("file_id") != file_id:
+        st.session_state.pop("run", None)
 
-        # --- Paso 2: Botón de Activación ---
-        st.header("Paso 2: Activar el Agente")
-        if st.button("🚨 Iniciar Agente", type="primary"):
-            
+    # --- Paso 2: Botón de Activación ---
+    st.header("Paso 2: Activar el Agente")
+    if st.button("🚨 Iniciar Agente", type="primary"):
+
+        total_students = len(df)
+        st.write(f"Iniciando análisis para {total_students} estudiantes...")
+
+        progress_bar = st.progress(0, text="Analizando...")
+        live_table = st.empty()
+
+        # --- Paso 3: Llamar a la API con varias peticiones en paralelo ---
+        session = get_http_session(max_in_flight)
+        batch_mode = use_batch and api_supports_batch()
+        # El endpoint columnar no devuelve explicaciones
+        columnar_mode = use_batch and not explain and api_supports_columnar()
+        chunk_len = int(batch_size) if batch_mode or columnar_mode else 1
+        params = None
+        if explain:
+            params = {"explain": "true", "top_k": explain_top_k}
+            chunk_len = min(chunk_len, int(fetch_explain_limits()["max_rows"]))
+        if columnar_mode:
+            # Los bloques van como Arrow IPC directo desde el DataFrame
+            chunks = [df.iloc[i:i + chunk_len] for i in range(0, total_students, chunk_len)]
+        else:
             students_data = json.loads(df.to_json(orient='records'))
-            total_students = len(students_data)
-            st.write(f"Iniciando análisis para {total_students} estudiantes...")
-
-            progress_bar = st.progress(0, text="Analizando...")
-            results = []
-            
-            # --- Paso 3: Llamar a la API para CADA estudiante ---
-            for i, student in enumerate(students_data):
-                try:
-                    response = requests.post(API_URL, json=student)
-                    if response.status_code == 200:
-                        results.append(response.json())
-                    else:
-                        st.error(f"Error al analizar a {student.get('Student_Name', 'N/A')}: {response.text}")
-                        results.append({
-                            "student_name": student.get('Student_Name', 'N/A'),
-                            "prediction_label": "Error de Análisis",
-                            "risk_probability": 0, "diagnostic": response.text, "action_taken": "N/A"
-                        })
-                except Exception as e:
-                    st.error(f"Error de conexión con la API al procesar a {student.get('Student_Name', 'N/A')}: {e}")
-                    results.append({
-                        "student_name": student.get('Student_Name', 'N/A'),
-                        "prediction_label": "Error de Conexión",
-                        "risk_probability": 0, "diagnostic": str(e), "action_taken": "N/A"
-                    })
-
-                percent_complete = (i + 1) / total_students
-                progress_bar.progress(percent_complete, text=f"Analizando: {student.get('Student_Name', 'N/A')}")
-                time.sleep(0.01)
-
-            progress_bar.empty()
-            st.success("¡Análisis completado! El agente ha tomado acciones.")
-
-            # --- Paso 4: Mostrar Resultados (CON RIESGO MEDIO) ---
-            st.header("Paso 3: Revisar Resultados y Diagnósticos")
-            
-            results_df = pd.DataFrame(results)
-            results_df = results_df.sort_values(by="risk_probability", ascending=False)
-
-            # --- Lógica de Estilo (con colores fuertes) ---
-            try:
-                with open("models/threshold_95.txt", 'r') as f:
-                    HIGH_RISK_THRESHOLD = float(f.read()) # ~0.865
-            except FileNotFoundError:
-                st.warning("No se encontró 'models/threshold_95.txt'. Usando umbral por defecto (86.5%).")
-                HIGH_RISK_THRESHOLD = 0.865 
-
-            MEDIUM_RISK_THRESHOLD = 0.70 # Tu 70%
-
-            def define_risk_level(prob):
-                if prob >= HIGH_RISK_THRESHOLD:
-                    return "Alto Riesgo"
-                if prob >= MEDIUM_RISK_THRESHOLD:
-                    return "Riesgo Medio"
-                return "Bajo Riesgo"
-
-            # --- INICIO DE LA CORRECCIÓN DE COLOR ---
-            def style_risk_rows(row):
-                prob = row['risk_probability']
-                if prob >= HIGH_RISK_THRESHOLD:
-                    # Rojo más fuerte
-                    return ['background-color: #ef9a9a'] * len(row) 
-                if prob >= MEDIUM_RISK_THRESHOLD:
-                    # Naranja/Amarillo más fuerte
-                    return ['background-color: #ffb74d'] * len(row) 
-                return [''] * len(row)
-            # --- FIN DE LA CORRECCIÓN DE COLOR ---
-
-            results_df['Nivel de Riesgo'] = results_df['risk_probability'].apply(define_risk_level)
-            
-            columns_order = [
-                'student_name', 'Nivel de Riesgo', 'risk_probability', 
-                'action_taken', 'diagnostic'
-            ]
-            final_columns = [col for col in columns_order if col in results_df.columns]
-            results_df_display = results_df[final_columns]
-
-            # Objeto de estilo
-            styled_df = results_df_display.style.apply(style_risk_rows, axis=1)\
-                                              .format({"risk_probability": "{:.2%}"})
-
-            # Usamos st.table() que SÍ respeta los estilos de fondo.
-            st.table(styled_df)
-
-            # --- Extra: Expanders para diagnósticos ---
-            st.subheader("Diagnósticos de Alumnos en Riesgo:")
-            
-            at_risk_students = results_df[
-                (results_df["Nivel de Riesgo"] == "Alto Riesgo") |
-                (results_df["Nivel de Riesgo"] == "Riesgo Medio")
-            ]
-            
-            if at_risk_students.empty:
-                st.info("No se encontraron estudiantes con riesgo Alto o Medio en este reporte.")
-            else:
-                for _, row in at_risk_students.iterrows():
-                    icon = "🚨" if row['Nivel de Riesgo'] == "Alto Riesgo" else "⚠️"
-                    with st.expander(f"{icon} **{row['student_name']}** - {row['Nivel de Riesgo']} ({row['risk_probability']:.2%})"):
-                        st.write(f"**Diagnóstico del Agente:** {row['diagnostic']}")
-                        st.write(f"**Acción Tomada:** {row['action_taken']}")
+            chunks = [students_data[i:i + chunk_len] for i in range(0, total_students, chunk_len)]
 
-    except Exception as e:
-        st.error(f"Error al leer el archivo CSV. Asegúrate de que el formato sea correcto. Detalle: {e}")
\ No newline at end of file
+        # Los resultados se guardan por posición para conservar el orden del CSV
+        chunk_results = [None] * len(chunks)
+        done_students = 0
+        last_render = 0.0
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = {
+                (executor.submit(analyze_chunk_columnar, session, chunk) if columnar_mode
+                 else executor.submit(analyze_chunk, session, chunk, batch_mode, params)): i
+                for i, chunk in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                chunk_results[i], errors = future.result()
+                for message in errors:
+                    st.error(message)
+
+                done_students += len(chunks[i])
+                progress_bar.progress(
+                    done_students / total_students,
+                    text=f"Analizando: {done_students}/{total_students} estudiantes"
+                )
+                # Refrescamos la tabla parcial como máximo 2 veces por segundo
+                if time.monotonic() - last_render > 0.5 or done_students == total_students:
+                    partial = [r for chunk in chunk_results if chunk for r in chunk]
+                    live_table.dataframe(pd.DataFrame(partial), use_container_width=True)
+                    last_render = time.monotonic()
+
+        results = [r for chunk in chunk_results for r in chunk]
+
+        live_table.empty()
+        progress_bar.empty()
+        st.success("¡Análisis completado! El agente ha tomado acciones.")
+
+        st.session_state["run"] = {
+            "file_id": file_id,
+            "run_id": f"{file_id}:{time.time()}",
+            "results": build_results_frame(results),
+        }
+
+    # --- Paso 4: Mostrar Resultados (CON RIESGO MEDIO) ---
+    if "run" in st.session_state:
+        render_results(st.session_state["run"])